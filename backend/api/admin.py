@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import User, Student, Teacher, Subject, StudentSubject, Payment, Attendance, Note, Video, Quiz, QuizAttempt, ExamResult, OTP
+from .models import Branch, User, Student, Teacher, Subject, StudentSubject, Payment, Attendance, Note, Video, Quiz, QuizAttempt, ExamResult, OTP, QuizStatistics, ReportCardJob, NoteBlob, NoteUpload, BillingRollover, FeeReminderCampaign, FeeReminderRecipient
 
+admin.site.register(Branch)
 admin.site.register(User)
 admin.site.register(Student)
 admin.site.register(Teacher)
@@ -14,3 +15,10 @@ admin.site.register(Quiz)
 admin.site.register(QuizAttempt)
 admin.site.register(ExamResult)
 admin.site.register(OTP)
+admin.site.register(QuizStatistics)
+admin.site.register(ReportCardJob)
+admin.site.register(NoteBlob)
+admin.site.register(NoteUpload)
+admin.site.register(BillingRollover)
+admin.site.register(FeeReminderCampaign)
+admin.site.register(FeeReminderRecipient)
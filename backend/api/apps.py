@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from django.conf import settings
+        if settings.METRICS_ENABLED:
+            from django.db.backends.signals import connection_created
+            from .metrics import install_query_recorder, instrument_serializers
+            connection_created.connect(install_query_recorder)
+            instrument_serializers()
@@ -0,0 +1,150 @@
+import gzip
+import json
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import DateTimeField
+from django.utils import timezone
+from .branches import current_database
+from .models import OTP, Attendance, QuizAttempt
+
+
+class ArchiveJSONEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts times to milliseconds; archived rows must read back unchanged
+    def default(self, o):
+        if isinstance(o, (datetime, time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class ArchiveService:
+    """Moves cold rows out of hot tables into gzipped JSON Lines files, one directory per year.
+    
+    Segments live in default_storage under ARCHIVE_ROOT/<database>/<table>/<year>/ and are
+    named by the id range they hold. Rows are deleted only after their segment is written; a
+    run interrupted in between rewrites the same rows, and readers drop the repeated ids.
+    """
+    POLICIES = {
+        'attendance': (Attendance, 'date'),
+        'otp': (OTP, 'created_at'),
+        'quizattempt': (QuizAttempt, 'attempted_at'),
+    }
+    
+    @staticmethod
+    def cutoff(name, today=None):
+        model, field = ArchiveService.POLICIES[name]
+        retention = timedelta(days=settings.ARCHIVE_RETENTION_DAYS[name])
+        if isinstance(model._meta.get_field(field), DateTimeField):
+            return (today or timezone.now()) - retention
+        return (today or date.today()) - retention
+    
+    @staticmethod
+    def may_hold(name, since):
+        """Whether archives can hold rows from ``since`` on; cutoffs only move forward."""
+        return since is None or since < ArchiveService.cutoff(name)
+    
+    @staticmethod
+    def _directory(name):
+        return f"{settings.ARCHIVE_ROOT}/{current_database()}/{name}"
+    
+    @staticmethod
+    def _year(value):
+        return (timezone.localtime(value) if isinstance(value, datetime) else value).year
+    
+    @staticmethod
+    def _write_segment(name, year, rows):
+        path = f"{ArchiveService._directory(name)}/{year}/{rows[0]['id']:012d}-{rows[-1]['id']:012d}.jsonl.gz"
+        body = ''.join(json.dumps(row, cls=ArchiveJSONEncoder) + '\n' for row in rows).encode()
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(gzip.compress(body, compresslevel=6)))
+    
+    @staticmethod
+    def archive(name, batch_size=None, today=None):
+        model, field = ArchiveService.POLICIES[name]
+        lock = f"archive:{name}:lock"
+        if not cache.add(lock, 1, settings.ARCHIVE_LOCK_TIMEOUT):
+            return None
+        cutoff = ArchiveService.cutoff(name, today)
+        fields = [model_field.attname for model_field in model._meta.concrete_fields]
+        archived = {'rows': 0, 'segments': 0, 'cutoff': cutoff}
+        try:
+            while True:
+                rows = list(
+                    model.objects.filter(**{f'{field}__lt': cutoff}).order_by('pk')
+                    .values(*fields)[:batch_size or settings.ARCHIVE_BATCH_SIZE]
+                )
+                if not rows:
+                    break
+                years = {}
+                for row in rows:
+                    years.setdefault(ArchiveService._year(row[field]), []).append(row)
+                for year, year_rows in years.items():
+                    ArchiveService._write_segment(name, year, year_rows)
+                with transaction.atomic(using=current_database()):
+                    model.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+                archived['rows'] += len(rows)
+                archived['segments'] += len(years)
+        finally:
+            cache.delete(lock)
+        return archived
+    
+    @staticmethod
+    def _matches(row, filters):
+        for lookup, expected in filters.items():
+            field, _, operator = lookup.partition('__')
+            if operator == 'in':
+                if row[field] not in expected:
+                    return False
+            elif row[field] != expected:
+                return False
+        return True
+    
+    @staticmethod
+    def archived(name, start=None, end=None, **filters):
+        """Archived rows of ``name`` with start <= time field <= end, as typed dicts.
+        
+        ``filters`` take ``field=value`` and ``field__in=values`` on the row's column names.
+        Only the year directories overlapping the range are read.
+        """
+        model, field = ArchiveService.POLICIES[name]
+        directory = ArchiveService._directory(name)
+        try:
+            years, _ = default_storage.listdir(directory)
+        except FileNotFoundError:
+            return
+        converters = {model_field.attname: model_field.to_python for model_field in model._meta.concrete_fields}
+        filters = {lookup: set(value) if lookup.endswith('__in') else value for lookup, value in filters.items()}
+        seen = set()
+        for year in sorted(years, key=int):
+            if (start is not None and int(year) < ArchiveService._year(start)) or \
+                    (end is not None and int(year) > ArchiveService._year(end)):
+                continue
+            for segment in sorted(default_storage.listdir(f"{directory}/{year}")[1]):
+                with default_storage.open(f"{directory}/{year}/{segment}") as archive:
+                    lines = gzip.decompress(archive.read()).splitlines()
+                for line in lines:
+                    row = {column: converters[column](value) for column, value in json.loads(line).items()}
+                    if row['id'] in seen or (start is not None and row[field] < start) or \
+                            (end is not None and row[field] > end) or not ArchiveService._matches(row, filters):
+                        continue
+                    seen.add(row['id'])
+                    yield row
+    
+    @staticmethod
+    def history(name, start=None, end=None, **filters):
+        """Rows from the hot table and, where the range reaches past the cutoff, from the archives."""
+        model, field = ArchiveService.POLICIES[name]
+        live = model.objects.filter(**filters)
+        if start is not None:
+            live = live.filter(**{f'{field}__gte': start})
+        if end is not None:
+            live = live.filter(**{f'{field}__lte': end})
+        rows = list(live.values(*[model_field.attname for model_field in model._meta.concrete_fields]))
+        if ArchiveService.may_hold(name, start):
+            rows.extend(ArchiveService.archived(name, start, end, **filters))
+        return rows
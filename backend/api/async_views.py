@@ -0,0 +1,169 @@
+import json
+from asgiref.sync import sync_to_async
+from datetime import date
+from functools import wraps
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from .authentication import ClaimsJWTAuthentication
+from .branches import activate, branch_for_register_number, current_branch, get_branch
+from .models import Student, Teacher, StudentSubject
+from .replica import replica_reads
+from .serializers import PaymentSerializer, SubjectSerializer, StudentSubjectSerializer
+from .services import AsyncSMSService, AttendanceService, BillingService, BranchService, OTPService, PaymentService, ReferenceDataCache
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return request.POST
+    return data if isinstance(data, dict) else {}
+
+
+def _branch_students():
+    branch = current_branch()
+    return Student.objects.filter(branch_id=branch['id']) if branch else Student.objects.all()
+
+
+def async_api_view(methods, roles=None):
+    """Async counterpart of @api_view/@permission_classes for plain Django async views.
+    
+    DRF 3.14 cannot run coroutine views, so these authenticate with the same JWT
+    backend and answer with the same status codes and error bodies.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            
+            if roles is not None:
+                try:
+                    result = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+                except APIException as e:
+                    return JsonResponse({'detail': e.detail}, status=e.status_code)
+                if result is None:
+                    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+                request.user, request.auth = result
+                if request.user.role not in roles:
+                    return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+            
+            return await view(request, *args, **kwargs)
+        
+        # Django 4.2's csrf_exempt wraps views in a sync function, so set the flag directly.
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+@async_api_view(['POST'])
+async def student_request_otp(request):
+    data = _json_body(request)
+    register_number = data.get('register_number')
+    phone = data.get('phone')
+    activate(branch_for_register_number(register_number) or get_branch(data.get('branch')))
+    
+    if not await Student.objects.filter(register_number=register_number, parent_phone=phone).aexists():
+        return JsonResponse({'error': 'Student not found with provided credentials'}, status=404)
+    
+    otp_code = await sync_to_async(OTPService.issue_otp)(register_number, phone)
+    if otp_code is None:
+        return JsonResponse({'error': 'Too many OTP requests. Please wait 10 minutes.'}, status=429)
+    
+    await AsyncSMSService.send_sms(phone, OTPService.otp_message(otp_code))
+    return JsonResponse({'message': 'OTP sent successfully to your phone'})
+
+
+@async_api_view(['POST'], roles=['owner'])
+async def mark_attendance(request, pk):
+    try:
+        student = await _branch_students().select_related('user').aget(pk=pk)
+    except Student.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    
+    attendance, created = await sync_to_async(AttendanceService.mark)(student, request.user)
+    
+    if created:
+        await AsyncSMSService.send_attendance_sms(student)
+        return JsonResponse({'message': 'Attendance marked successfully and SMS sent'})
+    return JsonResponse({'message': 'Attendance already marked for today'})
+
+
+@async_api_view(['POST'], roles=['owner'])
+async def mark_payment(request, pk):
+    try:
+        student = await _branch_students().select_related('user').aget(pk=pk)
+    except Student.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    
+    subject = await sync_to_async(ReferenceDataCache.subject)(_json_body(request).get('subject_id'))
+    if subject is None or subject.branch_id != student.branch_id:
+        return JsonResponse({'error': 'Subject not found'}, status=404)
+    
+    today = date.today()
+    result = await sync_to_async(PaymentService.record_payment)(student, subject, today.month, today.year)
+    if result['status'] == 'duplicate':
+        return JsonResponse({'message': result['message']}, status=400)
+    
+    await AsyncSMSService.send_payment_sms(student, subject, subject.fee)
+    payment = await sync_to_async(lambda: PaymentSerializer(result['payment']).data)()
+    return JsonResponse({
+        'message': 'Payment marked successfully and SMS sent',
+        'payment': payment
+    })
+
+
+@async_api_view(['GET'], roles=['owner'])
+@replica_reads
+async def owner_dashboard_stats(request):
+    return JsonResponse(await sync_to_async(BranchService.dashboard_stats)(current_branch()))
+
+
+@async_api_view(['GET'], roles=['teacher'])
+@replica_reads
+async def teacher_dashboard_stats(request):
+    try:
+        teacher = await sync_to_async(lambda: request.user.teacher_profile)()
+    except Teacher.DoesNotExist:
+        return JsonResponse({'error': 'Teacher profile not found'}, status=404)
+    
+    today = date.today()
+    my_subjects = await sync_to_async(ReferenceDataCache.subjects_for_teacher)(teacher.id)
+    enrolled_students = await StudentSubject.objects.filter(
+        subject_id__in=[subject.id for subject in my_subjects]
+    ).acount()
+    
+    my_income_data = await sync_to_async(PaymentService.calculate_income_split)(
+        today.month, today.year, await sync_to_async(ReferenceDataCache.teacher_branch_id)(teacher.id)
+    )
+    teacher_breakdown = my_income_data.get('teacher_breakdown', {}).get(teacher.id, {})
+    subjects = await sync_to_async(lambda: SubjectSerializer(my_subjects, many=True).data)()
+    
+    return JsonResponse({
+        'subjects_teaching': len(my_subjects),
+        'enrolled_students': enrolled_students,
+        'monthly_income': teacher_breakdown.get('teacher_share', 0),
+        'subjects': subjects
+    })
+
+
+@async_api_view(['GET'], roles=['student'])
+async def student_dashboard_stats(request):
+    try:
+        student = await sync_to_async(lambda: request.user.student_profile)()
+    except Student.DoesNotExist:
+        return JsonResponse({'error': 'Student profile not found'}, status=404)
+    
+    enrolled_subjects = [
+        es async for es in StudentSubject.objects.filter(student=student).select_related('subject', 'student__user')
+    ]
+    paid_subject_ids = await sync_to_async(lambda: set(BillingService.paid_subject_ids(student)))()
+    paid_subjects_count = sum(1 for es in enrolled_subjects if es.subject_id in paid_subject_ids)
+    subjects = await sync_to_async(lambda: StudentSubjectSerializer(enrolled_subjects, many=True).data)()
+    
+    return JsonResponse({
+        'total_subjects': len(enrolled_subjects),
+        'paid_subjects': paid_subjects_count,
+        'unpaid_subjects': len(enrolled_subjects) - paid_subjects_count,
+        'subjects': subjects
+    })
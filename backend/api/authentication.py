@@ -0,0 +1,136 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import Error, Tags, register
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .branches import BRANCH_HEADER, activate, current_database, get_branch
+from .models import User, Student, Teacher
+
+PROFILE_MODELS = {
+    'teacher': (Teacher, 'teacher_profile'),
+    'student': (Student, 'student_profile'),
+}
+
+
+def _revocation_key(user_id):
+    return f"auth:revoked:{user_id}"
+
+
+def revoke_user_tokens(user_id):
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    cache.set(_revocation_key(user_id), time.time(), int(lifetime.total_seconds()))
+
+
+def check_not_revoked(token):
+    # ``iat`` only has whole seconds; ``issued_at`` tells a token issued right after a password
+    # save (a login that rehashed the password) from one issued before it in the same second
+    revoked_at = cache.get(_revocation_key(token[api_settings.USER_ID_CLAIM]))
+    if revoked_at is not None and token.get('issued_at', token.get('iat', 0)) <= revoked_at:
+        raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+
+
+@register(Tags.security, deploy=True)
+def check_revocation_cache(app_configs, **kwargs):
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.JWT_CLAIMS_AUTH and backend.endswith(('LocMemCache', 'DummyCache')):
+        return [Error(
+            'JWT_CLAIMS_AUTH needs a cache shared by every process: token revocations are only '
+            'seen by the process that recorded them',
+            hint='Set REDIS_URL, or JWT_CLAIMS_AUTH=false to read the user row on every request.',
+            id='api.E001',
+        )]
+    return []
+
+
+def tokens_for_user(user):
+    refresh = RefreshToken.for_user(user)
+    refresh['issued_at'] = time.time()
+    refresh['role'] = user.role
+    refresh['username'] = user.username
+    branch = get_branch(branch_id=user.branch_id) if user.branch_id else None
+    refresh['branch'] = branch['code'] if branch else None
+    profile = PROFILE_MODELS.get(user.role)
+    if profile:
+        refresh['profile_id'] = profile[0].objects.filter(user_id=user.id).values_list('id', flat=True).first()
+    return refresh
+
+
+def _partial_instance(model, values):
+    # Only the given fields are populated; anything else is a deferred field and is
+    # loaded from the database on first access, so unexpected reads stay correct.
+    field_names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(current_database(), field_names, [values[name] for name in field_names])
+
+
+def user_from_claims(token):
+    user = _partial_instance(User, {
+        'id': token[api_settings.USER_ID_CLAIM],
+        'username': token.get('username', ''),
+        'role': token['role'],
+        'branch_id': (get_branch(token['branch']) or {}).get('id') if token.get('branch') else None,
+        'is_active': True,
+    })
+    
+    profile = PROFILE_MODELS.get(token['role'])
+    if profile:
+        model, accessor = profile
+        instance = None
+        if token.get('profile_id') is not None:
+            instance = _partial_instance(model, {'id': token['profile_id'], 'user_id': user.id})
+            model.user.field.set_cached_value(instance, user)
+        getattr(User, accessor).related.set_cached_value(user, instance)
+    return user
+
+
+def _activate_token_branch(token):
+    if not token.get('branch'):
+        return
+    branch = get_branch(token['branch'])
+    if branch is None:
+        raise AuthenticationFailed('Token branch no longer exists', code='unknown_branch')
+    activate(branch)
+
+
+def _activate_selected_branch(request, user, token):
+    """Organisation owners pick the branch to act on with the X-Branch header."""
+    code = request.META.get(BRANCH_HEADER)
+    if not code or user.role != 'owner' or token.get('branch'):
+        return user
+    branch = get_branch(code)
+    if branch is None:
+        raise NotFound(f'Unknown branch {code!r}')
+    activate(branch)
+    if branch['database'] == 'default':
+        return user
+    # Owners are mirrored into dedicated branch databases by username (sync_branch_databases)
+    local = User.objects.filter(username=user.username, role='owner', branch__isnull=True, is_active=True).first()
+    if local is None:
+        raise AuthenticationFailed('Owner account is not available in this branch database', code='owner_not_synced')
+    return local
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+        user, token = result
+        return _activate_selected_branch(request, user, token), token
+    
+    def get_user(self, validated_token):
+        # Before the revocation check and user lookup, which are per branch database
+        _activate_token_branch(validated_token)
+        check_not_revoked(validated_token)
+        if settings.JWT_CLAIMS_AUTH and 'role' in validated_token:
+            return user_from_claims(validated_token)
+        return super().get_user(validated_token)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        check_not_revoked(self.token_class(attrs['refresh']))
+        return super().validate(attrs)
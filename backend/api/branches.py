@@ -0,0 +1,186 @@
+import contextvars
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache.backends.base import default_key_func
+from rest_framework.exceptions import ValidationError
+
+BRANCH_HEADER = 'HTTP_X_BRANCH'
+REGISTER_NUMBER_SEPARATOR = '-'
+
+_branch = ContextVar('branch', default=None)
+_database = ContextVar('branch_database', default='default')
+
+_registry = {'by_code': {}, 'by_id': {}, 'loaded_at': None}
+_registry_lock = threading.Lock()
+
+
+def _load_registry():
+    from .models import Branch
+    
+    rows = list(Branch.objects.using('default').order_by('id').values('id', 'code', 'name', 'database'))
+    for row in rows:
+        row['database'] = row['database'] or 'default'
+    return {
+        'by_code': {row['code']: row for row in rows},
+        'by_id': {row['id']: row for row in rows},
+        'loaded_at': time.monotonic(),
+    }
+
+
+def registry():
+    """Branches by code, read from the default database and kept per process for BRANCH_REGISTRY_TTL."""
+    global _registry
+    loaded_at = _registry['loaded_at']
+    if loaded_at is None or time.monotonic() - loaded_at >= settings.BRANCH_REGISTRY_TTL:
+        with _registry_lock:
+            _registry = _load_registry()
+    return _registry['by_code']
+
+
+def clear_registry():
+    global _registry
+    with _registry_lock:
+        _registry = {'by_code': {}, 'by_id': {}, 'loaded_at': None}
+
+
+def get_branch(code=None, branch_id=None):
+    registry()
+    if branch_id is not None:
+        return _registry['by_id'].get(branch_id)
+    return _registry['by_code'].get(str(code or '').upper())
+
+
+def default_branch():
+    """The active branch, or the only branch stored in the current database."""
+    branch = _branch.get()
+    if branch is None:
+        branches = [entry for entry in registry().values() if entry['database'] == _database.get()]
+        if len(branches) == 1:
+            return branches[0]
+    return branch
+
+
+def new_row_branch_id():
+    """Branch id for students, teachers and subjects created now.
+    
+    Organisation owners must pick a branch when the current database holds several.
+    """
+    branch = default_branch()
+    if branch is None and registry():
+        raise ValidationError({'branch': 'Select a branch with the X-Branch header'})
+    return branch['id'] if branch else None
+
+
+def branch_for_register_number(register_number):
+    prefix, separator, _ = str(register_number or '').partition(REGISTER_NUMBER_SEPARATOR)
+    return get_branch(prefix) if separator else None
+
+
+def database_aliases():
+    """Every database that holds branch data: default plus the dedicated branch databases."""
+    return ['default', *settings.BRANCH_DATABASES]
+
+
+def current_branch():
+    return _branch.get()
+
+
+def current_database():
+    return _database.get()
+
+
+def activate(branch):
+    """Scope the rest of the current request (or context) to ``branch``; BranchMiddleware resets it."""
+    _branch.set(branch)
+    _database.set(branch['database'] if branch else 'default')
+
+
+@contextmanager
+def use_branch(branch):
+    branch_token = _branch.set(branch)
+    database_token = _database.set(branch['database'] if branch else 'default')
+    try:
+        yield branch
+    finally:
+        _database.reset(database_token)
+        _branch.reset(branch_token)
+
+
+@contextmanager
+def use_database(alias):
+    """Route queries to ``alias`` without narrowing to a branch, for jobs that cover a whole database."""
+    branch_token = _branch.set(None)
+    database_token = _database.set(alias)
+    try:
+        yield alias
+    finally:
+        _database.reset(database_token)
+        _branch.reset(branch_token)
+
+
+def bind_to_current_branch(func):
+    """Wrap ``func`` so a worker thread runs it against the caller's branch and database.
+    
+    Threads start with an empty context, so without this a job queued from a branch request
+    would read and write the default database.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def make_cache_key(key, key_prefix, version):
+    # Ids are only unique per database, so keys written while routed to a branch database get
+    # their own namespace. Default-database keys are unchanged.
+    alias = _database.get()
+    full_key = default_key_func(key, key_prefix, version)
+    return full_key if alias == 'default' else f"{alias}:{full_key}"
+
+
+class BranchRouter:
+    def _alias(self, model):
+        if model._meta.model_name == 'branch':
+            return 'default'
+        alias = _database.get()
+        return alias if alias != 'default' else None
+    
+    def db_for_read(self, model, **hints):
+        return self._alias(model)
+    
+    def db_for_write(self, model, **hints):
+        return self._alias(model)
+
+
+class BranchMiddleware:
+    """Start every request unscoped; authentication activates the caller's branch."""
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with use_branch(None):
+            return self.get_response(request)
+    
+    async def __acall__(self, request):
+        with use_branch(None):
+            return await self.get_response(request)
+
+
+class BranchFilterBackend:
+    """Narrow a viewset's queryset to the active branch through its ``branch_field`` lookup."""
+    
+    def filter_queryset(self, request, queryset, view):
+        branch = _branch.get()
+        branch_field = getattr(view, 'branch_field', None)
+        if branch is None or branch_field is None:
+            return queryset
+        return queryset.filter(**{branch_field: branch['id']})
@@ -0,0 +1,105 @@
+import mimetypes
+import posixpath
+import re
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from django.views.static import serve
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def _parse_range(header, size):
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == '':
+        if end == '' or int(end) == 0:
+            return 'unsatisfiable' if end else None
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size:
+        return 'unsatisfiable'
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and since >= last_modified
+
+
+def _iter_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+def serve_protected_file(request, field_file, filename, etag, last_modified):
+    last_modified = int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+    
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accel_header = settings.PROTECTED_MEDIA_ACCEL_HEADER
+    
+    if accel_header:
+        # The front web server streams the file (and handles ranges) from an internal location.
+        response = HttpResponse(content_type=content_type)
+        response[accel_header] = f"{settings.PROTECTED_MEDIA_ACCEL_PREFIX}{field_file.name}"
+    else:
+        size = field_file.size
+        byte_range = None
+        if request.META.get('HTTP_RANGE') and _if_range_matches(request, etag, last_modified):
+            byte_range = _parse_range(request.META['HTTP_RANGE'], size)
+        
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _iter_range(field_file.open('rb'), start, end - start + 1),
+                status=206,
+                content_type=content_type
+            )
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(field_file.open('rb'), content_type=content_type)
+            response['Content-Length'] = str(size)
+        response['Accept-Ranges'] = 'bytes'
+    
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    response['Content-Disposition'] = content_disposition_header(False, filename)
+    return response
+
+
+def serve_public_media(request, path, document_root=None, show_indexes=False):
+    """The DEBUG /media/ route, minus files that are only served through entitlement-checked actions."""
+    normalized = posixpath.normpath(path).lstrip('/')
+    if normalized.startswith((*settings.PROTECTED_MEDIA_PREFIXES, f"{settings.ARCHIVE_ROOT}/")):
+        raise Http404('Not found')
+    return serve(request, path, document_root=document_root, show_indexes=show_indexes)
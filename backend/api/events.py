@@ -0,0 +1,124 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .branches import current_database
+from .models import DailyActivity, DomainEvent, EventCheckpoint
+
+
+class EventConsumer:
+    """Derived data kept up to date from the DomainEvent log.
+    
+    Subclasses set ``name`` (the checkpoint key) and ``kinds`` (None for every kind) and implement
+    ``handle``. Each batch is applied in the transaction that advances the checkpoint, so derived
+    rows and checkpoint never disagree. ``reset`` clears the derived data before a replay.
+    """
+    name = None
+    kinds = None
+    batch_size = None
+    
+    def handle(self, events):
+        raise NotImplementedError
+    
+    def reset(self):
+        pass
+
+
+class DailyActivityConsumer(EventConsumer):
+    name = 'daily_activity'
+    kinds = {'payment_recorded', 'attendance_marked', 'exam_result_saved'}
+    
+    def handle(self, events):
+        totals = defaultdict(lambda: {'payments': 0, 'income': Decimal('0'), 'attendance': 0, 'exam_results': 0})
+        for event in events:
+            row = totals[(timezone.localdate(event.occurred_at), event.branch_id)]
+            if event.kind == 'payment_recorded':
+                row['payments'] += 1
+                row['income'] += Decimal(event.payload['amount'])
+            elif event.kind == 'attendance_marked':
+                row['attendance'] += 1
+            else:
+                row['exam_results'] += 1
+        
+        for (day, branch_id), row in totals.items():
+            activity, _ = DailyActivity.objects.get_or_create(date=day, branch_id=branch_id)
+            DailyActivity.objects.filter(pk=activity.pk).update(**{field: F(field) + value for field, value in row.items()})
+    
+    def reset(self):
+        DailyActivity.objects.all().delete()
+
+
+def consumers(names=None):
+    registered = [import_string(path)() for path in settings.EVENT_CONSUMERS]
+    if names:
+        unknown = set(names) - {consumer.name for consumer in registered}
+        if unknown:
+            raise ValueError(f"Unknown event consumers: {', '.join(sorted(unknown))}")
+        registered = [consumer for consumer in registered if consumer.name in names]
+    return registered
+
+
+def read_events(after, limit):
+    """Up to ``limit`` events past offset ``after``, stopping at a gap that may still fill.
+    
+    Offsets are allocated before commit, so on PostgreSQL a transaction holding a lower offset
+    can commit after a higher one is visible. A gap is skipped only once the event after it is
+    older than EVENT_LOG_GAP_GRACE_SECONDS; by then the missing offset was rolled back (or archived).
+    """
+    events = list(DomainEvent.objects.filter(id__gt=after).order_by('id')[:limit])
+    settled_before = timezone.now() - timedelta(seconds=settings.EVENT_LOG_GAP_GRACE_SECONDS)
+    expected = after + 1
+    for index, event in enumerate(events):
+        if event.id != expected and event.occurred_at > settled_before:
+            return events[:index]
+        expected = event.id + 1
+    return events
+
+
+def settled_offset():
+    """Highest offset that no still-open transaction can land below, for snapshot change tokens."""
+    settled_before = timezone.now() - timedelta(seconds=settings.EVENT_LOG_GAP_GRACE_SECONDS)
+    return DomainEvent.objects.filter(occurred_at__lte=settled_before).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def process_batch(consumer):
+    """Apply the next batch of events to ``consumer``; returns how many offsets it advanced over."""
+    with transaction.atomic(using=current_database()):
+        checkpoint, _ = EventCheckpoint.objects.select_for_update().get_or_create(consumer=consumer.name)
+        events = read_events(checkpoint.position, consumer.batch_size or settings.EVENT_BATCH_SIZE)
+        if not events:
+            return 0
+        relevant = [event for event in events if consumer.kinds is None or event.kind in consumer.kinds]
+        if relevant:
+            consumer.handle(relevant)
+        checkpoint.position = events[-1].id
+        checkpoint.save(update_fields=['position', 'updated_at'])
+    return len(events)
+
+
+def catch_up(consumer, max_batches=None):
+    processed = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = process_batch(consumer)
+        if not count:
+            break
+        processed += count
+        batches += 1
+    return processed
+
+
+def replay(consumer):
+    """Clear ``consumer``'s derived data and rebuild it from the start of the log."""
+    with transaction.atomic(using=current_database()):
+        EventCheckpoint.objects.update_or_create(consumer=consumer.name, defaults={'position': 0})
+        consumer.reset()
+    return catch_up(consumer)
+
+
+def lag(consumer):
+    position = EventCheckpoint.objects.filter(consumer=consumer.name).values_list('position', flat=True).first() or 0
+    return DomainEvent.objects.filter(id__gt=position).count()
@@ -0,0 +1,210 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .branches import current_database, database_aliases, use_database
+from .models import FeeReminderCampaign, FeeReminderRecipient
+from .services import BillingService, ReferenceDataCache, SMSService
+
+
+class SendRateLimiter:
+    """Spaces calls evenly at `rate` per second across all threads that share the instance."""
+    
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class FeeReminderService:
+    ACTIVE_STATUSES = ('pending', 'running', 'paused')
+    
+    @staticmethod
+    def build_recipients(campaign):
+        catalog = ReferenceDataCache.catalog()
+        rows = (
+            BillingService.unpaid_enrollments(campaign.month, campaign.year, campaign.branch_id)
+            .order_by('student__parent_phone', 'student_id', 'subject_id')
+            .values_list('student__parent_phone', 'student_id', 'student__user__first_name',
+                         'student__user__last_name', 'subject_id')
+        )
+        
+        families = {}
+        for phone, student_id, first_name, last_name, subject_id in rows.iterator(chunk_size=5000):
+            subject = catalog.get(subject_id)
+            if not phone or subject is None:
+                continue
+            family = families.setdefault(phone, {'students': {}, 'items': [], 'amount_due': Decimal('0')})
+            family['students'].setdefault(f"{first_name} {last_name}".strip(), []).append(subject['name'])
+            family['items'].append({'student_id': student_id, 'subject_id': subject_id, 'fee': str(subject['fee'])})
+            family['amount_due'] += subject['fee']
+        
+        recipients = FeeReminderRecipient.objects.bulk_create([
+            FeeReminderRecipient(
+                campaign=campaign,
+                parent_phone=phone,
+                message=SMSService.fee_reminder_message(family['students'], family['amount_due'],
+                                                        campaign.month, campaign.year),
+                items=family['items'],
+                amount_due=family['amount_due'],
+            )
+            for phone, family in families.items()
+        ], batch_size=1000)
+        campaign.total = len(recipients)
+        campaign.save(update_fields=['total'])
+        return campaign
+    
+    @staticmethod
+    def create_campaign(month, year, created_by=None, branch_id=None):
+        with transaction.atomic(using=current_database()):
+            campaign = FeeReminderCampaign.objects.create(month=month, year=year, created_by=created_by,
+                                                          branch_id=branch_id)
+            FeeReminderService.build_recipients(campaign)
+        return campaign
+    
+    @staticmethod
+    def _claim(campaign_id):
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.FEE_REMINDER_STALE_SECONDS)
+        alias = current_database()
+        # One dispatcher at a time across every branch database, so the provider's rate limit holds
+        for other in database_aliases():
+            if other != alias and FeeReminderCampaign.objects.using(other).filter(
+                status='running', heartbeat_at__gte=stale
+            ).exists():
+                return False
+        with transaction.atomic(using=current_database()):
+            if FeeReminderCampaign.objects.filter(status='running', heartbeat_at__gte=stale).exclude(id=campaign_id).exists():
+                return False
+            claimable = Q(status='pending') | Q(status='running', heartbeat_at__lt=stale)
+            return FeeReminderCampaign.objects.filter(claimable, id=campaign_id).update(
+                status='running', heartbeat_at=now, started_at=Coalesce('started_at', Value(now))
+            ) == 1
+    
+    @staticmethod
+    def _send(recipient, limiter, clients):
+        if not hasattr(clients, 'client'):
+            clients.client = SMSService.client() if SMSService.is_configured() else None
+        limiter.wait()
+        return SMSService.send_sms(recipient.parent_phone, recipient.message, client=clients.client)
+    
+    @staticmethod
+    def dispatch(campaign_id):
+        if not FeeReminderService._claim(campaign_id):
+            return None
+        recipients = FeeReminderRecipient.objects.filter(campaign_id=campaign_id)
+        # A crash between handing a message to the provider and recording it leaves it 'sending';
+        # those are failed rather than resent so no parent gets the same reminder twice.
+        interrupted = recipients.filter(status='sending').update(status='failed', error='Interrupted while sending')
+        if interrupted:
+            FeeReminderCampaign.objects.filter(id=campaign_id).update(failed=F('failed') + interrupted)
+        
+        rate = settings.FEE_REMINDER_RATE_PER_SECOND
+        limiter = SendRateLimiter(rate)
+        clients = threading.local()
+        batch_size = max(settings.FEE_REMINDER_WORKERS, int(rate * 30))
+        outcome = 'completed'
+        try:
+            with ThreadPoolExecutor(max_workers=settings.FEE_REMINDER_WORKERS) as pool:
+                while True:
+                    status = FeeReminderCampaign.objects.filter(id=campaign_id).values_list('status', flat=True).first()
+                    if status != 'running':
+                        return status
+                    batch = list(recipients.filter(status='pending').order_by('id')[:batch_size])
+                    if not batch:
+                        break
+                    recipients.filter(id__in=[recipient.id for recipient in batch]).update(status='sending')
+                    
+                    results = pool.map(lambda recipient: FeeReminderService._send(recipient, limiter, clients), batch)
+                    sent = failed = 0
+                    now = timezone.now()
+                    for recipient, result in zip(batch, results):
+                        recipient.attempts += 1
+                        if result['status'] in ('sent', 'simulated'):
+                            recipient.status = result['status']
+                            recipient.sid = result.get('sid') or ''
+                            recipient.error = ''
+                            recipient.sent_at = now
+                            sent += 1
+                        else:
+                            recipient.status = 'failed'
+                            recipient.error = result.get('error', '')
+                            failed += 1
+                    FeeReminderRecipient.objects.bulk_update(batch, ['status', 'attempts', 'sid', 'error', 'sent_at'])
+                    FeeReminderCampaign.objects.filter(id=campaign_id).update(
+                        sent=F('sent') + sent, failed=F('failed') + failed, heartbeat_at=timezone.now()
+                    )
+        except Exception as e:
+            outcome = 'failed'
+            FeeReminderCampaign.objects.filter(id=campaign_id).update(error=str(e))
+        FeeReminderCampaign.objects.filter(id=campaign_id, status='running').update(
+            status=outcome, completed_at=timezone.now(), heartbeat_at=timezone.now()
+        )
+        return outcome
+    
+    @staticmethod
+    def run_queue():
+        """Dispatch queued campaigns of every branch database, oldest first per database, until none
+        is left or another process holds the sender."""
+        processed = []
+        for alias in database_aliases():
+            with use_database(alias):
+                while True:
+                    stale = timezone.now() - timedelta(seconds=settings.FEE_REMINDER_STALE_SECONDS)
+                    campaign_id = FeeReminderCampaign.objects.filter(
+                        Q(status='pending') | Q(status='running', heartbeat_at__lt=stale)
+                    ).order_by('created_at').values_list('id', flat=True).first()
+                    if campaign_id is None:
+                        break
+                    outcome = FeeReminderService.dispatch(campaign_id)
+                    if outcome is None:
+                        return processed
+                    processed.append((alias, campaign_id, outcome))
+        return processed
+    
+    @staticmethod
+    def start():
+        def run():
+            try:
+                FeeReminderService.run_queue()
+            finally:
+                connections.close_all()
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    @staticmethod
+    def pause(campaign):
+        return FeeReminderCampaign.objects.filter(id=campaign.id, status__in=['pending', 'running']).update(status='paused')
+    
+    @staticmethod
+    def cancel(campaign):
+        return FeeReminderCampaign.objects.filter(id=campaign.id, status__in=FeeReminderService.ACTIVE_STATUSES).update(
+            status='cancelled', completed_at=timezone.now()
+        )
+    
+    @staticmethod
+    def resume(campaign, retry_failed=False):
+        with transaction.atomic(using=current_database()):
+            if retry_failed:
+                retried = campaign.recipients.filter(status='failed').update(status='pending', error='')
+                FeeReminderCampaign.objects.filter(id=campaign.id).update(failed=F('failed') - retried)
+            resumed = FeeReminderCampaign.objects.filter(
+                id=campaign.id, status__in=['paused', 'completed', 'failed']
+            ).update(status='pending', completed_at=None, error='')
+        if resumed:
+            transaction.on_commit(FeeReminderService.start, using=current_database())
+        return resumed
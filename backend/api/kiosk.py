@@ -0,0 +1,186 @@
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .archive import ArchiveService
+from .branches import current_branch, current_database
+from .events import read_events, settled_offset
+from .models import Attendance, DomainEvent, Student
+from .services import AttendanceService
+
+
+class KioskService:
+    ROSTER_FIELDS = ('id', 'register_number', 'name')
+    ROSTER_KINDS = ('student_saved', 'student_removed')
+    
+    @staticmethod
+    def _token(offset):
+        # Offsets are per database, so a token from another database forces a full download
+        return f"{current_database()}:{offset}"
+    
+    @staticmethod
+    def _offset(token):
+        alias, _, offset = str(token or '').rpartition(':')
+        return int(offset) if alias == current_database() and offset.isdigit() else None
+    
+    @staticmethod
+    def _students():
+        branch = current_branch()
+        students = Student.objects.all()
+        return students.filter(branch_id=branch['id']) if branch is not None else students
+    
+    @staticmethod
+    def _roster_rows(students):
+        rows = students.order_by('id').values_list('id', 'register_number', 'user__first_name', 'user__last_name')
+        return [[student_id, register_number, f"{first_name} {last_name}".strip()]
+                for student_id, register_number, first_name, last_name in rows]
+    
+    @staticmethod
+    def roster(since=None):
+        """The kiosk roster, or only the students changed after the ``since`` change token.
+        
+        Deltas replay the student events in the domain event log. A full roster is returned
+        instead when there is no usable token or the events after it are no longer in the log.
+        """
+        offset = KioskService._offset(since)
+        oldest = DomainEvent.objects.order_by('id').values_list('id', flat=True).first()
+        if offset is None or (oldest is not None and oldest > offset + 1) or (oldest is None and offset):
+            token = settled_offset()
+            return {'token': KioskService._token(token), 'full': True, 'more': False,
+                    'fields': KioskService.ROSTER_FIELDS, 'students': KioskService._roster_rows(KioskService._students()),
+                    'removed': []}
+        
+        limit = settings.KIOSK_ROSTER_DELTA_LIMIT
+        events = read_events(offset, limit)
+        branch = current_branch()
+        changed = {
+            event.payload['student_id'] for event in events
+            if event.kind in KioskService.ROSTER_KINDS and (branch is None or event.branch_id == branch['id'])
+        }
+        rows = KioskService._roster_rows(KioskService._students().filter(id__in=changed)) if changed else []
+        return {
+            'token': KioskService._token(events[-1].id if events else offset),
+            'full': False,
+            'more': len(events) == limit,
+            'fields': KioskService.ROSTER_FIELDS,
+            'students': rows,
+            'removed': sorted(changed - {row[0] for row in rows}),
+        }
+    
+    @staticmethod
+    def _parse_scan(scan, now):
+        if not isinstance(scan, dict):
+            return None
+        try:
+            scanned_at = parse_datetime(str(scan.get('scanned_at') or ''))
+        except ValueError:
+            return None
+        if scanned_at is None:
+            return None
+        if timezone.is_naive(scanned_at):
+            scanned_at = timezone.make_aware(scanned_at)
+        if scanned_at > now + timedelta(seconds=settings.KIOSK_CLOCK_SKEW_SECONDS):
+            return None
+        student_id = scan.get('student_id')
+        register_number = str(scan.get('register_number') or '').strip()
+        if not isinstance(student_id, int) and not register_number:
+            return None
+        scanned_at = timezone.localtime(scanned_at)
+        # Days past the retention window are archived; a new row there would count the day twice
+        if scanned_at.date() < ArchiveService.cutoff('attendance'):
+            return None
+        return student_id if isinstance(student_id, int) else None, register_number, scanned_at
+    
+    @staticmethod
+    def apply_scans(scans, marked_by):
+        """Record attendance for scans queued on an offline kiosk, at the time they were scanned.
+        
+        Safe to resend: attendance is unique per student and day, so a repeated or overlapping
+        batch marks nothing twice. Where a student is already marked later that day (by another
+        device, or a slower clock), the earlier scan time is kept.
+        """
+        now = timezone.now()
+        parsed = [KioskService._parse_scan(scan, now) for scan in scans]
+        ids = {entry[0] for entry in parsed if entry and entry[0] is not None}
+        numbers = {entry[1] for entry in parsed if entry and entry[0] is None}
+        students = {}
+        for student_id, register_number, branch_id in KioskService._students().filter(
+                Q(id__in=ids) | Q(register_number__in=numbers)).values_list('id', 'register_number', 'branch_id'):
+            students[student_id] = students[register_number] = (student_id, branch_id)
+        
+        keys = []
+        earliest = {}
+        for index, entry in enumerate(parsed):
+            student = students.get(entry[0] if entry[0] is not None else entry[1]) if entry else None
+            key = (student[0], entry[2].date()) if student else None
+            keys.append(key)
+            if key and (key not in earliest or entry[2] < earliest[key]['scanned_at']):
+                earliest[key] = {'branch_id': student[1], 'scanned_at': entry[2], 'index': index}
+        
+        created = KioskService._record(earliest, marked_by)
+        counts = {'marked': 0, 'already_marked': 0, 'unknown_student': 0, 'invalid': 0}
+        results = []
+        for index, (scan, entry, key) in enumerate(zip(scans, parsed, keys)):
+            if entry is None:
+                status = 'invalid'
+            elif key is None:
+                status = 'unknown_student'
+            elif key in created and earliest[key]['index'] == index:
+                status = 'marked'
+            else:
+                status = 'already_marked'
+            counts[status] += 1
+            results.append({'scan_id': scan.get('scan_id') if isinstance(scan, dict) else None,
+                            'status': status, 'student_id': key[0] if key else None})
+        return {**counts, 'results': results}
+    
+    @staticmethod
+    def _record(earliest, marked_by):
+        """Create or backdate attendance for each (student_id, day) in ``earliest``; returns the created keys."""
+        if not earliest:
+            return set()
+        for attempt in range(2):
+            existing = {
+                (attendance.student_id, attendance.date): attendance
+                for attendance in Attendance.objects.filter(
+                    student_id__in={student_id for student_id, _ in earliest},
+                    date__in={day for _, day in earliest}
+                )
+            }
+            to_create = []
+            to_update = []
+            for (student_id, day), scan in earliest.items():
+                attendance = existing.get((student_id, day))
+                if attendance is None:
+                    to_create.append(Attendance(student_id=student_id, date=day, time=scan['scanned_at'].time(),
+                                                marked_by=marked_by))
+                elif scan['scanned_at'].time() < attendance.time:
+                    attendance.time = scan['scanned_at'].time()
+                    to_update.append(attendance)
+            
+            events = []
+            try:
+                with transaction.atomic(using=current_database()):
+                    Attendance.objects.bulk_create(to_create, batch_size=500)
+                    Attendance.objects.bulk_update(to_update, ['time'], batch_size=500)
+                    for attendance in to_create:
+                        scan = earliest[(attendance.student_id, attendance.date)]
+                        events.append(DomainEvent(kind='attendance_marked', branch_id=scan['branch_id'], payload={
+                            'attendance_id': attendance.pk, 'student_id': attendance.student_id,
+                            'date': str(attendance.date), 'scanned_at': scan['scanned_at'].isoformat(),
+                        }))
+                    DomainEvent.objects.bulk_create(events, batch_size=500)
+                break
+            except IntegrityError:
+                # A live scan or another upload marked one of these students meanwhile; re-read once
+                if attempt:
+                    raise
+        
+        today = date.today()
+        AttendanceService.notify_arrivals([
+            (attendance.student_id, earliest[(attendance.student_id, attendance.date)]['scanned_at'])
+            for attendance in to_create if attendance.date == today
+        ])
+        return {(attendance.student_id, attendance.date) for attendance in to_create}
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from api.branches import database_aliases, use_database
+from api.archive import ArchiveService
+
+
+class Command(BaseCommand):
+    help = 'Move attendance, OTP and quiz attempt rows past their retention window into per-year archive files (safe to schedule nightly)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--table', action='append', choices=sorted(ArchiveService.POLICIES),
+                            help='Only archive this table (repeatable)')
+        parser.add_argument('--batch-size', type=int, help='Rows per archive segment and delete')
+    
+    def handle(self, *args, **options):
+        for alias in database_aliases():
+            with use_database(alias):
+                for name in options['table'] or sorted(ArchiveService.POLICIES):
+                    result = ArchiveService.archive(name, batch_size=options['batch_size'])
+                    if result is None:
+                        self.stdout.write(f"[{alias}] {name}: another process is archiving")
+                        continue
+                    self.stdout.write(self.style.SUCCESS(
+                        f"[{alias}] {name}: archived {result['rows']} rows older than {result['cutoff']:%Y-%m-%d} "
+                        f"into {result['segments']} segments"
+                    ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.branches import get_branch
+from api.services import BranchService
+
+
+class Command(BaseCommand):
+    help = 'Assign students, teachers, subjects and jobs without a branch to BRANCH, in that branch\'s database'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('branch', help='Branch code')
+    
+    def handle(self, *args, **options):
+        branch = get_branch(options['branch'])
+        if branch is None:
+            raise CommandError(f"Unknown branch {options['branch']!r}")
+        counts = BranchService.adopt_unassigned(branch)
+        self.stdout.write(self.style.SUCCESS(
+            f"{branch['code']} ({branch['database']}): " + ', '.join(f'{count} {name}' for name, count in counts.items())
+        ))
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from aiohttp import ClientSession, TCPConnector, web
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from .benchmark_db_concurrency import _setup_worker
+
+SCENARIOS = {
+    'request_otp': {
+        'sync': '/api/auth/student/request-otp/',
+        'async': '/api/async/auth/student/request-otp/',
+    },
+    'mark_attendance': {
+        'sync': '/api/students/{id}/mark_attendance/',
+        'async': '/api/async/students/{id}/mark_attendance/',
+    },
+}
+
+
+def _seed(count):
+    from api.authentication import tokens_for_user
+    from api.models import User, Student
+    
+    owner = User.objects.create_user(username='bench-owner', password='bench', role='owner')
+    users = User.objects.bulk_create([
+        User(username=f'bench{i}', first_name='Bench', last_name=str(i), role='student') for i in range(count)
+    ])
+    students = Student.objects.bulk_create([
+        Student(user=user, register_number=f'BEN{i:07d}', barcode='barcodes/bench.png', grade='B',
+                parent_phone=f'+1555{i:07d}')
+        for i, user in enumerate(users)
+    ])
+    token = str(tokens_for_user(owner).access_token)
+    return token, [(student.id, student.register_number, student.parent_phone) for student in students]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _start_fake_sms(delay):
+    async def create_message(request):
+        await asyncio.sleep(delay)
+        return web.json_response({'sid': f'SM{time.time_ns()}', 'status': 'queued'}, status=201)
+    
+    app = web.Application()
+    app.router.add_post('/2010-04-01/Accounts/{account}/Messages.json', create_message)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    return runner, runner.addresses[0][1]
+
+
+async def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise CommandError(f'Server on port {port} did not start within {timeout}s')
+
+
+def _thread_count(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+async def _sample_threads(pid, peak):
+    while True:
+        count = _thread_count(pid)
+        if count is not None:
+            peak[0] = max(peak[0] or 0, count)
+        await asyncio.sleep(0.05)
+
+
+async def _run_scenario(base_url, path, token, students, concurrency, server_pid):
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def one(session, student):
+        nonlocal failures
+        student_id, register_number, phone = student
+        async with semaphore:
+            started = time.perf_counter()
+            if '{id}' in path:
+                request = session.post(base_url + path.format(id=student_id),
+                                       headers={'Authorization': f'Bearer {token}'})
+            else:
+                request = session.post(base_url + path, json={'register_number': register_number, 'phone': phone})
+            async with request as response:
+                await response.read()
+                if response.status != 200:
+                    failures += 1
+            latencies.append(time.perf_counter() - started)
+    
+    peak_threads = [None]
+    sampler = asyncio.create_task(_sample_threads(server_pid, peak_threads))
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(session, student) for student in students))
+        elapsed = time.perf_counter() - started
+    sampler.cancel()
+    
+    latencies.sort()
+    return {
+        'requests': len(students),
+        'failures': failures,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(len(students) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else 0,
+        'server_peak_threads': peak_threads[0],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare sync and async endpoint throughput per ASGI process against a local fake SMS gateway'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Requests per scenario and path')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--sms-delay', type=float, default=0.2, help='Seconds the fake SMS gateway waits')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+        parser.add_argument('--output', help='Write results as JSON to this file')
+    
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',')]
+        results = asyncio.run(self.run(scenarios, options))
+        for result in results:
+            self.stdout.write(
+                f"{result['scenario']:>16} {result['path']:>5}: {result['requests_per_second']:>7} req/s, "
+                f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, {result['failures']} failures, "
+                f"peak server threads {result['server_peak_threads']}"
+            )
+        
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+    
+    async def run(self, scenarios, options):
+        runner, sms_port = await _start_fake_sms(options['sms_delay'])
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                env = {
+                    'DB_ENGINE': 'sqlite',
+                    'DB_NAME': os.path.join(directory, 'benchmark.sqlite3'),
+                    'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'education_system.settings'),
+                    'TWILIO_ACCOUNT_SID': 'ACbenchmark',
+                    'TWILIO_AUTH_TOKEN': 'benchmark',
+                    'TWILIO_PHONE_NUMBER': '+15550000000',
+                    'TWILIO_API_BASE_URL': f'http://127.0.0.1:{sms_port}',
+                }
+                subprocess.run(
+                    [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'migrate', '-v0'],
+                    env={**os.environ, **env}, check=True
+                )
+                
+                per_run = options['requests']
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(1, mp_context=context, initializer=_setup_worker, initargs=(env,)) as pool:
+                    token, students = pool.submit(_seed, per_run * 2 * len(scenarios)).result()
+                
+                port = _free_port()
+                server = subprocess.Popen(
+                    [sys.executable, '-m', 'uvicorn', 'education_system.asgi:application',
+                     '--host', '127.0.0.1', '--port', str(port), '--workers', '1',
+                     '--log-level', 'warning', '--no-access-log'],
+                    cwd=settings.BASE_DIR, env={**os.environ, **env}
+                )
+                try:
+                    await _wait_for_port(port)
+                    return await self.run_scenarios(f'http://127.0.0.1:{port}', server.pid, scenarios, token, students,
+                                                    options)
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            await runner.cleanup()
+    
+    async def run_scenarios(self, base_url, server_pid, scenarios, token, students, options):
+        results = []
+        per_run = options['requests']
+        for name in scenarios:
+            for path in ('sync', 'async'):
+                batch, students = students[:per_run], students[per_run:]
+                result = await _run_scenario(base_url, SCENARIOS[name][path], token, batch, options['concurrency'],
+                                             server_pid)
+                results.append({'scenario': name, 'path': path, 'concurrency': options['concurrency'], **result})
+        return results
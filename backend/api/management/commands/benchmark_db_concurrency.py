@@ -0,0 +1,132 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PROFILES = {
+    'baseline': {'DB_SQLITE_TUNING': 'false', 'DB_SQLITE_TIMEOUT': '5', 'DB_CONN_MAX_AGE': '0'},
+    'tuned': {'DB_SQLITE_TUNING': 'true', 'DB_CONN_MAX_AGE': '60'},
+}
+
+
+def _setup_worker(env):
+    os.environ.update(env)
+    import django
+    django.setup()
+
+
+def _seed(worker_count, writes):
+    from api.models import User, Student, Subject
+    
+    subject = Subject.objects.create(name='Benchmark', grade='B', fee=1000)
+    users = User.objects.bulk_create([
+        User(username=f'bench{i}', role='student') for i in range(worker_count * writes)
+    ])
+    Student.objects.bulk_create([
+        Student(user=user, register_number=f'BEN{i:07d}', barcode='barcodes/bench.png', grade='B', parent_phone='0')
+        for i, user in enumerate(users)
+    ])
+    return subject.id
+
+
+def _write_worker(worker, writes, subject_id):
+    from django.db import OperationalError, connection, transaction
+    from api.models import Attendance, Payment, Student, StudentSubject
+    
+    student_ids = list(
+        Student.objects.filter(register_number__startswith='BEN').order_by('id')
+        .values_list('id', flat=True)[worker * writes:(worker + 1) * writes]
+    )
+    ok = locked = 0
+    latencies = []
+    for i, student_id in enumerate(student_ids):
+        started = time.perf_counter()
+        try:
+            # Mirrors mark_attendance followed by PaymentService.mark_payment for one scan.
+            with transaction.atomic():
+                Attendance.objects.get_or_create(student_id=student_id, date=time.strftime('%Y-%m-%d'))
+                if not Payment.objects.filter(student_id=student_id, subject_id=subject_id, month=1, year=2000).exists():
+                    Payment.objects.create(student_id=student_id, subject_id=subject_id, amount=1000, month=1, year=2000)
+                StudentSubject.objects.update_or_create(
+                    student_id=student_id, subject_id=subject_id, defaults={'is_paid_current_month': True}
+                )
+            ok += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+    return ok, locked, latencies
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent attendance/payment write throughput and lock errors per SQLite profile'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=200, help='Write transactions per worker')
+        parser.add_argument('--profiles', default='baseline,tuned')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+    
+    def run_profile(self, name, worker_count, writes):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **PROFILES[name],
+                'DB_ENGINE': 'sqlite',
+                'DB_NAME': os.path.join(directory, 'benchmark.sqlite3'),
+                'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'education_system.settings'),
+            }
+            subprocess.run(
+                [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'migrate', '-v0'],
+                env={**os.environ, **env}, check=True
+            )
+            
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(1, mp_context=context, initializer=_setup_worker, initargs=(env,)) as pool:
+                subject_id = pool.submit(_seed, worker_count, writes).result()
+            
+            with ProcessPoolExecutor(worker_count, mp_context=context, initializer=_setup_worker,
+                                     initargs=(env,)) as pool:
+                started = time.perf_counter()
+                results = list(pool.map(
+                    _write_worker, range(worker_count), [writes] * worker_count, [subject_id] * worker_count
+                ))
+                elapsed = time.perf_counter() - started
+        
+        ok = sum(result[0] for result in results)
+        locked = sum(result[1] for result in results)
+        latencies = sorted(latency for result in results for latency in result[2])
+        return {
+            'profile': name,
+            'workers': worker_count,
+            'transactions': ok + locked,
+            'committed': ok,
+            'lock_errors': locked,
+            'lock_error_rate': locked / (ok + locked) if ok + locked else 0,
+            'elapsed_seconds': round(elapsed, 3),
+            'commits_per_second': round(ok / elapsed, 1) if elapsed else 0,
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else 0,
+            'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else 0,
+        }
+    
+    def handle(self, *args, **options):
+        results = []
+        for name in options['profiles'].split(','):
+            result = self.run_profile(name.strip(), options['workers'], options['writes'])
+            results.append(result)
+            self.stdout.write(
+                f"{result['profile']:>10}: {result['commits_per_second']:>8} commits/s, "
+                f"{result['lock_errors']} lock errors ({result['lock_error_rate']:.1%}), "
+                f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms"
+            )
+        
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
@@ -0,0 +1,449 @@
+import contextlib
+import io
+import json
+import logging
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client, override_settings
+from django.urls import get_resolver
+from django.utils import timezone
+from api.authentication import tokens_for_user
+from api.models import (Branch, User, Student, Teacher, Subject, StudentSubject, Note, Video, Quiz, ExamResult,
+                        ReportCardJob, FeeReminderCampaign)
+from api.services import NoteStorageService, OTPService, SettlementService
+
+UPLOAD_BODY = b'benchmark note body\n' * 64
+
+
+class Case:
+    def __init__(self, name, method, role, path, data=None, mutates=False, prepare=None,
+                 content_type='application/json'):
+        self.name = name
+        self.method = method
+        self.role = role
+        self.path = path
+        self.data = data
+        self.mutates = mutates
+        self.prepare = prepare
+        self.content_type = content_type
+    
+    def key(self):
+        return f'{self.method.upper()} {self.name} ({self.role})'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+    
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Fixtures:
+    """Representative rows picked from the database the benchmark runs against."""
+    
+    def __init__(self, password):
+        self.password = password
+        self.owner = User.objects.filter(role='owner', is_active=True).order_by('id').first()
+        self.subject = (Subject.objects.filter(teacher__isnull=False, enrolled_students__isnull=False)
+                        .order_by('id').first())
+        if self.owner is None or self.subject is None:
+            raise CommandError('Run generate_dataset first: an owner and a subject with a teacher and students are needed')
+        self.teacher = self.subject.teacher
+        self.student = Student.objects.filter(enrolled_subjects__subject=self.subject).select_related('user').first()
+        self.students = list(Student.objects.order_by('id').values_list('id', 'register_number', 'parent_phone')[:500])
+        self.note = Note.objects.filter(subject=self.subject).first()
+        self.video = Video.objects.filter(subject=self.subject).first()
+        self.quiz = Quiz.objects.filter(subject=self.subject).first()
+        self.exam_result = ExamResult.objects.filter(subject=self.subject).order_by('-exam_date').first()
+        if None in (self.note, self.video, self.quiz, self.exam_result):
+            raise CommandError('Run generate_dataset first: notes, videos, quizzes and exam results are needed')
+        # Rows that take the "first time" path through mark_payment and mark_attendance
+        self.unpaid = StudentSubject.objects.filter(is_paid_current_month=False).first() or \
+            StudentSubject.objects.first()
+        self.absent = list(
+            Student.objects.exclude(attendance_records__date=date.today()).order_by('id').values_list('id', flat=True)[:500]
+        ) or [student[0] for student in self.students]
+        self.tokens = {
+            'owner': tokens_for_user(self.owner),
+            'teacher': tokens_for_user(self.teacher.user),
+            'student': tokens_for_user(self.student.user),
+        }
+    
+    def client(self, role):
+        if role == 'anonymous':
+            return Client()
+        return Client(HTTP_AUTHORIZATION=f'Bearer {self.tokens[role].access_token}')
+    
+    def other_student(self, i):
+        return self.students[i % len(self.students)]
+    
+    def absent_student(self, i):
+        return self.absent[i % len(self.absent)]
+
+
+def _ready_report_job(fx):
+    job = ReportCardJob.objects.create(grade=fx.subject.grade, start_date=date.today() - timedelta(days=30),
+                                       end_date=date.today(), month=date.today().month, year=date.today().year,
+                                       status='completed', created_by=fx.owner)
+    job.archive.save('benchmark.zip', ContentFile(b'PK\x05\x06' + b'\x00' * 18), save=True)
+    return job
+
+
+def _campaign(fx, status):
+    return FeeReminderCampaign.objects.create(month=date.today().month, year=date.today().year - 1,
+                                              status=status, created_by=fx.owner)
+
+
+def _note_preview(fx):
+    fx.note.preview.save('benchmark.png', ContentFile(b'\x89PNG\r\n\x1a\n' + b'\x00' * 64), save=True)
+    return fx.note
+
+
+def _settlement(fx):
+    previous = date.today().replace(day=1) - timedelta(days=1)
+    return SettlementService.close_month(previous.month, previous.year, closed_by=fx.owner)[0]
+
+
+def _upload(fx, received=False):
+    upload = NoteStorageService.start_upload(fx.teacher.user, 'benchmark.txt', len(UPLOAD_BODY))
+    if received:
+        NoteStorageService.write_chunk(upload, 0, io.BytesIO(UPLOAD_BODY), len(UPLOAD_BODY))
+        upload.refresh_from_db()
+    return upload
+
+
+def build_cases(fx):
+    subject, quiz, note, video, result = fx.subject, fx.quiz, fx.note, fx.video, fx.exam_result
+    student, teacher, unpaid = fx.student, fx.teacher, fx.unpaid
+    answers = {str(q['id']): q.get('correct_answer') for q in quiz.questions}
+    today = date.today()
+    
+    def student_payload(i):
+        return {'first_name': 'Bench', 'last_name': f'Mark{i}', 'email': f'bench{i}@example.com',
+                'grade': subject.grade, 'parent_phone': '0700000000'}
+    
+    def kiosk_payload(i):
+        scanned_at = (timezone.now() - timedelta(minutes=30)).isoformat()
+        return {'scans': [{'scan_id': f'bench-{i}-{n}', 'student_id': fx.absent_student(i * 50 + n), 'scanned_at': scanned_at}
+                          for n in range(50)]}
+    
+    def otp_payload(i):
+        _, register_number, phone = fx.other_student(i)
+        return {'register_number': register_number, 'phone': phone}
+    
+    def verify_payload(i):
+        _, register_number, phone = fx.other_student(i)
+        return {'register_number': register_number, 'otp_code': OTPService.issue_otp(register_number, phone)}
+    
+    cases = [
+        Case('api-root', 'get', 'owner', '/api/'),
+        Case('login', 'post', 'anonymous', '/api/auth/login/',
+             {'username': fx.owner.username, 'password': fx.password}),
+        Case('token_refresh', 'post', 'anonymous', '/api/auth/refresh/',
+             {'refresh': str(fx.tokens['owner'])}),
+        Case('student-request-otp', 'post', 'anonymous', '/api/auth/student/request-otp/', otp_payload),
+        Case('student-verify-otp', 'post', 'anonymous', '/api/auth/student/verify-otp/', verify_payload),
+        Case('owner-dashboard', 'get', 'owner', '/api/dashboard/owner/'),
+        Case('owner-branch-dashboard', 'get', 'owner', '/api/dashboard/owner/branches/'),
+        Case('teacher-dashboard', 'get', 'teacher', '/api/dashboard/teacher/'),
+        Case('teacher-income', 'get', 'teacher', '/api/dashboard/teacher/income/'),
+        Case('teacher-income', 'get', 'teacher',
+             lambda i, settlement: f'/api/dashboard/teacher/income/?month={settlement.month}&year={settlement.year}',
+             mutates=True, prepare=lambda i: _settlement(fx)),
+        Case('student-dashboard', 'get', 'student', '/api/dashboard/student/'),
+        Case('async-student-request-otp', 'post', 'anonymous', '/api/async/auth/student/request-otp/',
+             lambda i: otp_payload(i + len(fx.students) // 2)),
+        Case('async-student-mark-attendance', 'post', 'owner',
+             lambda i: f'/api/async/students/{fx.absent_student(i)}/mark_attendance/', mutates=True),
+        Case('async-student-mark-payment', 'post', 'owner', f'/api/async/students/{unpaid.student_id}/mark_payment/',
+             {'subject_id': unpaid.subject_id}, mutates=True),
+        Case('async-owner-dashboard', 'get', 'owner', '/api/async/dashboard/owner/'),
+        Case('async-teacher-dashboard', 'get', 'teacher', '/api/async/dashboard/teacher/'),
+        Case('async-student-dashboard', 'get', 'student', '/api/async/dashboard/student/'),
+        
+        Case('student-list', 'get', 'owner', '/api/students/'),
+        Case('student-list', 'post', 'owner', '/api/students/', student_payload, mutates=True),
+        Case('student-detail', 'get', 'owner', f'/api/students/{student.id}/'),
+        Case('student-detail', 'patch', 'owner', f'/api/students/{student.id}/', {'address': 'Benchmark'}, mutates=True),
+        Case('student-detail', 'delete', 'owner', lambda i: f'/api/students/{fx.other_student(i)[0]}/', mutates=True),
+        Case('student-mark-attendance', 'post', 'owner',
+             lambda i: f'/api/students/{fx.absent_student(i)}/mark_attendance/', mutates=True),
+        Case('student-mark-payment', 'post', 'owner', f'/api/students/{unpaid.student_id}/mark_payment/',
+             {'subject_id': unpaid.subject_id}, mutates=True),
+        Case('kiosk-roster', 'get', 'owner', '/api/kiosk/roster/'),
+        Case('kiosk-scans', 'post', 'owner', '/api/kiosk/scans/', kiosk_payload, mutates=True),
+        
+        Case('teacher-list', 'get', 'owner', '/api/teachers/'),
+        Case('teacher-list', 'post', 'owner', '/api/teachers/',
+             lambda i: {'username': f'bench-teacher-{i}', 'first_name': 'Bench', 'last_name': 'Teacher',
+                        'email': f'bench-teacher-{i}@example.com', 'password': 'benchmark-pass-1'},
+             mutates=True),
+        Case('teacher-detail', 'get', 'owner', f'/api/teachers/{teacher.id}/'),
+        Case('teacher-detail', 'patch', 'owner', f'/api/teachers/{teacher.id}/', {'specialization': 'Bench'},
+             mutates=True),
+        Case('teacher-detail', 'delete', 'owner', f'/api/teachers/{teacher.id}/', mutates=True),
+        
+        Case('subject-list', 'get', 'owner', '/api/subjects/'),
+        Case('subject-list', 'post', 'owner', '/api/subjects/',
+             lambda i: {'name': f'Bench {i}', 'grade': subject.grade, 'fee': '1000.00', 'teacher': teacher.id},
+             mutates=True),
+        Case('subject-detail', 'get', 'owner', f'/api/subjects/{subject.id}/'),
+        Case('subject-detail', 'patch', 'owner', f'/api/subjects/{subject.id}/', {'description': 'Bench'},
+             mutates=True),
+        Case('subject-detail', 'delete', 'owner', f'/api/subjects/{subject.id}/', mutates=True),
+        
+        Case('note-list', 'get', 'student', '/api/notes/'),
+        Case('note-list', 'get', 'teacher', '/api/notes/'),
+        Case('note-list', 'post', 'teacher', '/api/notes/',
+             {'subject': subject.id, 'teacher': teacher.id, 'title': 'Bench note', 'content': 'Body'}, mutates=True),
+        Case('note-detail', 'get', 'student', lambda i: f'/api/notes/{note.id}/'),
+        Case('note-detail', 'patch', 'teacher', lambda i: f'/api/notes/{note.id}/', {'title': 'Bench'}, mutates=True),
+        Case('note-detail', 'delete', 'teacher', lambda i: f'/api/notes/{note.id}/', mutates=True),
+        Case('note-download', 'get', 'student', lambda i: f'/api/notes/{note.id}/download/'),
+        Case('note-preview', 'get', 'student', lambda i, note: f'/api/notes/{note.id}/preview/',
+             mutates=True, prepare=lambda i: _note_preview(fx)),
+        
+        Case('noteupload-list', 'post', 'teacher', '/api/note-uploads/',
+             {'filename': 'bench.txt', 'total_size': len(UPLOAD_BODY)}, mutates=True),
+        Case('noteupload-detail', 'get', 'teacher', lambda i, upload: f'/api/note-uploads/{upload.id}/',
+             mutates=True, prepare=lambda i: _upload(fx)),
+        Case('noteupload-chunk', 'put', 'teacher', lambda i, upload: f'/api/note-uploads/{upload.id}/chunk/?offset=0',
+             UPLOAD_BODY, mutates=True, prepare=lambda i: _upload(fx), content_type='application/octet-stream'),
+        Case('noteupload-complete', 'post', 'teacher', lambda i, upload: f'/api/note-uploads/{upload.id}/complete/',
+             mutates=True, prepare=lambda i: _upload(fx, received=True)),
+        
+        Case('video-list', 'get', 'student', '/api/videos/'),
+        Case('video-list', 'post', 'teacher', '/api/videos/',
+             {'subject': subject.id, 'teacher': teacher.id, 'title': 'Bench', 'url': 'https://example.com/v'},
+             mutates=True),
+        Case('video-detail', 'get', 'student', lambda i: f'/api/videos/{video.id}/'),
+        Case('video-detail', 'patch', 'teacher', lambda i: f'/api/videos/{video.id}/', {'title': 'Bench'},
+             mutates=True),
+        Case('video-detail', 'delete', 'teacher', lambda i: f'/api/videos/{video.id}/', mutates=True),
+        
+        Case('quiz-list', 'get', 'student', '/api/quizzes/'),
+        Case('quiz-list', 'get', 'teacher', '/api/quizzes/'),
+        Case('quiz-list', 'post', 'teacher', '/api/quizzes/',
+             {'subject': subject.id, 'teacher': teacher.id, 'title': 'Bench quiz', 'total_marks': 10,
+              'questions': [{'id': 1, 'question': 'Q', 'options': ['A', 'B'], 'correct_answer': 'A'}]},
+             mutates=True),
+        Case('quiz-detail', 'get', 'student', lambda i: f'/api/quizzes/{quiz.id}/'),
+        Case('quiz-detail', 'patch', 'teacher', lambda i: f'/api/quizzes/{quiz.id}/', {'description': 'Bench'},
+             mutates=True),
+        Case('quiz-detail', 'delete', 'teacher', lambda i: f'/api/quizzes/{quiz.id}/', mutates=True),
+        Case('quiz-analytics', 'get', 'teacher', lambda i: f'/api/quizzes/{quiz.id}/analytics/'),
+        Case('quiz-submit-attempt', 'post', 'student', lambda i: f'/api/quizzes/{quiz.id}/submit_attempt/',
+             {'answers': answers}, mutates=True),
+        
+        Case('examresult-list', 'get', 'student', '/api/exam-results/'),
+        Case('examresult-list', 'get', 'teacher', '/api/exam-results/'),
+        Case('examresult-list', 'post', 'teacher', '/api/exam-results/',
+             lambda i: {'student': student.id, 'subject': subject.id, 'exam_name': f'Bench {i}',
+                        'marks_obtained': '50.00', 'total_marks': '100.00', 'exam_date': str(today),
+                        'teacher': teacher.id},
+             mutates=True),
+        Case('examresult-bulk-upsert', 'post', 'teacher', '/api/exam-results/bulk_upsert/',
+             {'subject': subject.id, 'exam_name': 'Bench upsert', 'exam_date': str(today), 'total_marks': '100',
+              'results': [{'register_number': student.register_number, 'marks_obtained': '75'}]},
+             mutates=True),
+        Case('examresult-rankings', 'get', 'teacher',
+             lambda i: f'/api/exam-results/rankings/?subject={subject.id}&exam_name={result.exam_name}'),
+        Case('examresult-rankings', 'get', 'student',
+             lambda i: f'/api/exam-results/rankings/?subject={subject.id}&exam_name={result.exam_name}'),
+        Case('examresult-detail', 'get', 'teacher', lambda i: f'/api/exam-results/{result.id}/'),
+        Case('examresult-detail', 'patch', 'teacher', lambda i: f'/api/exam-results/{result.id}/',
+             {'marks_obtained': '60.00'}, mutates=True),
+        Case('examresult-detail', 'delete', 'teacher', lambda i: f'/api/exam-results/{result.id}/', mutates=True),
+        
+        Case('reportcardjob-list', 'get', 'owner', '/api/report-cards/'),
+        Case('reportcardjob-list', 'post', 'owner', '/api/report-cards/',
+             {'grade': subject.grade, 'start_date': str(today - timedelta(days=30)), 'end_date': str(today)},
+             mutates=True),
+        Case('reportcardjob-detail', 'get', 'owner', lambda i, job: f'/api/report-cards/{job.id}/',
+             mutates=True, prepare=lambda i: _ready_report_job(fx)),
+        Case('reportcardjob-download', 'get', 'owner', lambda i, job: f'/api/report-cards/{job.id}/download/',
+             mutates=True, prepare=lambda i: _ready_report_job(fx)),
+        
+        Case('feeremindercampaign-list', 'get', 'owner', '/api/fee-reminders/'),
+        Case('feeremindercampaign-list', 'post', 'owner', '/api/fee-reminders/',
+             {'month': today.month, 'year': today.year}, mutates=True),
+        Case('feeremindercampaign-detail', 'get', 'owner', lambda i, campaign: f'/api/fee-reminders/{campaign.id}/',
+             mutates=True, prepare=lambda i: _campaign(fx, 'running')),
+        Case('feeremindercampaign-recipients', 'get', 'owner',
+             lambda i, campaign: f'/api/fee-reminders/{campaign.id}/recipients/?limit=50',
+             mutates=True, prepare=lambda i: _campaign(fx, 'running')),
+        Case('feeremindercampaign-pause', 'post', 'owner', lambda i, campaign: f'/api/fee-reminders/{campaign.id}/pause/',
+             mutates=True, prepare=lambda i: _campaign(fx, 'running')),
+        Case('feeremindercampaign-cancel', 'post', 'owner', lambda i, campaign: f'/api/fee-reminders/{campaign.id}/cancel/',
+             mutates=True, prepare=lambda i: _campaign(fx, 'running')),
+        Case('feeremindercampaign-resume', 'post', 'owner', lambda i, campaign: f'/api/fee-reminders/{campaign.id}/resume/',
+             mutates=True, prepare=lambda i: _campaign(fx, 'paused')),
+        
+        Case('monthlysettlement-list', 'get', 'owner', '/api/settlements/'),
+        Case('monthlysettlement-close', 'post', 'owner', '/api/settlements/close/', mutates=True),
+        Case('monthlysettlement-detail', 'get', 'owner', lambda i, settlement: f'/api/settlements/{settlement.id}/',
+             mutates=True, prepare=lambda i: _settlement(fx)),
+        Case('monthlysettlement-reconcile', 'get', 'owner',
+             lambda i, settlement: f'/api/settlements/{settlement.id}/reconcile/',
+             mutates=True, prepare=lambda i: _settlement(fx)),
+        
+        Case('branch-list', 'get', 'owner', '/api/branches/'),
+        Case('branch-list', 'post', 'owner', '/api/branches/', lambda i: {'code': f'B{i}', 'name': 'Bench'},
+             mutates=True),
+        Case('branch-detail', 'get', 'owner', lambda i, branch: f'/api/branches/{branch.id}/',
+             mutates=True, prepare=lambda i: Branch.objects.create(code=f'G{i}', name='Bench')),
+        Case('branch-detail', 'patch', 'owner', lambda i, branch: f'/api/branches/{branch.id}/', {'name': 'Renamed'},
+             mutates=True, prepare=lambda i: Branch.objects.create(code=f'P{i}', name='Bench')),
+    ]
+    return cases
+
+
+def _resolve(value, i, prepared):
+    if not callable(value):
+        return value
+    return value(i, prepared) if prepared is not None else value(i)
+
+
+class Command(BaseCommand):
+    help = 'Drive every endpoint in api/urls.py through the test client and report latency and query counts'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', help='Only run cases whose URL name contains this text')
+        parser.add_argument('--password', default='password123', help='Password of the owner account, for login')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--compare', help='Earlier JSON output to diff p50 latency and query counts against')
+    
+    def handle(self, *args, **options):
+        fixtures = Fixtures(options['password'])
+        cases = build_cases(fixtures)
+        covered = {case.name for case in cases}
+        if options['only']:
+            cases = [case for case in cases if options['only'] in case.name]
+        
+        # DEBUG query logging and per-request log lines would distort the timings.
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with tempfile.TemporaryDirectory() as directory, \
+                    override_settings(DEBUG=False, MEDIA_ROOT=directory, NOTE_UPLOAD_TEMP_DIR=directory), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                results = [self.run_case(fixtures, case, options['iterations'], options['warmup']) for case in cases]
+        finally:
+            request_logger.setLevel(level)
+        
+        for result in results:
+            self.stdout.write(
+                f"{result['case']:<62} {result['status']:<8} p50 {result['p50_ms']:>8} ms  "
+                f"p99 {result['p99_ms']:>8} ms  queries {result['queries_median']:>5}"
+            )
+        
+        uncovered = sorted({
+            pattern.name for pattern in self.url_patterns() if pattern.name and pattern.name not in covered
+        })
+        if uncovered:
+            self.stderr.write(f"Endpoints without a benchmark case: {', '.join(uncovered)}")
+        
+        report = {
+            'commit': self.git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'database': {
+                'vendor': connections['default'].vendor,
+                'students': Student.objects.count(),
+                'teachers': Teacher.objects.count(),
+            },
+            'iterations': options['iterations'],
+            'results': results,
+            'uncovered': uncovered,
+        }
+        if options['compare']:
+            self.compare(report, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+    
+    def url_patterns(self, patterns=None):
+        for pattern in patterns if patterns is not None else get_resolver('api.urls').url_patterns:
+            if hasattr(pattern, 'url_patterns'):
+                yield from self.url_patterns(pattern.url_patterns)
+            else:
+                yield pattern
+    
+    def run_case(self, fixtures, case, iterations, warmup):
+        client = fixtures.client(case.role)
+        latencies, queries, statuses = [], [], set()
+        for i in range(warmup + iterations):
+            with transaction.atomic():
+                prepared = case.prepare(i) if case.prepare else None
+                path = _resolve(case.path, i, prepared)
+                data = _resolve(case.data, i, prepared)
+                if isinstance(data, (dict, list)):
+                    data = json.dumps(data)
+                request = getattr(client, case.method)
+                counter = QueryCounter()
+                with contextlib.ExitStack() as stack:
+                    for alias in settings.DATABASES:
+                        stack.enter_context(connections[alias].execute_wrapper(counter))
+                    started = time.perf_counter()
+                    response = request(path, data, content_type=case.content_type) if data is not None \
+                        else request(path)
+                    elapsed = time.perf_counter() - started
+                if case.mutates:
+                    transaction.set_rollback(True)
+            if i >= warmup:
+                latencies.append(elapsed * 1000)
+                queries.append(counter.count)
+                statuses.add(response.status_code)
+        return {
+            'case': case.key(),
+            'name': case.name,
+            'method': case.method.upper(),
+            'role': case.role,
+            'status': ','.join(str(code) for code in sorted(statuses)),
+            'p50_ms': round(_percentile(latencies, 0.5), 2),
+            'p90_ms': round(_percentile(latencies, 0.9), 2),
+            'p99_ms': round(_percentile(latencies, 0.99), 2),
+            'mean_ms': round(statistics.fmean(latencies), 2),
+            'max_ms': round(max(latencies), 2),
+            'queries_median': statistics.median(queries),
+            'queries_max': max(queries),
+        }
+    
+    def compare(self, report, path):
+        with open(path) as baseline_file:
+            baseline = {result['case']: result for result in json.load(baseline_file)['results']}
+        self.stdout.write(f"\nCompared with {path}:")
+        for result in report['results']:
+            before = baseline.get(result['case'])
+            if before is None:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0
+            query_change = result['queries_median'] - before['queries_median']
+            if abs(change) >= 0.1 or query_change:
+                self.stdout.write(
+                    f"{result['case']:<62} p50 {before['p50_ms']} -> {result['p50_ms']} ms ({change:+.0%}), "
+                    f"queries {before['queries_median']} -> {result['queries_median']}"
+                )
+    
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,86 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+def _summary(samples):
+    return {
+        'median': round(statistics.median(samples), 4),
+        'min': round(min(samples), 4),
+        'max': round(max(samples), 4),
+    }
+
+
+def _import_time_by_package(stderr, limit):
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, _, name = line.split('|')
+        # Self time only, so nested imports are attributed to their own package rather than the importer
+        packages[name.strip().split('.')[0]] += int(self_time.split(':')[1])
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return [{'package': name, 'ms': round(micros / 1000, 1)} for name, micros in ranked[:limit]]
+
+
+class Command(BaseCommand):
+    help = ('Measure cold start of manage.py commands and of WSGI app load plus first request '
+            '(see probe_wsgi_startup), in fresh processes')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Fresh processes per scenario')
+        parser.add_argument('--commands', default='check,help', help='Comma-separated manage.py commands to time')
+        parser.add_argument('--path', default='/api/students/', help='Path for the first WSGI request')
+        parser.add_argument('--imports', type=int, default=15, help='Report import time of the N slowest packages during WSGI load')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+    
+    def _run(self, args, env=None):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR, env={**os.environ, **(env or {})},
+                                capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(f"{' '.join(args)} failed:\n{result.stderr[-2000:]}")
+        return elapsed, result
+    
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        results = {'python': sys.version.split()[0], 'commands': {}, 'wsgi': {}}
+        
+        for command in filter(None, (name.strip() for name in options['commands'].split(','))):
+            samples = [self._run(['manage.py', *command.split()])[0] for _ in range(repeat)]
+            results['commands'][command] = _summary(samples)
+            self.stdout.write(f"manage.py {command:<22} {results['commands'][command]['median'] * 1000:8.1f} ms")
+        
+        for mode, env in (('default', {'PRELOAD_APP': 'false'}), ('preload', {'PRELOAD_APP': 'true'})):
+            samples = {'process': [], 'load': [], 'first_request': []}
+            for _ in range(repeat):
+                elapsed, result = self._run(['manage.py', 'probe_wsgi_startup', options['path']], env)
+                probe = json.loads(result.stdout.strip().splitlines()[-1])
+                samples['process'].append(elapsed)
+                samples['load'].append(probe['load'])
+                samples['first_request'].append(probe['first_request'])
+            results['wsgi'][mode] = {name: _summary(values) for name, values in samples.items()}
+            results['wsgi'][mode]['status'] = probe['status']
+            self.stdout.write(
+                f"wsgi {mode:<8} load {results['wsgi'][mode]['load']['median'] * 1000:8.1f} ms, "
+                f"first request {results['wsgi'][mode]['first_request']['median'] * 1000:7.1f} ms "
+                f"({probe['status']}), process {results['wsgi'][mode]['process']['median'] * 1000:8.1f} ms"
+            )
+        
+        if options['imports']:
+            _, result = self._run(['-X', 'importtime', 'manage.py', 'probe_wsgi_startup', options['path']],
+                                  {'PRELOAD_APP': 'false'})
+            results['import_time'] = _import_time_by_package(result.stderr, options['imports'])
+            self.stdout.write('Import time by package during startup and WSGI load:')
+            for entry in results['import_time']:
+                self.stdout.write(f"  {entry['ms']:8.1f} ms  {entry['package']}")
+        
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
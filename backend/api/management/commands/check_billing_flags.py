@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.branches import database_aliases, use_database
+from api.services import BillingService
+
+
+class Command(BaseCommand):
+    help = 'Compare StudentSubject.is_paid_current_month against Payment rows for the current month in every branch database'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Re-run the rollover when mismatches are found')
+    
+    def handle(self, *args, **options):
+        inconsistent = 0
+        for alias in database_aliases():
+            with use_database(alias):
+                inconsistent += self.check(alias, options['repair'])
+        if inconsistent:
+            raise CommandError(f'{inconsistent} enrollments have inconsistent payment flags')
+    
+    def check(self, alias, repair):
+        report = BillingService.check_consistency()
+        mismatches = report['flagged_without_payment'] + report['payment_without_flag']
+        self.stdout.write(
+            f"[{alias}] {report['period']}: {report['enrollments']} enrollments, rolled over: {report['rolled_over']}, "
+            f"{report['flagged_without_payment']} flagged without payment, "
+            f"{report['payment_without_flag']} paid but not flagged"
+        )
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Payment flags are consistent'))
+            return 0
+        
+        self.stdout.write(f"Sample enrollment ids: {report['samples']}")
+        if not repair:
+            return mismatches
+        run = BillingService.rollover(force=True)['run']
+        self.stdout.write(self.style.SUCCESS(
+            f"Repaired: {run.marked_paid} marked paid, {run.marked_unpaid} marked unpaid"
+        ))
+        return 0
@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from api.branches import database_aliases, registry, use_database
+from api.services import SettlementService
+
+
+class Command(BaseCommand):
+    help = 'Close a month into immutable teacher settlement statements for every branch and database (safe to rerun)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--month', type=int, help='Month to close (defaults to the previous month)')
+        parser.add_argument('--year', type=int, help='Year of --month')
+    
+    def handle(self, *args, **options):
+        if (options['month'] is None) != (options['year'] is None):
+            raise CommandError('Give both --month and --year, or neither')
+        month, year = options['month'], options['year']
+        if month is None:
+            previous = date.today().replace(day=1) - timedelta(days=1)
+            month, year = previous.month, previous.year
+        
+        for alias in database_aliases():
+            with use_database(alias):
+                scopes = [None, *(branch['id'] for branch in registry().values() if branch['database'] == alias)]
+                for branch_id in scopes:
+                    try:
+                        settlement, created = SettlementService.close_month(month, year, branch_id)
+                    except ValueError as exc:
+                        raise CommandError(str(exc))
+                    scope = f"branch {branch_id}" if branch_id else 'all branches'
+                    if not created:
+                        self.stdout.write(f"[{alias}] {month:02d}/{year} {scope}: already closed")
+                        continue
+                    self.stdout.write(self.style.SUCCESS(
+                        f"[{alias}] {month:02d}/{year} {scope}: {settlement.payment_count} payments, "
+                        f"{settlement.total_collected} collected, {settlement.teacher_total} to teachers"
+                    ))
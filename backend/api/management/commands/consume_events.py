@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.branches import database_aliases, use_database
+from api.events import catch_up, consumers, lag, replay
+
+
+class Command(BaseCommand):
+    help = 'Apply new domain events to every registered consumer in every branch database (safe to run from cron)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', action='append', help='Only this consumer (repeatable)')
+        parser.add_argument('--replay', action='store_true', help='Clear derived data and rebuild it from the start of the log')
+        parser.add_argument('--follow', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --follow')
+    
+    def handle(self, *args, **options):
+        try:
+            selected = consumers(options['consumer'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        
+        if options['replay']:
+            for alias in database_aliases():
+                with use_database(alias):
+                    for consumer in selected:
+                        processed = replay(consumer)
+                        self.stdout.write(self.style.SUCCESS(f"[{alias}] {consumer.name}: replayed {processed} events"))
+        
+        while True:
+            for alias in database_aliases():
+                with use_database(alias):
+                    for consumer in selected:
+                        processed = catch_up(consumer)
+                        if processed or not options['follow']:
+                            self.stdout.write(f"[{alias}] {consumer.name}: {processed} events applied, {lag(consumer)} behind")
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.fee_reminders import FeeReminderService
+
+
+class Command(BaseCommand):
+    help = 'Send queued fee reminder campaigns and resume ones whose sender stopped (safe to run from cron)'
+    
+    def handle(self, *args, **options):
+        processed = FeeReminderService.run_queue()
+        if not processed:
+            self.stdout.write('No campaigns to send, or another process is sending')
+        for alias, campaign_id, outcome in processed:
+            self.stdout.write(self.style.SUCCESS(f'Campaign {campaign_id} ({alias}): {outcome}'))
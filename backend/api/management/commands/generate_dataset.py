@@ -0,0 +1,342 @@
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from api.models import (User, Student, Teacher, Subject, StudentSubject, Payment, Attendance, Note, Video,
+                        Quiz, QuizAttempt, ExamResult)
+from api.services import BillingService, QuizAnalyticsService
+
+FIRST_NAMES = ['Amal', 'Nimal', 'Kavindu', 'Sachini', 'Dilini', 'Tharindu', 'Ishara', 'Chamodi', 'Ravindu',
+               'Hiruni', 'Kasun', 'Nethmi', 'Pasindu', 'Sanduni', 'Yasiru', 'Malsha', 'Dinuka', 'Oshadi']
+LAST_NAMES = ['Perera', 'Fernando', 'Silva', 'Jayasinghe', 'Bandara', 'Wijesinghe', 'Gunawardena',
+              'Rajapaksha', 'Herath', 'Dissanayake', 'Karunaratne', 'Weerasinghe']
+SUBJECT_NAMES = ['Mathematics', 'Science', 'English', 'History', 'ICT', 'Geography', 'Commerce', 'Art',
+                 'Music', 'Sinhala', 'Tamil', 'Health']
+FEES = [Decimal('1500.00'), Decimal('2000.00'), Decimal('2500.00'), Decimal('3000.00')]
+OPTIONS = ['A', 'B', 'C', 'D']
+PASSTHROUGH_TYPES = {'IntegerField', 'BigIntegerField', 'ForeignKey', 'CharField', 'BooleanField'}
+
+
+def insert_rows(model, field_names, rows, batch_size):
+    """INSERT plain tuples with executemany; far cheaper than bulk_create for millions of rows."""
+    db = connections[router.db_for_write(model)]
+    fields = [model._meta.get_field(name) for name in field_names]
+    prepare = [
+        None if field.get_internal_type() in PASSTHROUGH_TYPES else field.get_db_prep_save for field in fields
+    ]
+    quote = db.ops.quote_name
+    sql = (f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(quote(field.column) for field in fields)}) '
+           f'VALUES ({", ".join(["%s"] * len(fields))})')
+    created = 0
+    rows = iter(rows)
+    with db.cursor() as cursor:
+        while True:
+            batch = [
+                [value if prep is None else prep(value, db) for prep, value in zip(prepare, row)]
+                for row in islice(rows, batch_size)
+            ]
+            if not batch:
+                return created
+            cursor.executemany(sql, batch)
+            created += len(batch)
+
+
+def _months_back(today, count):
+    year, month = today.year, today.month
+    months = []
+    for _ in range(count):
+        months.append((year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(months))
+
+
+def _school_days(today, count):
+    days = []
+    day = today
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return list(reversed(days))
+
+
+class Command(BaseCommand):
+    help = 'Generate a realistic synthetic school dataset with bulk inserts (no barcodes or per-row password hashing)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=20000)
+        parser.add_argument('--teachers', type=int, default=40)
+        parser.add_argument('--grades', default='6,7,8,9,10,11')
+        parser.add_argument('--subjects-per-grade', type=int, default=6)
+        parser.add_argument('--subjects-per-student', type=int, default=4)
+        parser.add_argument('--years', type=int, default=2, help='Years of payment and exam history')
+        parser.add_argument('--attendance-days', type=int, default=60, help='School days of attendance history')
+        parser.add_argument('--attendance-rate', type=float, default=0.9)
+        parser.add_argument('--payment-rate', type=float, default=0.9)
+        parser.add_argument('--quizzes-per-subject', type=int, default=2)
+        parser.add_argument('--questions-per-quiz', type=int, default=10)
+        parser.add_argument('--attempt-rate', type=float, default=0.5)
+        parser.add_argument('--exams-per-year', type=int, default=3)
+        parser.add_argument('--password', default='password123', help='Shared password for every generated user')
+        parser.add_argument('--prefix', default='syn', help='Username prefix for generated users')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--force', action='store_true', help='Generate even if the database already has students')
+    
+    def handle(self, *args, **options):
+        if options['teachers'] < 1:
+            raise CommandError('At least one teacher is required')
+        if Student.objects.exists() and not options['force']:
+            raise CommandError('Database already has students; point DB_NAME at a scratch database or pass --force')
+        
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = date.today()
+        self.password = make_password(options['password'])
+        started = time.perf_counter()
+        
+        owner = self.stage('owner', self.create_owner)
+        teachers = self.stage('teachers', self.create_teachers)
+        subjects = self.stage('subjects', self.create_subjects, teachers)
+        students = self.stage('students', self.create_students)
+        enrollments = self.stage('enrollments', self.create_enrollments, students, subjects)
+        self.stage('payments', self.create_payments, enrollments, subjects)
+        self.stage('attendance', self.create_attendance, students, owner)
+        self.stage('notes and videos', self.create_content, subjects)
+        quizzes = self.stage('quizzes', self.create_quizzes, subjects)
+        self.stage('quiz attempts', self.create_attempts, quizzes, enrollments)
+        self.stage('exam results', self.create_exam_results, enrollments, subjects)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated dataset in {time.perf_counter() - started:.1f}s; "
+            f"log in as {owner.username} / {options['password']}"
+        ))
+    
+    def stage(self, label, func, *args):
+        started = time.perf_counter()
+        with transaction.atomic():
+            result = func(*args)
+        if isinstance(result, int):
+            count = result
+        elif isinstance(result, dict):
+            count = sum(len(value) for value in result.values())
+        elif isinstance(result, list):
+            count = len(result)
+        else:
+            count = 1
+        self.stdout.write(f"{label:>16}: {count:>9} rows in {time.perf_counter() - started:.1f}s")
+        return result
+    
+    def insert(self, model, field_names, rows):
+        return insert_rows(model, field_names, rows, self.batch_size)
+    
+    def moment(self, day, start_hour=7, end_hour=18):
+        seconds = self.rng.randint(start_hour * 3600, end_hour * 3600 - 1)
+        return timezone.make_aware(datetime.combine(day, dt_time(seconds // 3600, seconds % 3600 // 60, seconds % 60)))
+    
+    def name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+    
+    def create_owner(self):
+        return User.objects.create(
+            username=f"{self.options['prefix']}-owner", password=self.password, role='owner',
+            first_name='Synthetic', last_name='Owner'
+        )
+    
+    def create_teachers(self):
+        prefix = self.options['prefix']
+        users = []
+        for i in range(self.options['teachers']):
+            first_name, last_name = self.name()
+            users.append(User(username=f'{prefix}-t{i}', password=self.password, role='teacher',
+                              first_name=first_name, last_name=last_name))
+        users = User.objects.bulk_create(users, batch_size=self.batch_size)
+        return Teacher.objects.bulk_create([
+            Teacher(user=user, specialization=SUBJECT_NAMES[i % len(SUBJECT_NAMES)]) for i, user in enumerate(users)
+        ])
+    
+    def create_subjects(self, teachers):
+        grades = [grade.strip() for grade in self.options['grades'].split(',') if grade.strip()]
+        names = SUBJECT_NAMES[:self.options['subjects_per_grade']]
+        existing = {(s.name, s.grade): s for s in Subject.objects.filter(grade__in=grades, name__in=names)}
+        new = []
+        for i, (grade, name) in enumerate((grade, name) for grade in grades for name in names):
+            if (name, grade) not in existing:
+                new.append(Subject(name=name, grade=grade, teacher=teachers[i % len(teachers)],
+                                   fee=self.rng.choice(FEES), description=f'{name} for grade {grade}'))
+        Subject.objects.bulk_create(new)
+        subjects = list(existing.values()) + new
+        by_grade = {}
+        for subject in subjects:
+            by_grade.setdefault(subject.grade, []).append(subject)
+        return by_grade
+    
+    def create_students(self):
+        prefix = self.options['prefix']
+        grades = [grade.strip() for grade in self.options['grades'].split(',') if grade.strip()]
+        count = self.options['students']
+        users = []
+        for i in range(count):
+            first_name, last_name = self.name()
+            users.append(User(username=f'{prefix}-s{i}', password=self.password, role='student',
+                              first_name=first_name, last_name=last_name))
+        users = User.objects.bulk_create(users, batch_size=self.batch_size)
+        students = Student.objects.bulk_create([
+            Student(
+                user=user,
+                register_number=f'{prefix.upper()}{i:07d}',
+                barcode='barcodes/synthetic.png',
+                grade=self.rng.choice(grades),
+                parent_phone=f'07{i:08d}',
+                date_of_birth=date(self.today.year - 12, 1, 1) + timedelta(days=self.rng.randint(0, 6 * 365)),
+            )
+            for i, user in enumerate(users)
+        ], batch_size=self.batch_size)
+        # Per-student ability drives quiz and exam scores so rankings and analytics have shape.
+        self.ability = {student.id: min(0.98, max(0.05, self.rng.gauss(0.65, 0.15))) for student in students}
+        return students
+    
+    def create_enrollments(self, students, subjects):
+        history_start = self.today - timedelta(days=365 * self.options['years'])
+        enrollments = []
+        for student in students:
+            available = subjects.get(student.grade, [])
+            for subject in self.rng.sample(available, min(self.options['subjects_per_student'], len(available))):
+                enrollments.append((student.id, subject.id))
+        self.insert(StudentSubject, ['student_id', 'subject_id', 'enrolled_date', 'is_paid_current_month'], (
+            (student_id, subject_id, self.moment(history_start + timedelta(days=self.rng.randint(0, 30))), False)
+            for student_id, subject_id in enrollments
+        ))
+        return enrollments
+    
+    def create_payments(self, enrollments, subjects):
+        fees = {subject.id: subject.fee for grade_subjects in subjects.values() for subject in grade_subjects}
+        months = _months_back(self.today, 12 * self.options['years'])
+        rate = self.options['payment_rate']
+        
+        def payments():
+            for student_id, subject_id in enrollments:
+                for year, month in months:
+                    if self.rng.random() >= rate:
+                        continue
+                    paid_on = min(date(year, month, self.rng.randint(1, 10)), self.today)
+                    yield student_id, subject_id, fees[subject_id], month, year, paid_on, self.moment(paid_on)
+        
+        created = self.insert(
+            Payment, ['student_id', 'subject_id', 'amount', 'month', 'year', 'payment_date', 'created_at'], payments()
+        )
+        payments_for = Payment.objects.filter(student_id=OuterRef('student_id'), subject_id=OuterRef('subject_id'))
+        generated = StudentSubject.objects.filter(student__register_number__startswith=self.options['prefix'].upper())
+        generated.update(
+            last_payment_date=Subquery(payments_for.order_by('-payment_date').values('payment_date')[:1]),
+        )
+        BillingService.rollover(force=True)
+        return created
+    
+    def create_attendance(self, students, owner):
+        days = _school_days(self.today, self.options['attendance_days'])
+        rate = self.options['attendance_rate']
+        
+        def records():
+            for day in days:
+                for student in students:
+                    if self.rng.random() < rate:
+                        arrived = self.moment(day, 7, 9)
+                        yield student.id, day, arrived.time(), owner.id, arrived
+        
+        return self.insert(Attendance, ['student_id', 'date', 'time', 'marked_by_id', 'created_at'], records())
+    
+    def create_content(self, subjects):
+        notes, videos = [], []
+        for grade_subjects in subjects.values():
+            for subject in grade_subjects:
+                for number in range(1, 4):
+                    notes.append(Note(subject=subject, teacher_id=subject.teacher_id, title=f'{subject.name} notes {number}',
+                                      content=f'Lesson {number} summary for grade {subject.grade} {subject.name}.'))
+                    videos.append(Video(subject=subject, teacher_id=subject.teacher_id,
+                                        title=f'{subject.name} lesson {number}',
+                                        url=f'https://videos.example.com/{subject.grade}/{subject.id}/{number}'))
+        return len(Note.objects.bulk_create(notes)) + len(Video.objects.bulk_create(videos))
+    
+    def create_quizzes(self, subjects):
+        quizzes = []
+        per_subject = self.options['quizzes_per_subject']
+        question_count = self.options['questions_per_quiz']
+        for grade_subjects in subjects.values():
+            for subject in grade_subjects:
+                for number in range(1, per_subject + 1):
+                    questions = [
+                        {'id': q, 'question': f'{subject.name} question {q}', 'options': OPTIONS,
+                         'correct_answer': self.rng.choice(OPTIONS)}
+                        for q in range(1, question_count + 1)
+                    ]
+                    quizzes.append(Quiz(subject=subject, teacher_id=subject.teacher_id,
+                                        title=f'{subject.name} quiz {number}', questions=questions,
+                                        total_marks=question_count * 2, shuffle_options=number % 2 == 0))
+        return Quiz.objects.bulk_create(quizzes, batch_size=self.batch_size)
+    
+    def create_attempts(self, quizzes, enrollments):
+        enrolled = {}
+        for student_id, subject_id in enrollments:
+            enrolled.setdefault(subject_id, []).append(student_id)
+        rate = self.options['attempt_rate']
+        
+        def attempts():
+            for quiz in quizzes:
+                for student_id in enrolled.get(quiz.subject_id, []):
+                    if self.rng.random() >= rate:
+                        continue
+                    ability = self.ability[student_id]
+                    answers = {}
+                    correct = 0
+                    for question in quiz.questions:
+                        if self.rng.random() < 0.03:
+                            continue
+                        if self.rng.random() < ability:
+                            answers[str(question['id'])] = question['correct_answer']
+                            correct += 1
+                        else:
+                            answers[str(question['id'])] = self.rng.choice(
+                                [option for option in OPTIONS if option != question['correct_answer']]
+                            )
+                    score = Decimal(correct * quiz.total_marks) / len(quiz.questions)
+                    attempted_at = self.moment(self.today - timedelta(days=self.rng.randint(0, 90)))
+                    yield quiz.id, student_id, answers, score.quantize(Decimal('0.01')), attempted_at
+        
+        created = self.insert(QuizAttempt, ['quiz_id', 'student_id', 'answers', 'score', 'attempted_at'], attempts())
+        for quiz in quizzes:
+            QuizAnalyticsService.recompute(quiz)
+        return created
+    
+    def create_exam_results(self, enrollments, subjects):
+        teachers = {subject.id: subject.teacher_id for grade_subjects in subjects.values() for subject in grade_subjects}
+        exams = []
+        for years_ago in range(self.options['years'] - 1, -1, -1):
+            year = self.today.year - years_ago
+            for term in range(1, self.options['exams_per_year'] + 1):
+                month = min(12, round(term * 12 / self.options['exams_per_year']))
+                exam_date = date(year, month, 15)
+                if exam_date <= self.today:
+                    exams.append((f'Term {term} {year}', exam_date))
+        
+        def results():
+            for exam_name, exam_date in exams:
+                recorded = self.moment(exam_date + timedelta(days=7))
+                for student_id, subject_id in enrollments:
+                    marks = min(100.0, max(0.0, self.rng.gauss(self.ability[student_id] * 100, 12)))
+                    yield (student_id, subject_id, exam_name, Decimal(f'{marks:.2f}'), Decimal('100.00'), exam_date,
+                           teachers[subject_id], recorded, recorded)
+        
+        return self.insert(ExamResult, [
+            'student_id', 'subject_id', 'exam_name', 'marks_obtained', 'total_marks', 'exam_date', 'teacher_id',
+            'created_at', 'updated_at'
+        ], results())
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.services import ReportCardService
+
+
+class Command(BaseCommand):
+    help = 'Render queued report card jobs and restart ones whose process stopped (safe to run from cron)'
+    
+    def handle(self, *args, **options):
+        processed = ReportCardService.run_queue()
+        if not processed:
+            self.stdout.write('No report card jobs to render')
+        for alias, job_id, outcome in processed:
+            self.stdout.write(self.style.SUCCESS(f'Report card job {job_id} ({alias}): {outcome}'))
@@ -0,0 +1,28 @@
+import io
+import json
+import sys
+import time
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Load the WSGI app and serve one request through it without a server; prints the timings as JSON'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='/api/students/', help='Path for the first request')
+    
+    def handle(self, *args, **options):
+        # manage.py has already configured Django, so `load` covers the handler, middleware and PRELOAD_APP warm-up
+        started = time.perf_counter()
+        from education_system.wsgi import application
+        loaded = time.perf_counter()
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': options['path'], 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        statuses = []
+        b''.join(application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+        finished = time.perf_counter()
+        self.stdout.write(json.dumps({'load': loaded - started, 'first_request': finished - loaded, 'status': statuses[0]}))
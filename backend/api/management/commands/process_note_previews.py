@@ -0,0 +1,30 @@
+from collections import Counter
+from concurrent.futures import wait
+from django.core.management.base import BaseCommand
+from api.models import Note
+from api.services import NotePreviewService
+
+
+class Command(BaseCommand):
+    help = 'Queue notes for preview, page count and text extraction and wait for the workers to finish'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every note that has a file')
+        parser.add_argument('--status', nargs='*', default=['', 'pending', 'processing', 'failed'],
+                            help='Preview statuses to (re)process when --all is not given')
+        parser.add_argument('--subject', type=int, help='Only process notes for this subject id')
+    
+    def handle(self, *args, **options):
+        notes = Note.objects.exclude(file='').exclude(file__isnull=True)
+        if not options['all']:
+            notes = notes.filter(preview_status__in=options['status'])
+        if options['subject']:
+            notes = notes.filter(subject_id=options['subject'])
+        
+        futures = NotePreviewService.enqueue(notes.values_list('id', flat=True))
+        self.stdout.write(f'Queued {len(futures)} notes')
+        wait(futures)
+        
+        outcomes = Counter(future.result() for future in futures)
+        summary = ', '.join(f'{count} {status}' for status, count in outcomes.items() if status) or 'nothing processed'
+        self.stdout.write(self.style.SUCCESS(f'Done: {summary}'))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from api.services import NoteStorageService
+
+
+class Command(BaseCommand):
+    help = 'Delete note blobs no longer referenced by any note and abandoned chunked uploads'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help='Only reclaim blobs and uploads untouched for this many hours')
+    
+    def handle(self, *args, **options):
+        result = NoteStorageService.reclaim(timedelta(hours=options['grace_hours']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Reclaimed {result['blobs']} blobs ({result['bytes']} bytes) and {result['uploads']} abandoned uploads"
+        ))
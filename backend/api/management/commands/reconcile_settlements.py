@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.branches import database_aliases, use_database
+from api.models import MonthlySettlement
+from api.services import SettlementService
+
+
+class Command(BaseCommand):
+    help = 'Check closed settlements against the payments now on record; exits non-zero if any changed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--month', type=int)
+        parser.add_argument('--year', type=int)
+    
+    def handle(self, *args, **options):
+        filters = {field: options[field] for field in ('month', 'year') if options[field] is not None}
+        mismatched = 0
+        for alias in database_aliases():
+            with use_database(alias):
+                for settlement in MonthlySettlement.objects.filter(**filters).order_by('year', 'month', 'branch_id'):
+                    result = SettlementService.reconcile(settlement)
+                    if result['consistent']:
+                        continue
+                    mismatched += 1
+                    self.stdout.write(self.style.WARNING(
+                        f"[{alias}] {settlement}: closed with {result['closed']['payments']} payments totalling "
+                        f"{result['closed']['collected']}, now {result['current']['payments']} totalling "
+                        f"{result['current']['collected']}"
+                    ))
+                    for line in result['subjects']:
+                        self.stdout.write(f"    {line['subject_name'] or line['subject_id']}: "
+                                          f"{line['closed']['collected']} -> {line['current']['collected']}")
+        if mismatched:
+            raise CommandError(f"{mismatched} settlements no longer match their payments")
+        self.stdout.write(self.style.SUCCESS('All settlements match their payments'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from api.branches import database_aliases, use_database
+from api.services import BillingService
+
+
+class Command(BaseCommand):
+    help = "Recompute StudentSubject.is_paid_current_month for the current month in every branch database (safe to schedule daily)"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Enrollments updated per transaction')
+        parser.add_argument('--force', action='store_true', help='Recompute even if this month already rolled over')
+    
+    def handle(self, *args, **options):
+        for alias in database_aliases():
+            with use_database(alias):
+                result = BillingService.rollover(batch_size=options['batch_size'], force=options['force'])
+            run = result['run']
+            if result['status'] == 'skipped':
+                self.stdout.write(f"[{alias}] Billing already rolled over for {run.month}/{run.year} at {run.completed_at:%Y-%m-%d %H:%M}")
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"[{alias}] Rolled over {run.enrollments} enrollments for {run.month}/{run.year}: "
+                f"{run.marked_paid} marked paid, {run.marked_unpaid} marked unpaid"
+            ))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.services import BranchService
+
+
+class Command(BaseCommand):
+    help = ('Copy the branch registry and organisation owners into each dedicated branch database '
+            '(run `migrate --database <alias>` for a new database first)')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', help='Only this alias (repeatable)')
+    
+    def handle(self, *args, **options):
+        aliases = options['database'] or settings.BRANCH_DATABASES
+        if not aliases:
+            self.stdout.write('No branch databases configured (DB_BRANCHES)')
+        for alias in aliases:
+            if alias not in settings.BRANCH_DATABASES:
+                raise CommandError(f'{alias} is not a branch database; configured: {settings.BRANCH_DATABASES}')
+            try:
+                synced = BranchService.sync_database(alias)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f"{alias}: {synced['branches']} branches, {synced['owners']} organisation owners"
+            ))
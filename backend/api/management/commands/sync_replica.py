@@ -0,0 +1,35 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.replica import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica file (local stand-in for replication)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep syncing every N seconds; simulates replication lag')
+    
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('No replica configured; set DB_REPLICA_NAME')
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        if 'sqlite' not in primary['ENGINE'] or 'sqlite' not in replica['ENGINE']:
+            raise CommandError('The replication stand-in only supports SQLite primaries and replicas')
+        
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(str(primary['NAME']))
+            target = sqlite3.connect(str(replica['NAME']))
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            self.stdout.write(f'Synced replica in {(time.perf_counter() - started) * 1000:.1f} ms')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
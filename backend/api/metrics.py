@@ -0,0 +1,250 @@
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse
+from rest_framework.serializers import BaseSerializer
+
+slow_query_logger = logging.getLogger('api.slow_queries')
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('view', 'queries', 'db_seconds', 'serializer_seconds', 'serializer_depth', 'slow_queries')
+    
+    def __init__(self):
+        self.view = 'unresolved'
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+        self.slow_queries = 0
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class MetricsRegistry:
+    """Per-process aggregates; with several workers, each process reports its own series."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.latency = {}
+            self.query_counts = {}
+            self.db_seconds = defaultdict(float)
+            self.serializer_seconds = defaultdict(float)
+            self.slow_queries = defaultdict(int)
+    
+    def observe(self, metrics, method, status, duration):
+        view = metrics.view
+        with self._lock:
+            self.requests[(view, method, status)] += 1
+            latency = self.latency.get((view, method))
+            if latency is None:
+                latency = self.latency[(view, method)] = Histogram(settings.METRICS_LATENCY_BUCKETS)
+            latency.observe(duration)
+            queries = self.query_counts.get(view)
+            if queries is None:
+                queries = self.query_counts[view] = Histogram(QUERY_COUNT_BUCKETS)
+            queries.observe(metrics.queries)
+            self.db_seconds[view] += metrics.db_seconds
+            self.serializer_seconds[view] += metrics.serializer_seconds
+            self.slow_queries[view] += metrics.slow_queries
+    
+    def _histogram_lines(self, name, histograms, label_names):
+        for key, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+            for bound, count in histogram.cumulative():
+                yield f'{name}_bucket{_labels(**labels, le=bound)} {count}'
+            yield f'{name}_sum{_labels(**labels)} {histogram.sum:.6f}'
+            yield f'{name}_count{_labels(**labels)} {histogram.count}'
+    
+    def render(self):
+        with self._lock:
+            lines = [
+                '# HELP http_requests_total Requests handled, by view, method and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+            
+            lines += [
+                '# HELP http_request_duration_seconds Request latency, by view and method.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            lines += self._histogram_lines('http_request_duration_seconds', self.latency, ('view', 'method'))
+            
+            lines += [
+                '# HELP http_request_db_queries SQL queries issued per request, by view.',
+                '# TYPE http_request_db_queries histogram',
+            ]
+            lines += self._histogram_lines('http_request_db_queries', self.query_counts, ('view',))
+            
+            for name, help_text, values in (
+                ('http_request_db_duration_seconds_total', 'Time spent executing SQL, by view.', self.db_seconds),
+                ('http_request_serializer_duration_seconds_total',
+                 'Time spent producing serializer data (including queries it triggers), by view.',
+                 self.serializer_seconds),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                lines += [f'{name}{_labels(view=view)} {value:.6f}' for view, value in sorted(values.items())]
+            
+            lines += [
+                '# HELP db_slow_queries_total Queries slower than SLOW_QUERY_THRESHOLD_MS, by view.',
+                '# TYPE db_slow_queries_total counter',
+            ]
+            lines += [f'db_slow_queries_total{_labels(view=view)} {count}' for view, count in sorted(self.slow_queries.items())]
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.db_seconds += elapsed
+        # executemany batches are long by design, so only single statements count as slow
+        if not many and elapsed * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+            if metrics is not None:
+                metrics.slow_queries += 1
+            slow_query_logger.warning(
+                'Slow query (%.1f ms) in view %s: %s',
+                elapsed * 1000, metrics.view if metrics is not None else '-', sql[:2000]
+            )
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Connections are per thread, so hook each one as it opens; the wrapper finds the
+    # active request through the context variable, which sync_to_async carries over.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_serializers():
+    original = BaseSerializer.data
+    if getattr(original.fget, 'instrumented', False):
+        return
+    
+    def data(self):
+        metrics = _current.get()
+        if metrics is None or metrics.serializer_depth:
+            return original.fget(self)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_seconds += time.perf_counter() - started
+    
+    data.instrumented = True
+    BaseSerializer.data = property(data)
+
+
+def _server_timing(metrics, duration):
+    return ', '.join([
+        f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.queries} queries"',
+        f'serialize;dur={metrics.serializer_seconds * 1000:.1f}',
+        f'total;dur={duration * 1000:.1f}',
+    ])
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view = request.resolver_match.view_name or view_func.__name__
+        return None
+    
+    def _finish(self, request, response, metrics, started):
+        duration = time.perf_counter() - started
+        registry.observe(metrics, request.method, response.status_code, duration)
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = _server_timing(metrics, duration)
+        return response
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, started)
+    
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, started)
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        raise Http404('Metrics are disabled until METRICS_TOKEN is set')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_payment_month'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempt_count', models.IntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_sq_sum', models.FloatField(default=0)),
+                ('score_histogram', models.JSONField(default=list)),
+                ('question_stats', models.JSONField(default=dict)),
+                ('quiz_updated_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='api.quiz')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_note_blobs_and_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='extracted_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='preview',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to='notes/previews/'),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='preview_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('unsupported', 'Unsupported'), ('failed', 'Failed')], max_length=12),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:36
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_payments(apps, schema_editor):
+    # Payments could be recorded twice for the same month before the constraint existed;
+    # the earliest row keeps the combined amount so no money is lost.
+    Payment = apps.get_model('api', 'Payment')
+    payments = Payment.objects.using(schema_editor.connection.alias)
+    duplicates = (
+        payments.values('student_id', 'subject_id', 'month', 'year')
+        .annotate(rows=Count('id'), keep=Min('id')).filter(rows__gt=1)
+    )
+    for group in duplicates:
+        rows = payments.filter(student_id=group['student_id'], subject_id=group['subject_id'],
+                               month=group['month'], year=group['year'])
+        kept = rows.get(id=group['keep'])
+        kept.amount = sum(row.amount for row in rows)
+        kept.save(update_fields=['amount'])
+        rows.exclude(id=kept.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_note_previews'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['date'], name='attendance_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examresult',
+            index=models.Index(fields=['student', 'exam_date'], name='examresult_student_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examresult',
+            index=models.Index(fields=['subject', 'exam_name', 'exam_date'], name='examresult_subject_exam_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['register_number', 'created_at'], name='otp_register_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['month', 'year'], name='payment_month_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['student', 'month', 'year'], name='payment_student_month_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['student', 'attempted_at'], name='quizattempt_student_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_payments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(fields=('student', 'subject', 'month', 'year'), name='unique_payment_per_month'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRollover',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('started_at', models.DateTimeField()),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('enrollments', models.IntegerField(default=0)),
+                ('marked_paid', models.IntegerField(default=0)),
+                ('marked_unpaid', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='studentsubject',
+            index=models.Index(condition=models.Q(('is_paid_current_month', True)), fields=['student'], name='studentsubject_paid_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='billingrollover',
+            constraint=models.UniqueConstraint(fields=('year', 'month'), name='unique_billing_rollover_period'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    
+    dependencies = [
+        ('api', '0010_fee_reminder_campaigns'),
+    ]
+    
+    operations = [
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=8, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('database', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='subject',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='feeremindercampaign',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='api.branch'),
+        ),
+        migrations.AddField(
+            model_name='reportcardjob',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='api.branch'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='students', to='api.branch'),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='subjects', to='api.branch'),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='teachers', to='api.branch'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='users', to='api.branch'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='subject',
+            unique_together={('branch', 'name', 'grade')},
+        ),
+    ]
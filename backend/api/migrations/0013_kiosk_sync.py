@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:38
+
+import api.models
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_domain_events'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendance',
+            name='date',
+            field=models.DateField(default=datetime.date.today, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='time',
+            field=models.TimeField(default=api.models.current_time, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='domainevent',
+            name='kind',
+            field=models.CharField(choices=[('payment_recorded', 'Payment recorded'), ('attendance_marked', 'Attendance marked'), ('exam_result_saved', 'Exam result saved'), ('exam_result_deleted', 'Exam result deleted'), ('student_saved', 'Student saved'), ('student_removed', 'Student removed')], max_length=30),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_kiosk_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySettlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('teacher_share_ratio', models.DecimalField(decimal_places=4, max_digits=5)),
+                ('payment_count', models.IntegerField()),
+                ('total_collected', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('teacher_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('owner_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('subjects', models.JSONField(default=list)),
+                ('teachers', models.JSONField(default=dict)),
+                ('payments_digest', models.CharField(max_length=64)),
+                ('closed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.branch')),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='monthlysettlement',
+            constraint=models.UniqueConstraint(fields=('branch', 'year', 'month'), name='unique_settlement_per_branch'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlysettlement',
+            constraint=models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('year', 'month'), name='unique_settlement_all_branches'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_monthly_settlements'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='subject',
+            constraint=models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('name', 'grade'), name='unique_subject_without_branch'),
+        ),
+    ]
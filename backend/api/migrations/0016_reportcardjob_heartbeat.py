@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_subject_unique_without_branch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportcardjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,11 +1,31 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractUser
-import barcode
-from barcode.writer import ImageWriter
 from io import BytesIO
 from django.core.files import File
 import random
 import string
+import uuid
+from pathlib import Path
+from django.conf import settings
+from django.utils import timezone
+from datetime import date, datetime
+from .branches import REGISTER_NUMBER_SEPARATOR, get_branch
+
+
+def current_time():
+    return datetime.now().time()
+
+
+class Branch(models.Model):
+    code = models.CharField(max_length=8, unique=True)
+    name = models.CharField(max_length=100)
+    # Alias in settings.DATABASES holding this branch's rows; blank for the default database
+    database = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.code} - {self.name}"
+
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -15,6 +35,8 @@ class User(AbstractUser):
     )
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     phone = models.CharField(max_length=15, blank=True, null=True)
+    # Owners without a branch manage every branch
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='users')
     
     def __str__(self):
         return f"{self.username} ({self.role})"
@@ -22,6 +44,7 @@ class User(AbstractUser):
 
 class Student(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='student_profile')
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='students')
     register_number = models.CharField(max_length=20, unique=True, editable=False)
     barcode = models.ImageField(upload_to='barcodes/', blank=True)
     grade = models.CharField(max_length=10)
@@ -32,10 +55,17 @@ class Student(models.Model):
     
     def generate_register_number(self):
         prefix = 'STU'
+        branch = get_branch(branch_id=self.branch_id) if self.branch_id else None
+        if branch:
+            prefix = f"{branch['code']}{REGISTER_NUMBER_SEPARATOR}{prefix}"
         random_part = ''.join(random.choices(string.digits, k=6))
         return f"{prefix}{random_part}"
     
     def generate_barcode(self):
+        # Imported here so processes that never create students skip the PIL stack
+        import barcode
+        from barcode.writer import ImageWriter
+        
         CODE128 = barcode.get_barcode_class('code128')
         rv = BytesIO()
         CODE128(self.register_number, writer=ImageWriter()).write(rv)
@@ -58,6 +88,7 @@ class Student(models.Model):
 
 class Teacher(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='teacher_profile')
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='teachers')
     specialization = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -66,6 +97,7 @@ class Teacher(models.Model):
 
 
 class Subject(models.Model):
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='subjects')
     name = models.CharField(max_length=100)
     grade = models.CharField(max_length=10)
     teacher = models.ForeignKey(Teacher, on_delete=models.SET_NULL, null=True, related_name='subjects')
@@ -74,7 +106,12 @@ class Subject(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = ('name', 'grade')
+        unique_together = ('branch', 'name', 'grade')
+        constraints = [
+            # NULLs are distinct in the constraint above, so unassigned subjects need their own
+            models.UniqueConstraint(fields=['name', 'grade'], condition=models.Q(branch__isnull=True),
+                                    name='unique_subject_without_branch'),
+        ]
     
     def __str__(self):
         return f"{self.name} - Grade {self.grade}"
@@ -89,6 +126,11 @@ class StudentSubject(models.Model):
     
     class Meta:
         unique_together = ('student', 'subject')
+        indexes = [
+            # Partial, so "paid this month" filters scan only the paid rows
+            models.Index(fields=['student'], condition=models.Q(is_paid_current_month=True),
+                         name='studentsubject_paid_idx'),
+        ]
     
     def is_paid_for_month(self, month=None, year=None):
         from datetime import date
@@ -117,6 +159,15 @@ class Payment(models.Model):
     year = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'subject', 'month', 'year'], name='unique_payment_per_month'),
+        ]
+        indexes = [
+            models.Index(fields=['month', 'year'], name='payment_month_year_idx'),
+            models.Index(fields=['student', 'month', 'year'], name='payment_student_month_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.student.register_number} - {self.subject.name} - {self.month}/{self.year}"
     
@@ -127,24 +178,50 @@ class Payment(models.Model):
 
 class Attendance(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='attendance_records')
-    date = models.DateField(auto_now_add=True)
-    time = models.TimeField(auto_now_add=True)
+    # Defaults rather than auto_now_add so kiosk scans synced later keep when they happened
+    date = models.DateField(default=date.today, editable=False)
+    time = models.TimeField(default=current_time, editable=False)
     marked_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         unique_together = ('student', 'date')
+        indexes = [
+            models.Index(fields=['date'], name='attendance_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.student.register_number} - {self.date}"
 
 
+class NoteBlob(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='notes/blobs/', max_length=255)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.sha256} ({self.size} bytes)"
+
+
 class Note(models.Model):
+    PREVIEW_STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('unsupported', 'Unsupported'),
+        ('failed', 'Failed'),
+    )
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='notes')
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='uploaded_notes')
     title = models.CharField(max_length=200)
     content = models.TextField(blank=True)
-    file = models.FileField(upload_to='notes/', null=True, blank=True)
+    file = models.FileField(upload_to='notes/', null=True, blank=True, max_length=255)
+    blob = models.ForeignKey(NoteBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='notes')
+    preview = models.ImageField(upload_to='notes/previews/', null=True, blank=True, max_length=255)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    extracted_text = models.TextField(blank=True)
+    preview_status = models.CharField(max_length=12, choices=PREVIEW_STATUS_CHOICES, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -152,6 +229,30 @@ class Note(models.Model):
         return f"{self.title} - {self.subject.name}"
 
 
+class NoteUpload(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('completed', 'Completed'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='note_uploads')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received_size = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    blob = models.ForeignKey(NoteBlob, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def temp_path(self):
+        return Path(settings.NOTE_UPLOAD_TEMP_DIR) / f'{self.id}.part'
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received_size}/{self.total_size})"
+
+
 class Video(models.Model):
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='videos')
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='uploaded_videos')
@@ -173,6 +274,8 @@ class Quiz(models.Model):
     questions = models.JSONField()
     total_marks = models.IntegerField()
     duration_minutes = models.IntegerField(default=30)
+    shuffle_questions = models.BooleanField(default=False)
+    shuffle_options = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -187,6 +290,11 @@ class QuizAttempt(models.Model):
     score = models.DecimalField(max_digits=5, decimal_places=2)
     attempted_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'attempted_at'], name='quizattempt_student_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.student.register_number} - {self.quiz.title} - {self.score}"
 
@@ -202,8 +310,39 @@ class ExamResult(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'exam_date'], name='examresult_student_date_idx'),
+            models.Index(fields=['subject', 'exam_name', 'exam_date'], name='examresult_subject_exam_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.student.register_number} - {self.subject.name} - {self.exam_name}"
+    
+    def event_payload(self):
+        return {
+            'result_id': self.pk,
+            'student_id': self.student_id,
+            'subject_id': self.subject_id,
+            'exam_name': self.exam_name,
+            'exam_date': str(self.exam_date),
+            'marks_obtained': str(self.marks_obtained),
+            'total_marks': str(self.total_marks),
+        }
+    
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(ExamResult, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            DomainEvent.record('exam_result_saved', self.subject.branch_id, using=using, **self.event_payload())
+    
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(ExamResult, instance=self)
+        payload = self.event_payload()
+        with transaction.atomic(using=using):
+            deleted = super().delete(*args, **kwargs)
+            DomainEvent.record('exam_result_deleted', self.subject.branch_id, using=using, **payload)
+        return deleted
 
 
 class OTP(models.Model):
@@ -213,5 +352,224 @@ class OTP(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_verified = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['register_number', 'created_at'], name='otp_register_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.phone} - {self.otp_code}"
+
+
+class QuizStatistics(models.Model):
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, related_name='statistics')
+    attempt_count = models.IntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_sq_sum = models.FloatField(default=0)
+    score_histogram = models.JSONField(default=list)
+    question_stats = models.JSONField(default=dict)
+    quiz_updated_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.quiz.title} - {self.attempt_count} attempts"
+
+
+class ReportCardJob(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
+    grade = models.CharField(max_length=10)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    month = models.IntegerField()
+    year = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    archive = models.FileField(upload_to='report_cards/', null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Grade {self.grade} report cards ({self.status})"
+
+
+class BillingRollover(models.Model):
+    """Marks the month StudentSubject.is_paid_current_month was last recomputed for."""
+    month = models.IntegerField()
+    year = models.IntegerField()
+    started_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+    enrollments = models.IntegerField(default=0)
+    marked_paid = models.IntegerField(default=0)
+    marked_unpaid = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'month'], name='unique_billing_rollover_period'),
+        ]
+    
+    def __str__(self):
+        return f"Billing rollover {self.month}/{self.year}"
+
+
+class FeeReminderCampaign(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('paused', 'Paused'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
+        ('failed', 'Failed'),
+    )
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
+    month = models.IntegerField()
+    year = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.IntegerField(default=0)
+    sent = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Fee reminders {self.month}/{self.year} ({self.status})"
+
+
+class FeeReminderRecipient(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('simulated', 'Simulated'),
+        ('failed', 'Failed'),
+    )
+    campaign = models.ForeignKey(FeeReminderCampaign, on_delete=models.CASCADE, related_name='recipients')
+    parent_phone = models.CharField(max_length=15)
+    message = models.TextField()
+    items = models.JSONField(default=list)
+    amount_due = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    sid = models.CharField(max_length=64, blank=True)
+    error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'parent_phone'], name='unique_reminder_recipient'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'status'], name='reminder_campaign_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.parent_phone} ({self.status})"
+
+
+class DomainEvent(models.Model):
+    """Append-only log of payments, attendance and exam results; the id is the event's offset.
+    
+    Written in the same transaction as the change it describes, so consumers that follow the
+    log see every committed change exactly once and nothing that was rolled back.
+    """
+    KIND_CHOICES = (
+        ('payment_recorded', 'Payment recorded'),
+        ('attendance_marked', 'Attendance marked'),
+        ('exam_result_saved', 'Exam result saved'),
+        ('exam_result_deleted', 'Exam result deleted'),
+        ('student_saved', 'Student saved'),
+        ('student_removed', 'Student removed'),
+    )
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    payload = models.JSONField(default=dict)
+    occurred_at = models.DateTimeField(default=timezone.now)
+    
+    @classmethod
+    def record(cls, kind, branch_id=None, using=None, **payload):
+        return cls.objects.using(using).create(kind=kind, branch_id=branch_id, payload=payload)
+    
+    def __str__(self):
+        return f"#{self.id} {self.kind}"
+
+
+class EventCheckpoint(models.Model):
+    """Offset of the last DomainEvent a consumer has applied."""
+    consumer = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.consumer} @ {self.position}"
+
+
+class DailyActivity(models.Model):
+    """Per-day, per-branch counters maintained from the event log by DailyActivityConsumer."""
+    date = models.DateField()
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    payments = models.IntegerField(default=0)
+    income = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    attendance = models.IntegerField(default=0)
+    exam_results = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'branch'], name='unique_daily_activity'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} ({self.branch_id or 'unassigned'})"
+
+
+class MonthlySettlement(models.Model):
+    """Teacher and owner shares of one closed month, computed once and never changed.
+    
+    ``branch`` is null for the statement covering every branch in the database. Amounts in
+    ``subjects`` and ``teachers`` are decimal strings; ``payments_digest`` fingerprints the
+    payments it was computed from, for reconciliation.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    month = models.IntegerField()
+    year = models.IntegerField()
+    teacher_share_ratio = models.DecimalField(max_digits=5, decimal_places=4)
+    payment_count = models.IntegerField()
+    total_collected = models.DecimalField(max_digits=12, decimal_places=2)
+    teacher_total = models.DecimalField(max_digits=12, decimal_places=2)
+    owner_total = models.DecimalField(max_digits=12, decimal_places=2)
+    subjects = models.JSONField(default=list)
+    teachers = models.JSONField(default=dict)
+    payments_digest = models.CharField(max_length=64)
+    closed_at = models.DateTimeField(default=timezone.now)
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'year', 'month'], name='unique_settlement_per_branch'),
+            models.UniqueConstraint(fields=['year', 'month'], condition=models.Q(branch__isnull=True),
+                                    name='unique_settlement_all_branches'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Settlements are immutable once closed')
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError('Settlements are immutable once closed')
+    
+    def __str__(self):
+        return f"Settlement {self.month:02d}/{self.year} ({self.branch_id or 'all branches'})"
@@ -0,0 +1,66 @@
+import io
+import os
+
+PREVIEW_SIZE = (480, 640)
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv'}
+
+
+class UnsupportedFile(Exception):
+    pass
+
+
+def _thumbnail_png(image):
+    image.thumbnail(PREVIEW_SIZE)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def _extract_pdf(path, max_text_length):
+    try:
+        import pymupdf
+    except ImportError:
+        raise UnsupportedFile('PDF previews require PyMuPDF')
+    from PIL import Image
+    
+    with pymupdf.open(path) as document:
+        preview = None
+        if document.page_count:
+            pixmap = document[0].get_pixmap(dpi=72)
+            preview = _thumbnail_png(Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples))
+        
+        text = []
+        length = 0
+        for page in document:
+            if length >= max_text_length:
+                break
+            page_text = page.get_text()
+            text.append(page_text)
+            length += len(page_text)
+        return {'page_count': document.page_count, 'text': ''.join(text)[:max_text_length], 'preview': preview}
+
+
+def _extract_image(path):
+    from PIL import Image
+    
+    with Image.open(path) as image:
+        return {'page_count': getattr(image, 'n_frames', 1), 'text': '', 'preview': _thumbnail_png(image)}
+
+
+def _extract_text(path, max_text_length):
+    with open(path, encoding='utf-8', errors='replace') as text_file:
+        return {'page_count': 1, 'text': text_file.read(max_text_length), 'preview': None}
+
+
+def extract(path, max_text_length):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.pdf':
+        return _extract_pdf(path, max_text_length)
+    if extension in IMAGE_EXTENSIONS:
+        return _extract_image(path)
+    if extension in TEXT_EXTENSIONS:
+        return _extract_text(path, max_text_length)
+    raise UnsupportedFile(f'No preview support for {extension or "files without an extension"}')
@@ -12,6 +12,11 @@ class IsStudent(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_authenticated and request.user.role == 'student'
 
+class IsOrganizationOwner(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return (request.user and request.user.is_authenticated and request.user.role == 'owner'
+                and request.user.branch_id is None)
+
 class IsOwnerOrTeacher(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_authenticated and request.user.role in ['owner', 'teacher']
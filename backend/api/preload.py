@@ -0,0 +1,79 @@
+"""Warm per-process caches before a server forks its workers.
+
+Everything here is process-local state that Django and DRF otherwise build on
+the first request each worker serves. Nothing touches the database, so no
+connection is opened in the parent and inherited by forked children.
+"""
+import importlib
+import inspect
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.db import connections
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework import serializers
+from rest_framework.settings import api_settings as drf_settings, IMPORT_STRINGS as DRF_IMPORT_STRINGS
+from rest_framework_simplejwt.settings import api_settings as jwt_settings, IMPORT_STRINGS as JWT_IMPORT_STRINGS
+
+
+def _walk_patterns(resolver):
+    for pattern in resolver.url_patterns:
+        # Route regexes are compiled lazily on first access
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            yield from _walk_patterns(pattern)
+        elif isinstance(pattern, URLPattern):
+            yield pattern
+
+
+def warm_url_resolvers():
+    resolver = get_resolver()
+    resolver.reverse_dict
+    return sum(1 for _ in _walk_patterns(resolver))
+
+
+def _warm_serializer(serializer):
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.BaseSerializer):
+            _warm_serializer(field)
+
+
+def warm_serializers():
+    from . import serializers as api_serializers
+    
+    count = 0
+    for _, serializer_class in inspect.getmembers(api_serializers, inspect.isclass):
+        if issubclass(serializer_class, serializers.BaseSerializer) and serializer_class.__module__ == api_serializers.__name__:
+            # Building the fields fills the model _meta caches (get_fields, relation tree) they read
+            _warm_serializer(serializer_class())
+            count += 1
+    return count
+
+
+def warm_api_settings():
+    for name in DRF_IMPORT_STRINGS:
+        getattr(drf_settings, name)
+    for name in JWT_IMPORT_STRINGS:
+        getattr(jwt_settings, name)
+    get_hashers()
+
+
+def import_optional_modules():
+    for module in settings.PRELOAD_MODULES:
+        importlib.import_module(module)
+    return len(settings.PRELOAD_MODULES)
+
+
+def preload():
+    started = time.perf_counter()
+    summary = {
+        'modules': import_optional_modules(),
+        'url_patterns': warm_url_resolvers(),
+        'serializers': warm_serializers(),
+    }
+    warm_api_settings()
+    connections.close_all()
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
@@ -0,0 +1,101 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+
+REPLICA_ALIAS = 'replica'
+
+_use_replica = ContextVar('use_replica', default=False)
+_wrote = ContextVar('wrote', default=False)
+
+
+def _sticky_key(user_id):
+    return f"replica-sticky:{user_id}"
+
+
+def is_sticky(user):
+    return bool(user and user.is_authenticated and cache.get(_sticky_key(user.pk)))
+
+
+@contextmanager
+def read_from_replica(user=None):
+    if REPLICA_ALIAS not in settings.DATABASES or is_sticky(user):
+        yield
+        return
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_reads(view):
+    """Route the view's reads to the replica unless the caller wrote recently."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with read_from_replica(request.user):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+    
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with read_from_replica(request.user):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return REPLICA_ALIAS
+        return None
+    
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return 'default'
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaStickinessMiddleware:
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def _mark_sticky(self, request):
+        user = getattr(request, 'user', None)
+        if _wrote.get() and user is not None and user.is_authenticated:
+            cache.set(_sticky_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            self._mark_sticky(request)
+            return response
+        finally:
+            _wrote.reset(token)
+    
+    async def __acall__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = await self.get_response(request)
+            if _wrote.get():
+                # request.user may still be the lazy session user, which hits the database.
+                await sync_to_async(self._mark_sticky)(request)
+            return response
+        finally:
+            _wrote.reset(token)
@@ -0,0 +1,52 @@
+"""Report card rendering.
+
+Kept free of Django imports so the functions can run in spawned worker
+processes that never configure Django; they only see plain dicts.
+"""
+from html import escape
+
+
+def _percentage(obtained, total):
+    return f"{obtained / total * 100:.1f}%" if total else '-'
+
+
+def render_report_card(card):
+    exam_rows = ''.join(
+        f"<tr><td>{escape(result['subject'])}</td><td>{escape(result['exam_name'])}</td>"
+        f"<td>{escape(result['exam_date'])}</td><td>{result['marks_obtained']:g} / {result['total_marks']:g}</td>"
+        f"<td>{_percentage(result['marks_obtained'], result['total_marks'])}</td></tr>"
+        for result in card['results']
+    ) or '<tr><td colspan="5">No exam results for this period</td></tr>'
+    
+    payment_rows = ''.join(
+        f"<tr><td>{escape(subject['name'])}</td><td>{'Paid' if subject['paid'] else 'Unpaid'}</td></tr>"
+        for subject in card['subjects']
+    ) or '<tr><td colspan="2">Not enrolled in any subject</td></tr>'
+    
+    html = f"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Report Card - {escape(card['register_number'])}</title></head>
+<body>
+<h1>Report Card</h1>
+<p><strong>{escape(card['name'])}</strong> ({escape(card['register_number'])}) - Grade {escape(card['grade'])}</p>
+<p>Period: {escape(card['start_date'])} to {escape(card['end_date'])}</p>
+<h2>Exam Results</h2>
+<table border="1" cellpadding="4">
+<tr><th>Subject</th><th>Exam</th><th>Date</th><th>Marks</th><th>Percentage</th></tr>
+{exam_rows}
+</table>
+<h2>Attendance</h2>
+<p>{card['days_present']} of {card['class_days']} class days ({_percentage(card['days_present'], card['class_days'])})</p>
+<h2>Fees for {escape(card['payment_period'])}</h2>
+<table border="1" cellpadding="4">
+<tr><th>Subject</th><th>Status</th></tr>
+{payment_rows}
+</table>
+</body>
+</html>
+"""
+    return f"{card['register_number']}.html", html.encode('utf-8')
+
+
+def render_batch(cards):
+    return [render_report_card(card) for card in cards]
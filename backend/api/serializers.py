@@ -1,11 +1,30 @@
 from rest_framework import serializers
-from .models import User, Student, Teacher, Subject, StudentSubject, Payment, Attendance, Note, Video, Quiz, QuizAttempt, ExamResult, OTP
+from django.conf import settings
+from .models import Branch, User, Student, Teacher, Subject, StudentSubject, Payment, Attendance, Note, Video, Quiz, QuizAttempt, ExamResult, OTP, ReportCardJob, NoteUpload, FeeReminderCampaign, FeeReminderRecipient, MonthlySettlement
+from .branches import current_branch, new_row_branch_id
+from .services import NoteStorageService, ReferenceDataCache
 from datetime import date
 
+class SubjectNameField(serializers.ReadOnlyField):
+    def __init__(self, **kwargs):
+        super().__init__(source='subject_id', **kwargs)
+    
+    def to_representation(self, subject_id):
+        subject = ReferenceDataCache.subject_info(subject_id)
+        return subject['name'] if subject else None
+
+class TeacherNameField(serializers.ReadOnlyField):
+    def __init__(self, **kwargs):
+        super().__init__(source='teacher_id', **kwargs)
+    
+    def to_representation(self, teacher_id):
+        return ReferenceDataCache.teacher_name(teacher_id)
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'phone']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'phone', 'branch']
+        read_only_fields = ['branch']
         extra_kwargs = {'password': {'write_only': True}}
 
 class StudentCreateSerializer(serializers.Serializer):
@@ -26,6 +45,7 @@ class StudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Student
         fields = '__all__'
+        read_only_fields = ['branch']
 
 class TeacherCreateSerializer(serializers.Serializer):
     username = serializers.CharField(required=True)
@@ -42,16 +62,30 @@ class TeacherSerializer(serializers.ModelSerializer):
     class Meta:
         model = Teacher
         fields = '__all__'
+        read_only_fields = ['branch']
 
 class SubjectSerializer(serializers.ModelSerializer):
-    teacher_name = serializers.CharField(source='teacher.user.get_full_name', read_only=True)
+    teacher_name = TeacherNameField()
     
     class Meta:
         model = Subject
         fields = '__all__'
+        read_only_fields = ['branch']
+    
+    def validate(self, attrs):
+        # The model's (branch, name, grade) constraint has no validator while branch is read-only
+        branch_id = self.instance.branch_id if self.instance else new_row_branch_id()
+        name = attrs.get('name', getattr(self.instance, 'name', None))
+        grade = attrs.get('grade', getattr(self.instance, 'grade', None))
+        duplicates = Subject.objects.filter(branch_id=branch_id, name=name, grade=grade)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError('A subject with this name and grade already exists in this branch')
+        return attrs
 
 class StudentSubjectSerializer(serializers.ModelSerializer):
-    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    subject_name = SubjectNameField()
     student_name = serializers.CharField(source='student.user.get_full_name', read_only=True)
     
     class Meta:
@@ -60,7 +94,7 @@ class StudentSubjectSerializer(serializers.ModelSerializer):
 
 class PaymentSerializer(serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.user.get_full_name', read_only=True)
-    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    subject_name = SubjectNameField()
     
     class Meta:
         model = Payment
@@ -73,10 +107,74 @@ class AttendanceSerializer(serializers.ModelSerializer):
         model = Attendance
         fields = '__all__'
 
+class NotePreviewUrlField(serializers.HyperlinkedIdentityField):
+    def __init__(self, **kwargs):
+        super().__init__(view_name='note-preview', **kwargs)
+    
+    def get_url(self, obj, view_name, request, format):
+        return super().get_url(obj, view_name, request, format) if obj.preview else None
+
 class NoteSerializer(serializers.ModelSerializer):
+    download_url = serializers.HyperlinkedIdentityField(view_name='note-download')
+    preview = NotePreviewUrlField()
+    upload = serializers.UUIDField(write_only=True, required=False,
+                                   help_text='A completed chunked upload of the requesting user')
+    
     class Meta:
         model = Note
+        # The blob is only attached from the requester's own completed upload, and files are only
+        # reachable through the download and preview actions, which check entitlement
+        exclude = ['blob']
+        read_only_fields = ['page_count', 'extracted_text', 'preview_status']
+        extra_kwargs = {'file': {'write_only': True}}
+    
+    def validate_upload(self, value):
+        upload = NoteUpload.objects.filter(id=value, uploaded_by=self.context['request'].user, status='completed',
+                                           blob__isnull=False).select_related('blob').first()
+        if upload is None:
+            raise serializers.ValidationError('No completed upload with this id')
+        return upload
+    
+    def _attach_blob(self, validated_data):
+        upload = validated_data.pop('upload', None)
+        if upload is not None:
+            validated_data['blob'] = upload.blob
+        elif validated_data.get('file'):
+            validated_data['blob'] = NoteStorageService.store_file(validated_data['file'], validated_data['file'].name)
+        if validated_data.get('blob'):
+            validated_data['file'] = validated_data['blob'].file.name
+        return validated_data
+    
+    def create(self, validated_data):
+        return super().create(self._attach_blob(validated_data))
+    
+    def update(self, instance, validated_data):
+        return super().update(instance, self._attach_blob(validated_data))
+
+class NoteListSerializer(serializers.ModelSerializer):
+    download_url = serializers.HyperlinkedIdentityField(view_name='note-download')
+    preview = NotePreviewUrlField()
+    
+    class Meta:
+        model = Note
+        fields = ['id', 'subject', 'teacher', 'title', 'download_url', 'preview', 'page_count',
+                  'preview_status', 'created_at', 'updated_at']
+
+class NoteUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NoteUpload
         fields = '__all__'
+        read_only_fields = ['uploaded_by', 'received_size', 'blob', 'status', 'created_at', 'updated_at']
+    
+    def validate_total_size(self, value):
+        if value <= 0 or value > settings.NOTE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'File size must be between 1 and {settings.NOTE_UPLOAD_MAX_SIZE} bytes')
+        return value
+    
+    def validate_sha256(self, value):
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value.lower())):
+            raise serializers.ValidationError('sha256 must be a 64 character hex digest')
+        return value.lower()
 
 class VideoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -88,6 +186,21 @@ class QuizSerializer(serializers.ModelSerializer):
         model = Quiz
         fields = '__all__'
 
+class StudentQuizSerializer(serializers.ModelSerializer):
+    ANSWER_KEY_FIELDS = ('correct_answer', 'answer', 'explanation')
+    
+    questions = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Quiz
+        exclude = ['shuffle_questions', 'shuffle_options']
+    
+    def get_questions(self, obj):
+        return [
+            {key: value for key, value in question.items() if key not in self.ANSWER_KEY_FIELDS}
+            for question in obj.questions or []
+        ]
+
 class QuizAttemptSerializer(serializers.ModelSerializer):
     class Meta:
         model = QuizAttempt
@@ -95,12 +208,105 @@ class QuizAttemptSerializer(serializers.ModelSerializer):
 
 class ExamResultSerializer(serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.user.get_full_name', read_only=True)
-    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    subject_name = SubjectNameField()
     
     class Meta:
         model = ExamResult
         fields = '__all__'
 
+class ExamResultBulkSerializer(serializers.Serializer):
+    subject = serializers.IntegerField()
+    exam_name = serializers.CharField(max_length=200)
+    exam_date = serializers.DateField()
+    total_marks = serializers.DecimalField(max_digits=5, decimal_places=2)
+    results = serializers.ListField(child=serializers.DictField(), required=False)
+    file = serializers.FileField(required=False)
+    allow_partial = serializers.BooleanField(default=False)
+    
+    def validate(self, attrs):
+        if not attrs.get('results') and not attrs.get('file'):
+            raise serializers.ValidationError('Provide either a results array or a spreadsheet file')
+        return attrs
+
+class ReportCardJobSerializer(serializers.ModelSerializer):
+    month = serializers.IntegerField(required=False, min_value=1, max_value=12)
+    year = serializers.IntegerField(required=False)
+    
+    class Meta:
+        model = ReportCardJob
+        fields = '__all__'
+        read_only_fields = ['branch', 'status', 'total', 'processed', 'archive', 'error', 'created_by', 'created_at',
+                            'heartbeat_at', 'completed_at']
+    
+    def validate(self, attrs):
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError({'end_date': 'End date must be after start date'})
+        attrs.setdefault('month', attrs['end_date'].month)
+        attrs.setdefault('year', attrs['end_date'].year)
+        return attrs
+
+class FeeReminderCampaignSerializer(serializers.ModelSerializer):
+    month = serializers.IntegerField(required=False, min_value=1, max_value=12)
+    year = serializers.IntegerField(required=False)
+    
+    class Meta:
+        model = FeeReminderCampaign
+        fields = '__all__'
+        read_only_fields = ['branch', 'status', 'total', 'sent', 'failed', 'error', 'created_by', 'created_at',
+                            'started_at', 'heartbeat_at', 'completed_at']
+    
+    def validate(self, attrs):
+        today = date.today()
+        attrs.setdefault('month', today.month)
+        attrs.setdefault('year', today.year)
+        branch = current_branch()
+        if FeeReminderCampaign.objects.filter(month=attrs['month'], year=attrs['year'],
+                                              branch_id=branch['id'] if branch else None,
+                                              status__in=['pending', 'running', 'paused']).exists():
+            raise serializers.ValidationError('A reminder campaign for this month is already in progress')
+        return attrs
+
+class BranchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Branch
+        fields = '__all__'
+    
+    def validate_code(self, value):
+        value = value.upper()
+        if not value.isalnum():
+            raise serializers.ValidationError('Use letters and digits only; the code prefixes register numbers')
+        if self.instance is not None and value != self.instance.code:
+            raise serializers.ValidationError('The code of an existing branch cannot change')
+        return value
+    
+    def validate_database(self, value):
+        value = '' if value == 'default' else value
+        if self.instance is not None and value != self.instance.database:
+            raise serializers.ValidationError('A branch cannot move to another database here')
+        if value and value not in settings.BRANCH_DATABASES:
+            raise serializers.ValidationError(f"Unknown database; configured: {', '.join(settings.BRANCH_DATABASES) or 'none'}")
+        return value
+
+class FeeReminderRecipientSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FeeReminderRecipient
+        exclude = ['campaign']
+
+class MonthlySettlementSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MonthlySettlement
+        fields = '__all__'
+        read_only_fields = [field.name for field in MonthlySettlement._meta.fields]
+
+class SettlementPeriodSerializer(serializers.Serializer):
+    month = serializers.IntegerField(required=False, min_value=1, max_value=12)
+    year = serializers.IntegerField(required=False, min_value=2000)
+    
+    def validate(self, attrs):
+        if ('month' in attrs) != ('year' in attrs):
+            raise serializers.ValidationError('Give both month and year, or neither')
+        return attrs
+
 class OTPSerializer(serializers.ModelSerializer):
     class Meta:
         model = OTP
@@ -1,19 +1,63 @@
 from django.conf import settings
-from twilio.rest import Client
-from datetime import datetime, timedelta
-from decimal import Decimal
-from .models import OTP, Payment, StudentSubject
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from django.db import IntegrityError, connections, transaction
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db.models import (Avg, Count, Exists, F, FloatField, ExpressionWrapper, Max, Min, OuterRef, Q,
+                              ProtectedError, Sum, Value, Window)
+from django.db.models.functions import Cast, DenseRank, PercentRank, Rank
+from django.utils import timezone
+from .branches import bind_to_current_branch, current_database, database_aliases, use_branch, use_database
+from .archive import ArchiveService
+from .replica import read_from_replica
+from .models import (OTP, Payment, StudentSubject, QuizStatistics, Student, ExamResult, Attendance,
+                     ReportCardJob, Note, NoteBlob, NoteUpload, Subject, Teacher, BillingRollover,
+                     FeeReminderCampaign, Branch, User, DomainEvent, MonthlySettlement)
+import asyncio
+import csv
+import hashlib
+import hmac
+import io
+import json
+import math
+import multiprocessing
+import os
 import random
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 
 class SMSService:
     @staticmethod
-    def send_sms(to_phone, message):
-        if not settings.TWILIO_ACCOUNT_SID or not settings.TWILIO_AUTH_TOKEN:
+    def is_configured():
+        return bool(settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN)
+    
+    @staticmethod
+    def client():
+        from twilio.rest import Client
+        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        client.api.base_url = settings.TWILIO_API_BASE_URL
+        return client
+    
+    @staticmethod
+    def send_sms(to_phone, message, client=None):
+        """Pass a client from SMSService.client() to reuse its HTTP connection across many sends."""
+        if not SMSService.is_configured():
             print(f"Twilio not configured. Would send SMS to {to_phone}: {message}")
             return {'status': 'simulated', 'message': 'Twilio credentials not configured'}
         
         try:
-            client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+            client = client or SMSService.client()
             message = client.messages.create(
                 body=message,
                 from_=settings.TWILIO_PHONE_NUMBER,
@@ -24,62 +68,372 @@ class SMSService:
             return {'status': 'error', 'error': str(e)}
     
     @staticmethod
-    def send_attendance_sms(student):
-        message = f"Student {student.user.get_full_name()} arrived at {datetime.now().strftime('%I:%M %p')} today."
-        return SMSService.send_sms(student.parent_phone, message)
+    def attendance_message(student, arrived_at=None):
+        return f"Student {student.user.get_full_name()} arrived at {(arrived_at or datetime.now()).strftime('%I:%M %p')} today."
+    
+    @staticmethod
+    def payment_message(subject, amount):
+        return f"Payment of ${amount} received for {subject.name}. Thank you!"
+    
+    @staticmethod
+    def fee_reminder_message(students, amount_due, month, year):
+        lines = '; '.join(f"{name}: {', '.join(subjects)}" for name, subjects in students.items())
+        return f"Fee reminder for {month:02d}/{year}: {lines}. Total due ${amount_due}. Please pay at the office."
+    
+    @staticmethod
+    def send_attendance_sms(student, arrived_at=None, client=None):
+        return SMSService.send_sms(student.parent_phone, SMSService.attendance_message(student, arrived_at), client)
     
     @staticmethod
     def send_payment_sms(student, subject, amount):
-        message = f"Payment of ${amount} received for {subject.name}. Thank you!"
-        return SMSService.send_sms(student.parent_phone, message)
+        return SMSService.send_sms(student.parent_phone, SMSService.payment_message(subject, amount))
+
+class AsyncSMSService:
+    # aiohttp sessions are bound to the event loop that created them.
+    _sessions = weakref.WeakKeyDictionary()
+    
+    @staticmethod
+    def _session():
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        session = AsyncSMSService._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+                timeout=aiohttp.ClientTimeout(total=settings.SMS_TIMEOUT),
+            )
+            AsyncSMSService._sessions[loop] = session
+        return session
+    
+    @staticmethod
+    async def send_sms(to_phone, message):
+        if not SMSService.is_configured():
+            print(f"Twilio not configured. Would send SMS to {to_phone}: {message}")
+            return {'status': 'simulated', 'message': 'Twilio credentials not configured'}
+        
+        import aiohttp
+        url = f"{settings.TWILIO_API_BASE_URL}/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Messages.json"
+        data = {'To': to_phone, 'From': settings.TWILIO_PHONE_NUMBER, 'Body': message}
+        try:
+            async with AsyncSMSService._session().post(url, data=data) as response:
+                payload = await response.json(content_type=None)
+                if response.status >= 400:
+                    return {'status': 'error', 'error': payload.get('message', f"HTTP {response.status}")}
+                return {'status': 'sent', 'sid': payload.get('sid')}
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            return {'status': 'error', 'error': str(e) or e.__class__.__name__}
+    
+    @staticmethod
+    async def send_attendance_sms(student):
+        return await AsyncSMSService.send_sms(student.parent_phone, SMSService.attendance_message(student))
+    
+    @staticmethod
+    async def send_payment_sms(student, subject, amount):
+        return await AsyncSMSService.send_sms(student.parent_phone, SMSService.payment_message(subject, amount))
+
+class SlidingWindowRateLimiter:
+    """Sliding-window limits counted in per-key time buckets.
+    
+    Each bucket is a cache counter bumped with the atomic cache.incr, and a hit is reserved before
+    the window is summed, so concurrent requests cannot all pass on a stale count. The window is
+    rounded out to whole buckets, which errs on the side of denying.
+    """
+    BUCKETS = 10
+    
+    @staticmethod
+    def _bucket_keys(key, window_seconds):
+        width = max(window_seconds / SlidingWindowRateLimiter.BUCKETS, 1)
+        current = int(time.time() // width)
+        first = current - math.ceil(window_seconds / width)
+        return [f"ratelimit:{key}:{index}" for index in range(first, current + 1)], math.ceil(window_seconds + width)
+    
+    @staticmethod
+    def acquire(key, limit, window_seconds):
+        """Reserve a hit; returns a token for release(), or None when the limit is reached."""
+        keys, timeout = SlidingWindowRateLimiter._bucket_keys(key, window_seconds)
+        current = keys[-1]
+        cache.add(current, 0, timeout)
+        try:
+            count = cache.incr(current)
+        except ValueError:
+            cache.add(current, 1, timeout)
+            count = 1
+        earlier = cache.get_many(keys[:-1])
+        if count + sum(earlier.values()) > limit:
+            SlidingWindowRateLimiter.release(current)
+            return None
+        return current
+    
+    @staticmethod
+    def release(token):
+        try:
+            cache.decr(token)
+        except ValueError:
+            pass
+    
+    @staticmethod
+    def hit(key, limit, window_seconds):
+        return SlidingWindowRateLimiter.acquire(key, limit, window_seconds) is not None
+
 
 class OTPService:
     @staticmethod
-    def generate_otp(register_number, phone):
-        OTP.objects.filter(
-            register_number=register_number,
-            created_at__lt=datetime.now() - timedelta(minutes=10)
-        ).delete()
-        
-        active_otps = OTP.objects.filter(
-            register_number=register_number,
-            is_verified=False,
-            created_at__gte=datetime.now() - timedelta(minutes=10)
-        ).count()
-        
-        if active_otps >= 3:
+    def _cache_key(register_number):
+        return f"otp:{register_number}"
+    
+    @staticmethod
+    def _attempts_key(register_number):
+        return f"otp-attempts:{register_number}"
+    
+    @staticmethod
+    def _digest(register_number, otp_code):
+        message = f"{register_number}:{otp_code}".encode()
+        return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def otp_message(otp_code):
+        return f"Your OTP code is: {otp_code}. Valid for {settings.OTP_TTL // 60} minutes."
+    
+    @staticmethod
+    def issue_otp(register_number, phone):
+        window = settings.OTP_RATE_LIMIT_WINDOW
+        register_hit = SlidingWindowRateLimiter.acquire(f"otp:register:{register_number}",
+                                                        settings.OTP_RATE_LIMIT_PER_REGISTER, window)
+        if register_hit is None:
+            return None
+        if not SlidingWindowRateLimiter.hit(f"otp:phone:{phone}", settings.OTP_RATE_LIMIT_PER_PHONE, window):
+            # A denied request must not use up the register number's quota
+            SlidingWindowRateLimiter.release(register_hit)
             return None
         
-        otp_code = str(random.randint(100000, 999999))
-        otp = OTP.objects.create(
-            phone=phone,
-            register_number=register_number,
-            otp_code=otp_code
-        )
+        otp_code = f"{secrets.randbelow(1000000):06d}"
+        cache.set(OTPService._attempts_key(register_number), 0, settings.OTP_TTL)
+        cache.set(OTPService._cache_key(register_number), {
+            'digest': OTPService._digest(register_number, otp_code),
+            'phone': phone,
+        }, settings.OTP_TTL)
+        
+        if settings.OTP_AUDIT_LOG:
+            OTP.objects.create(phone=phone, register_number=register_number, otp_code='******')
+        
+        return otp_code
+    
+    @staticmethod
+    def generate_otp(register_number, phone):
+        otp_code = OTPService.issue_otp(register_number, phone)
+        if otp_code is None:
+            return None
         
-        SMSService.send_sms(phone, f"Your OTP code is: {otp_code}. Valid for 10 minutes.")
+        SMSService.send_sms(phone, OTPService.otp_message(otp_code))
         
-        return otp
+        return True
     
     @staticmethod
     def verify_otp(register_number, otp_code):
+        key = OTPService._cache_key(register_number)
+        entry = cache.get(key)
+        if entry is None or not otp_code:
+            return False
+        
+        # Each guess takes an attempt number from an atomic counter before it is compared, so
+        # parallel guesses cannot all be checked against the same count
+        attempts_key = OTPService._attempts_key(register_number)
         try:
-            otp = OTP.objects.filter(
-                register_number=register_number,
-                otp_code=otp_code,
-                is_verified=False,
-                created_at__gte=datetime.now() - timedelta(minutes=10)
-            ).latest('created_at')
-            
-            otp.is_verified = True
-            otp.save()
-            return True
-        except OTP.DoesNotExist:
+            attempts = cache.incr(attempts_key)
+        except ValueError:
+            cache.delete(key)
+            return False
+        if attempts > settings.OTP_MAX_ATTEMPTS:
+            cache.delete(key)
             return False
+        
+        if hmac.compare_digest(entry['digest'], OTPService._digest(register_number, str(otp_code))):
+            cache.delete_many([key, attempts_key])
+            if settings.OTP_AUDIT_LOG:
+                latest = OTP.objects.filter(register_number=register_number, is_verified=False).order_by('-created_at').first()
+                if latest is not None:
+                    OTP.objects.filter(id=latest.id).update(is_verified=True)
+            return True
+        
+        if attempts >= settings.OTP_MAX_ATTEMPTS:
+            cache.delete(key)
+        return False
+
+class ReferenceDataCache:
+    """Subject catalog and teacher directory, cached per process (LRU) and in the shared cache.
+    
+    Entries are tagged with a version per database that signals bump when subjects, teachers or
+    teacher users change. Each process re-reads the version at most every REFERENCE_CACHE_VERSION_TTL
+    seconds, so other processes see changes within that window. Queryset update()/bulk_create()
+    bypass the signals; call invalidate() after them.
+    """
+    VERSION_KEY = 'reference-data-version'
+    _MISSING = object()
+    _local = OrderedDict()
+    _versions = {}
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def version():
+        alias = current_database()
+        version, checked_at = ReferenceDataCache._versions.get(alias, (None, 0.0))
+        now = time.monotonic()
+        if version is None or now - checked_at >= settings.REFERENCE_CACHE_VERSION_TTL:
+            # The shared key is namespaced per database by api.branches.make_cache_key
+            version = cache.get_or_set(ReferenceDataCache.VERSION_KEY, 1, None)
+            ReferenceDataCache._versions[alias] = (version, now)
+        return version
+    
+    @staticmethod
+    def invalidate():
+        try:
+            cache.incr(ReferenceDataCache.VERSION_KEY)
+        except ValueError:
+            cache.set(ReferenceDataCache.VERSION_KEY, 2, None)
+        with ReferenceDataCache._lock:
+            ReferenceDataCache._local.clear()
+            ReferenceDataCache._versions.pop(current_database(), None)
+    
+    @staticmethod
+    def _get(name, loader):
+        version = ReferenceDataCache.version()
+        local = ReferenceDataCache._local
+        local_name = (current_database(), name)
+        with ReferenceDataCache._lock:
+            entry = local.get(local_name)
+            if entry is not None and entry[0] == version:
+                local.move_to_end(local_name)
+                return entry[1]
+        
+        key = f"reference:{version}:{name}"
+        value = cache.get(key, ReferenceDataCache._MISSING)
+        if value is ReferenceDataCache._MISSING:
+            # Always from the primary: a lagging replica would pin stale rows under the new version
+            value = loader()
+            cache.set(key, value, settings.REFERENCE_CACHE_TIMEOUT)
+        
+        with ReferenceDataCache._lock:
+            local[local_name] = (version, value)
+            local.move_to_end(local_name)
+            while len(local) > settings.REFERENCE_CACHE_MAX_ENTRIES:
+                local.popitem(last=False)
+        return value
+    
+    @staticmethod
+    def _subject_rows(**filters):
+        rows = Subject.objects.using(current_database()).filter(**filters).order_by('id').values(
+            *ReferenceDataCache._subject_fields(), 'teacher__user__first_name', 'teacher__user__last_name'
+        )
+        catalog = {}
+        for row in rows:
+            first_name = row.pop('teacher__user__first_name')
+            last_name = row.pop('teacher__user__last_name')
+            row['teacher_name'] = f"{first_name} {last_name}".strip() if row['teacher_id'] else None
+            catalog[row['id']] = row
+        return catalog
+    
+    @staticmethod
+    def _subject_fields():
+        return [field.attname for field in Subject._meta.concrete_fields]
+    
+    @staticmethod
+    def _to_subject(entry):
+        fields = ReferenceDataCache._subject_fields()
+        subject = Subject.from_db(current_database(), fields, [entry[field] for field in fields])
+        subject.teacher_name = entry['teacher_name']
+        return subject
+    
+    @staticmethod
+    def subject_info(subject_id):
+        try:
+            subject_id = int(subject_id)
+        except (TypeError, ValueError):
+            return None
+        return ReferenceDataCache._get(
+            f"subject:{subject_id}", lambda: ReferenceDataCache._subject_rows(pk=subject_id).get(subject_id)
+        )
+    
+    @staticmethod
+    def subject(subject_id):
+        """A detached Subject instance (plus teacher_name) or None, without a query on a cache hit."""
+        entry = ReferenceDataCache.subject_info(subject_id)
+        return ReferenceDataCache._to_subject(entry) if entry else None
+    
+    @staticmethod
+    def catalog():
+        return ReferenceDataCache._get('subjects', ReferenceDataCache._subject_rows)
+    
+    @staticmethod
+    def subjects_for_teacher(teacher_id):
+        return [
+            ReferenceDataCache._to_subject(entry)
+            for entry in ReferenceDataCache.catalog().values() if entry['teacher_id'] == teacher_id
+        ]
+    
+    @staticmethod
+    def teachers():
+        def load():
+            rows = Teacher.objects.using(current_database()).order_by('id').values_list(
+                'id', 'user_id', 'branch_id', 'user__first_name', 'user__last_name'
+            )
+            return {
+                teacher_id: {'user_id': user_id, 'branch_id': branch_id, 'name': f"{first_name} {last_name}".strip()}
+                for teacher_id, user_id, branch_id, first_name, last_name in rows
+            }
+        return ReferenceDataCache._get('teachers', load)
+    
+    @staticmethod
+    def teacher_name(teacher_id):
+        teacher = ReferenceDataCache.teachers().get(teacher_id)
+        return teacher['name'] if teacher else None
+    
+    @staticmethod
+    def teacher_branch_id(teacher_id):
+        teacher = ReferenceDataCache.teachers().get(teacher_id)
+        return teacher['branch_id'] if teacher else None
+
+class AttendanceService:
+    @staticmethod
+    def mark(student, marked_by):
+        """Record today's attendance for ``student``; returns (attendance, created)."""
+        with transaction.atomic(using=current_database()):
+            attendance, created = Attendance.objects.get_or_create(
+                student=student,
+                date=date.today(),
+                defaults={'marked_by': marked_by}
+            )
+            if created:
+                DomainEvent.record('attendance_marked', student.branch_id, attendance_id=attendance.id,
+                                   student_id=student.id, date=str(attendance.date))
+        return attendance, created
+    
+    @staticmethod
+    def notify_arrivals(arrivals):
+        """Send arrival SMS for (student_id, arrived_at) pairs from a background thread once committed."""
+        def run():
+            try:
+                students = Student.objects.select_related('user').in_bulk([student_id for student_id, _ in arrivals])
+                client = SMSService.client() if SMSService.is_configured() else None
+                for student_id, arrived_at in arrivals:
+                    SMSService.send_attendance_sms(students[student_id], arrived_at, client)
+            finally:
+                connections.close_all()
+        
+        if arrivals:
+            thread = threading.Thread(target=bind_to_current_branch(run), daemon=True)
+            transaction.on_commit(thread.start, using=current_database())
+
 
 class PaymentService:
     @staticmethod
     def mark_payment(student, subject, month, year):
+        result = PaymentService.record_payment(student, subject, month, year)
+        if result['status'] == 'success':
+            SMSService.send_payment_sms(student, subject, subject.fee)
+        return result
+    
+    @staticmethod
+    def record_payment(student, subject, month, year):
         existing_payment = Payment.objects.filter(
             student=student,
             subject=subject,
@@ -90,56 +444,1293 @@ class PaymentService:
         if existing_payment:
             return {'status': 'duplicate', 'message': 'Payment already recorded for this month'}
         
-        payment = Payment.objects.create(
-            student=student,
-            subject=subject,
-            amount=subject.fee,
-            month=month,
-            year=year
-        )
+        try:
+            with transaction.atomic(using=current_database()):
+                payment = Payment.objects.create(
+                    student=student,
+                    subject=subject,
+                    amount=subject.fee,
+                    month=month,
+                    year=year
+                )
+                DomainEvent.record('payment_recorded', student.branch_id, payment_id=payment.id,
+                                   student_id=student.id, subject_id=subject.id, amount=str(payment.amount),
+                                   month=month, year=year)
+        except IntegrityError:
+            return {'status': 'duplicate', 'message': 'Payment already recorded for this month'}
         
         student_subject, created = StudentSubject.objects.get_or_create(
             student=student,
             subject=subject
         )
-        student_subject.is_paid_current_month = True
+        if (year, month) == BillingService.current_period():
+            student_subject.is_paid_current_month = True
         student_subject.last_payment_date = payment.payment_date
         student_subject.save()
         
-        SMSService.send_payment_sms(student, subject, subject.fee)
-        
         return {'status': 'success', 'payment': payment}
     
     @staticmethod
-    def calculate_income_split(month, year):
-        from django.db.models import Sum, Q
+    def calculate_income_split(month, year, branch_id=None):
+        """Income split for a month: read from its settlement once closed, computed live before that."""
+        settlement = SettlementService.statement(month, year, branch_id)
+        if settlement is not None:
+            split = SettlementService.as_income_split(settlement.total_collected, settlement.teacher_total,
+                                                      settlement.owner_total, settlement.teachers)
+            return {**split, 'settled': True}
+        
+        computed = SettlementService.compute(month, year, branch_id)
+        split = SettlementService.as_income_split(computed['total_collected'], computed['teacher_total'],
+                                                  computed['owner_total'], computed['teachers'])
+        return {**split, 'settled': False}
+
+
+class SettlementService:
+    CENT = Decimal('0.01')
+    
+    @staticmethod
+    def _payments(month, year, branch_id, catalog, teacher_id=None):
+        payments = Payment.objects.filter(month=month, year=year)
+        if branch_id is not None or teacher_id is not None:
+            payments = payments.filter(subject_id__in=[
+                subject_id for subject_id, subject in catalog.items()
+                if (branch_id is None or subject['branch_id'] == branch_id)
+                and (teacher_id is None or subject['teacher_id'] == teacher_id)
+            ])
+        return payments.order_by()
+    
+    @staticmethod
+    def _digest(payments):
+        digest = hashlib.sha256()
+        for payment_id, subject_id, amount in payments.order_by('id').values_list('id', 'subject_id', 'amount').iterator():
+            digest.update(f"{payment_id}:{subject_id}:{amount};".encode())
+        return digest.hexdigest()
+    
+    @staticmethod
+    def compute(month, year, branch_id=None, ratio=None, teacher_id=None):
+        """Per-subject and per-teacher shares, in Decimal rounded half-up to the cent per subject.
         
-        total_income = Payment.objects.filter(
+        The owner's share of a subject is what remains after the teacher's rounded share, so
+        the two always add up to the amount collected. ``teacher_id`` limits it to that
+        teacher's subjects.
+        """
+        ratio = settings.TEACHER_INCOME_SHARE if ratio is None else ratio
+        catalog = ReferenceDataCache.catalog()
+        teachers = ReferenceDataCache.teachers()
+        if branch_id is not None:
+            teachers = {key: teacher for key, teacher in teachers.items() if teacher['branch_id'] == branch_id}
+        if teacher_id is not None:
+            teachers = {key: teacher for key, teacher in teachers.items() if key == teacher_id}
+        payments = SettlementService._payments(month, year, branch_id, catalog, teacher_id)
+        
+        subjects = []
+        for subject_id, payment_count, collected in sorted(
+                payments.values_list('subject_id').annotate(count=Count('id'), total=Sum('amount'))):
+            subject = catalog.get(subject_id, {})
+            collected = collected.quantize(SettlementService.CENT)
+            teacher_share = (collected * ratio).quantize(SettlementService.CENT, rounding=ROUND_HALF_UP)
+            subjects.append({
+                'subject_id': subject_id,
+                'subject_name': subject.get('name', ''),
+                'teacher_id': subject.get('teacher_id'),
+                'payments': payment_count,
+                'collected': collected,
+                'teacher_share': teacher_share,
+                'owner_share': collected - teacher_share,
+            })
+        
+        teacher_lines = {
+            teacher_id: {'teacher_name': teacher['name'], 'total_collected': Decimal('0'), 'teacher_share': Decimal('0')}
+            for teacher_id, teacher in teachers.items()
+        }
+        for line in subjects:
+            if line['teacher_id'] in teacher_lines:
+                teacher_lines[line['teacher_id']]['total_collected'] += line['collected']
+                teacher_lines[line['teacher_id']]['teacher_share'] += line['teacher_share']
+        
+        return {
+            'ratio': ratio,
+            'payments': payments,
+            'payment_count': sum(line['payments'] for line in subjects),
+            'total_collected': sum((line['collected'] for line in subjects), Decimal('0')),
+            'teacher_total': sum((line['teacher_share'] for line in subjects), Decimal('0')),
+            'owner_total': sum((line['owner_share'] for line in subjects), Decimal('0')),
+            'subjects': subjects,
+            'teachers': teacher_lines,
+        }
+    
+    @staticmethod
+    def as_income_split(total_collected, teacher_total, owner_total, teachers):
+        # The dashboards' JSON shape predates settlements and carries floats
+        return {
+            'total_income': float(total_collected),
+            'owner_income': float(owner_total),
+            'total_teacher_income': float(teacher_total),
+            'teacher_breakdown': {
+                int(teacher_id): {
+                    'teacher_name': line['teacher_name'],
+                    'total_collected': float(line['total_collected']),
+                    'teacher_share': float(line['teacher_share']),
+                }
+                for teacher_id, line in teachers.items()
+            },
+        }
+    
+    @staticmethod
+    def statement(month, year, branch_id=None, or_all_branches=False):
+        """The statement closed for ``branch_id``, or with ``or_all_branches`` the all-branch one when the
+        branch was not closed on its own; one lookup on the unique (branch, year, month) index."""
+        scope = Q(branch__isnull=True) if branch_id is None else Q(branch_id=branch_id)
+        if or_all_branches and branch_id is not None:
+            scope |= Q(branch__isnull=True)
+        return MonthlySettlement.objects.filter(scope, year=year, month=month).order_by(
+            F('branch_id').asc(nulls_last=True)
+        ).first()
+    
+    @staticmethod
+    def teacher_statement(teacher_id, month, year, branch_id=None):
+        # Every teacher has a line in the all-branch statement too, so it stands in for a branch's
+        settlement = SettlementService.statement(month, year, branch_id, or_all_branches=True)
+        if settlement is not None:
+            ratio, subjects = settlement.teacher_share_ratio, settlement.subjects
+            teacher = settlement.teachers.get(str(teacher_id), {})
+        else:
+            computed = SettlementService.compute(month, year, branch_id, teacher_id=teacher_id)
+            ratio, subjects = computed['ratio'], computed['subjects']
+            teacher = computed['teachers'].get(teacher_id, {})
+        return {
+            'month': month,
+            'year': year,
+            'settled': settlement is not None,
+            'teacher_share_ratio': str(ratio),
+            'total_collected': str(teacher.get('total_collected', '0.00')),
+            'teacher_share': str(teacher.get('teacher_share', '0.00')),
+            'subjects': [
+                {key: str(line[key]) if key in ('collected', 'teacher_share') else line[key]
+                 for key in ('subject_id', 'subject_name', 'payments', 'collected', 'teacher_share')}
+                for line in subjects if line['teacher_id'] == teacher_id
+            ],
+        }
+    
+    @staticmethod
+    def close_month(month, year, branch_id=None, closed_by=None, today=None):
+        """Compute and store the settlement for a month that has ended; returns (settlement, created)."""
+        if (year, month) >= BillingService.current_period(today):
+            raise ValueError('Only months that have ended can be closed')
+        existing = SettlementService.statement(month, year, branch_id)
+        if existing is not None:
+            return existing, False
+        
+        computed = SettlementService.compute(month, year, branch_id)
+        as_text = lambda line: {key: str(value) if isinstance(value, Decimal) else value for key, value in line.items()}
+        try:
+            with transaction.atomic(using=current_database()):
+                settlement = MonthlySettlement.objects.create(
+                    branch_id=branch_id,
+                    month=month,
+                    year=year,
+                    teacher_share_ratio=computed['ratio'],
+                    payment_count=computed['payment_count'],
+                    total_collected=computed['total_collected'],
+                    teacher_total=computed['teacher_total'],
+                    owner_total=computed['owner_total'],
+                    subjects=[as_text(line) for line in computed['subjects']],
+                    teachers={str(teacher_id): as_text(line) for teacher_id, line in computed['teachers'].items()},
+                    payments_digest=SettlementService._digest(computed['payments']),
+                    closed_by=closed_by,
+                )
+        except IntegrityError:
+            return SettlementService.statement(month, year, branch_id), False
+        return settlement, True
+    
+    @staticmethod
+    def reconcile(settlement):
+        """Compare a settlement with the payments now on record for its month.
+        
+        Payments recorded, changed or deleted after the close alter the digest; the subject
+        lines show where the collected amounts moved.
+        """
+        current = SettlementService.compute(settlement.month, settlement.year, settlement.branch_id,
+                                            settlement.teacher_share_ratio)
+        closed_lines = {line['subject_id']: line for line in settlement.subjects}
+        current_lines = {line['subject_id']: line for line in current['subjects']}
+        subjects = []
+        for subject_id in sorted(closed_lines.keys() | current_lines.keys()):
+            closed = closed_lines.get(subject_id, {})
+            now = current_lines.get(subject_id, {})
+            closed_collected = Decimal(closed.get('collected', '0'))
+            current_collected = now.get('collected', Decimal('0'))
+            if closed.get('payments', 0) != now.get('payments', 0) or closed_collected != current_collected:
+                subjects.append({
+                    'subject_id': subject_id,
+                    'subject_name': closed.get('subject_name') or now.get('subject_name', ''),
+                    'closed': {'payments': closed.get('payments', 0), 'collected': str(closed_collected)},
+                    'current': {'payments': now.get('payments', 0), 'collected': str(current_collected)},
+                })
+        
+        digest = SettlementService._digest(current['payments'])
+        return {
+            'settlement': settlement.id,
+            'month': settlement.month,
+            'year': settlement.year,
+            'branch': settlement.branch_id,
+            'consistent': digest == settlement.payments_digest,
+            'closed': {'payments': settlement.payment_count, 'collected': str(settlement.total_collected)},
+            'current': {'payments': current['payment_count'], 'collected': str(current['total_collected'])},
+            'subjects': subjects,
+        }
+
+
+class BillingService:
+    """Keeps StudentSubject.is_paid_current_month authoritative for the current month.
+    
+    The flag is only trusted once rollover() has completed for the current month; until then
+    (e.g. between midnight on the 1st and the scheduled run) readers fall back to Payment rows.
+    """
+    
+    @staticmethod
+    def current_period(today=None):
+        today = today or date.today()
+        return today.year, today.month
+    
+    @staticmethod
+    def _rollover_key(year, month):
+        return f"billing-rollover:{year}-{month:02d}"
+    
+    @staticmethod
+    def _paid(year, month):
+        return Exists(Payment.objects.filter(
+            student_id=OuterRef('student_id'),
+            subject_id=OuterRef('subject_id'),
             month=month,
             year=year
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        owner_income = total_income * Decimal('0.20')
-        teacher_income = total_income * Decimal('0.80')
-        
-        teacher_breakdown = {}
-        from .models import Teacher
-        for teacher in Teacher.objects.all():
-            teacher_payments = Payment.objects.filter(
-                subject__teacher=teacher,
-                month=month,
-                year=year
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        ))
+    
+    @staticmethod
+    def flags_current(today=None):
+        year, month = BillingService.current_period(today)
+        key = BillingService._rollover_key(year, month)
+        current = cache.get(key)
+        if current is None:
+            current = BillingRollover.objects.filter(year=year, month=month, completed_at__isnull=False).exists()
+            cache.set(key, current, settings.BILLING_ROLLOVER_CACHE_TIMEOUT if current else 60)
+        return current
+    
+    @staticmethod
+    def rollover(today=None, batch_size=5000, force=False):
+        year, month = BillingService.current_period(today)
+        run, created = BillingRollover.objects.get_or_create(
+            year=year, month=month, defaults={'started_at': timezone.now()}
+        )
+        if run.completed_at and not force:
+            return {'status': 'skipped', 'run': run}
+        run.started_at = timezone.now()
+        run.completed_at = None
+        run.save()
+        cache.delete(BillingService._rollover_key(year, month))
+        
+        paid = BillingService._paid(year, month)
+        bounds = StudentSubject.objects.aggregate(low=Min('id'), high=Max('id'))
+        marked_paid = marked_unpaid = 0
+        if bounds['low'] is not None:
+            # Id ranges keep each write transaction short; only rows whose flag changes are written
+            for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+                batch = StudentSubject.objects.filter(id__gte=start, id__lt=start + batch_size)
+                with transaction.atomic(using=current_database()):
+                    marked_paid += batch.filter(paid, is_paid_current_month=False).update(is_paid_current_month=True)
+                    marked_unpaid += batch.filter(~paid, is_paid_current_month=True).update(is_paid_current_month=False)
+        
+        run.enrollments = StudentSubject.objects.count()
+        run.marked_paid = marked_paid
+        run.marked_unpaid = marked_unpaid
+        run.completed_at = timezone.now()
+        run.save()
+        cache.set(BillingService._rollover_key(year, month), True, settings.BILLING_ROLLOVER_CACHE_TIMEOUT)
+        return {'status': 'completed', 'run': run}
+    
+    @staticmethod
+    def refresh_enrollment(student_id, subject_id, today=None):
+        year, month = BillingService.current_period(today)
+        StudentSubject.objects.filter(student_id=student_id, subject_id=subject_id).update(
+            is_paid_current_month=BillingService._paid(year, month)
+        )
+    
+    @staticmethod
+    def check_consistency(today=None, sample_size=20):
+        year, month = BillingService.current_period(today)
+        paid = BillingService._paid(year, month)
+        flagged_without_payment = StudentSubject.objects.filter(~paid, is_paid_current_month=True)
+        payment_without_flag = StudentSubject.objects.filter(paid, is_paid_current_month=False)
+        return {
+            'period': f"{year}-{month:02d}",
+            'rolled_over': BillingRollover.objects.filter(year=year, month=month, completed_at__isnull=False).exists(),
+            'enrollments': StudentSubject.objects.count(),
+            'flagged_without_payment': flagged_without_payment.count(),
+            'payment_without_flag': payment_without_flag.count(),
+            'samples': list(flagged_without_payment.values_list('id', flat=True)[:sample_size]) +
+                       list(payment_without_flag.values_list('id', flat=True)[:sample_size]),
+        }
+    
+    @staticmethod
+    def unpaid_enrollments(month, year, branch_id=None):
+        enrollments = StudentSubject.objects.all()
+        if branch_id is not None:
+            enrollments = enrollments.filter(student__branch_id=branch_id)
+        if (year, month) == BillingService.current_period() and BillingService.flags_current():
+            return enrollments.filter(is_paid_current_month=False)
+        return enrollments.filter(~BillingService._paid(year, month))
+    
+    @staticmethod
+    def paid_subject_ids(student, today=None):
+        if BillingService.flags_current(today):
+            return StudentSubject.objects.filter(
+                student=student,
+                is_paid_current_month=True
+            ).values_list('subject_id', flat=True)
+        year, month = BillingService.current_period(today)
+        return Payment.objects.filter(
+            student=student,
+            month=month,
+            year=year
+        ).values_list('subject_id', flat=True).distinct()
+    
+    @staticmethod
+    def paid_students_count(today=None, branch_id=None):
+        branch_filter = {'student__branch_id': branch_id} if branch_id is not None else {}
+        if BillingService.flags_current(today):
+            return StudentSubject.objects.filter(
+                is_paid_current_month=True, **branch_filter
+            ).values('student').distinct().count()
+        year, month = BillingService.current_period(today)
+        return Payment.objects.filter(month=month, year=year, **branch_filter).values('student').distinct().count()
+
+
+
+class BranchService:
+    OWNER_FIELDS = ('password', 'email', 'first_name', 'last_name', 'phone', 'is_active', 'is_staff', 'is_superuser')
+    TOTAL_FIELDS = ('total_students', 'total_teachers', 'todays_attendance', 'students_paid_this_month',
+                    'total_income', 'owner_income', 'total_teacher_income')
+    
+    @staticmethod
+    def dashboard_stats(branch=None):
+        """Owner dashboard figures for ``branch``, or for every branch in the current database."""
+        today = date.today()
+        branch_id = branch['id'] if branch else None
+        students = Student.objects.all()
+        attendance = Attendance.objects.filter(date=today)
+        teachers = ReferenceDataCache.teachers()
+        if branch_id is not None:
+            students = students.filter(branch_id=branch_id)
+            attendance = attendance.filter(student__branch_id=branch_id)
+            teachers = [teacher for teacher in teachers.values() if teacher['branch_id'] == branch_id]
+        
+        return {
+            'total_students': students.count(),
+            'total_teachers': len(teachers),
+            'todays_attendance': attendance.count(),
+            'students_paid_this_month': BillingService.paid_students_count(branch_id=branch_id),
+            **PaymentService.calculate_income_split(today.month, today.year, branch_id)
+        }
+    
+    @staticmethod
+    def _branch_dashboard(branch):
+        try:
+            with use_branch(branch):
+                return {'branch': branch, **BranchService.dashboard_stats(branch)}
+        finally:
+            connections.close_all()
+    
+    @staticmethod
+    def aggregate_dashboard(branches):
+        """Per-branch dashboards computed in parallel, one worker per branch, plus their totals.
+        
+        Branches on their own database are queried concurrently on separate connections; the
+        caller's replica routing carries over into the workers.
+        """
+        branches = list(branches)
+        results = []
+        if branches:
+            with ThreadPoolExecutor(max_workers=min(len(branches), settings.BRANCH_DASHBOARD_WORKERS)) as pool:
+                results = list(pool.map(bind_to_current_branch(BranchService._branch_dashboard), branches))
+        totals = {field: sum(result[field] for result in results) for field in BranchService.TOTAL_FIELDS}
+        return {'branches': results, 'totals': totals}
+    
+    @staticmethod
+    def adopt_unassigned(branch):
+        """Assign rows created before branches existed (branch is null) in the branch's database to it.
+        
+        Register numbers keep their old unprefixed form, so those students name the branch at OTP login.
+        """
+        counts = {}
+        with use_branch(branch), transaction.atomic(using=branch['database']):
+            for model in (Student, Teacher, Subject, ReportCardJob, FeeReminderCampaign):
+                counts[model._meta.model_name] = model.objects.filter(branch__isnull=True).update(branch_id=branch['id'])
+            counts['user'] = User.objects.filter(branch__isnull=True).exclude(role='owner').update(branch_id=branch['id'])
+            transaction.on_commit(ReferenceDataCache.invalidate, using=branch['database'])
+        return counts
+    
+    @staticmethod
+    def sync_database(alias):
+        """Copy the branch registry and organisation owners into a dedicated branch database.
+        
+        Rows there reference branches by id, and owners need a local account in each database
+        to act on its branches. Owners are matched by username, so ids may differ.
+        """
+        synced = {'branches': 0, 'owners': 0}
+        # Routed to alias as well, so signal handlers see the same database as the saves
+        with use_database(alias), transaction.atomic(using=alias):
+            for branch in Branch.objects.using('default').order_by('id'):
+                branch.save(using=alias)
+                synced['branches'] += 1
+            for owner in User.objects.using('default').filter(role='owner', branch__isnull=True):
+                local = User.objects.using(alias).filter(username=owner.username).first()
+                if local is not None and (local.role != 'owner' or local.branch_id is not None):
+                    raise ValueError(f"User {owner.username!r} in {alias} is not an organisation owner")
+                local = local or User(username=owner.username, role='owner')
+                for field in BranchService.OWNER_FIELDS:
+                    setattr(local, field, getattr(owner, field))
+                local.save(using=alias)
+                synced['owners'] += 1
+        return synced
+
+class QuizAnalyticsService:
+    HISTOGRAM_BUCKETS = 10
+    
+    @staticmethod
+    def _answer_key(value):
+        return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+    
+    @staticmethod
+    def _histogram_bucket(score, total_marks):
+        if not total_marks or total_marks <= 0:
+            return 0
+        bucket = int(score / total_marks * QuizAnalyticsService.HISTOGRAM_BUCKETS)
+        return min(max(bucket, 0), QuizAnalyticsService.HISTOGRAM_BUCKETS - 1)
+    
+    @staticmethod
+    def record_attempt(attempt):
+        quiz = attempt.quiz
+        with transaction.atomic(using=current_database()):
+            stats, created = QuizStatistics.objects.select_for_update().get_or_create(quiz=quiz)
+            if created or stats.quiz_updated_at != quiz.updated_at:
+                return QuizAnalyticsService.recompute(quiz, stats)
+            
+            score = float(attempt.score)
+            answers = attempt.answers or {}
+            stats.attempt_count += 1
+            stats.score_sum += score
+            stats.score_sq_sum += score * score
+            
+            histogram = stats.score_histogram or [0] * QuizAnalyticsService.HISTOGRAM_BUCKETS
+            histogram[QuizAnalyticsService._histogram_bucket(score, quiz.total_marks)] += 1
+            stats.score_histogram = histogram
+            
+            for question in quiz.questions:
+                question_id = str(question.get('id'))
+                entry = stats.question_stats.setdefault(question_id, {
+                    'correct': 0, 'correct_score_sum': 0.0, 'unanswered': 0, 'answers': {}
+                })
+                if question_id not in answers:
+                    entry['unanswered'] += 1
+                    continue
+                
+                key = QuizAnalyticsService._answer_key(answers[question_id])
+                entry['answers'][key] = entry['answers'].get(key, 0) + 1
+                if answers[question_id] == question.get('correct_answer'):
+                    entry['correct'] += 1
+                    entry['correct_score_sum'] += score
             
-            teacher_breakdown[teacher.id] = {
-                'teacher_name': teacher.user.get_full_name(),
-                'total_collected': float(teacher_payments),
-                'teacher_share': float(teacher_payments * Decimal('0.80'))
+            stats.save()
+            return stats
+    
+    @staticmethod
+    def recompute(quiz, stats=None):
+        import numpy as np
+        
+        if stats is None:
+            stats, _ = QuizStatistics.objects.get_or_create(quiz=quiz)
+        
+        rows = list(quiz.attempts.values_list('answers', 'score'))
+        if ArchiveService.may_hold('quizattempt', quiz.created_at):
+            archived = ArchiveService.archived('quizattempt', quiz.created_at, quiz_id=quiz.id)
+            rows.extend((row['answers'], row['score']) for row in archived)
+        questions = quiz.questions or []
+        question_ids = [str(question.get('id')) for question in questions]
+        
+        scores = np.fromiter((float(score) for _, score in rows), dtype=np.float64, count=len(rows))
+        answered = np.zeros((len(rows), len(questions)), dtype=bool)
+        correct = np.zeros((len(rows), len(questions)), dtype=bool)
+        chosen = np.empty((len(rows), len(questions)), dtype=object)
+        
+        for i, (answers, _) in enumerate(rows):
+            answers = answers or {}
+            for j, question in enumerate(questions):
+                question_id = question_ids[j]
+                if question_id in answers:
+                    answered[i, j] = True
+                    chosen[i, j] = QuizAnalyticsService._answer_key(answers[question_id])
+                    correct[i, j] = answers[question_id] == question.get('correct_answer')
+        
+        if quiz.total_marks and quiz.total_marks > 0:
+            buckets = np.clip(
+                (scores / quiz.total_marks * QuizAnalyticsService.HISTOGRAM_BUCKETS).astype(np.int64),
+                0, QuizAnalyticsService.HISTOGRAM_BUCKETS - 1
+            )
+        else:
+            buckets = np.zeros(len(rows), dtype=np.int64)
+        
+        correct_counts = correct.sum(axis=0)
+        correct_score_sums = scores @ correct if len(rows) else np.zeros(len(questions))
+        answered_counts = answered.sum(axis=0)
+        
+        question_stats = {}
+        for j, question_id in enumerate(question_ids):
+            values, counts = np.unique(chosen[answered[:, j], j].astype(str), return_counts=True)
+            question_stats[question_id] = {
+                'correct': int(correct_counts[j]),
+                'correct_score_sum': float(correct_score_sums[j]),
+                'unanswered': int(len(rows) - answered_counts[j]),
+                'answers': {str(value): int(count) for value, count in zip(values, counts)},
             }
         
+        stats.attempt_count = len(rows)
+        stats.score_sum = float(scores.sum())
+        stats.score_sq_sum = float(np.dot(scores, scores))
+        stats.score_histogram = np.bincount(buckets, minlength=QuizAnalyticsService.HISTOGRAM_BUCKETS).tolist()
+        stats.question_stats = question_stats
+        stats.quiz_updated_at = quiz.updated_at
+        stats.save()
+        return stats
+    
+    @staticmethod
+    def get_report(quiz, recompute=False):
+        stats = QuizStatistics.objects.filter(quiz=quiz).first()
+        if recompute or stats is None or stats.quiz_updated_at != quiz.updated_at:
+            stats = QuizAnalyticsService.recompute(quiz, stats)
+        
+        n = stats.attempt_count
+        mean = stats.score_sum / n if n else 0.0
+        std_dev = math.sqrt(max(stats.score_sq_sum / n - mean * mean, 0.0)) if n else 0.0
+        
+        questions = []
+        for question in quiz.questions or []:
+            question_id = str(question.get('id'))
+            entry = stats.question_stats.get(question_id, {})
+            correct = entry.get('correct', 0)
+            difficulty = correct / n if n else None
+            
+            # Point-biserial correlation between answering this item correctly and the total score.
+            discrimination = None
+            if 0 < correct < n and std_dev > 0:
+                mean_correct = entry['correct_score_sum'] / correct
+                mean_incorrect = (stats.score_sum - entry['correct_score_sum']) / (n - correct)
+                discrimination = (mean_correct - mean_incorrect) / std_dev * math.sqrt(difficulty * (1 - difficulty))
+            
+            questions.append({
+                'question_id': question_id,
+                'correct_answer': question.get('correct_answer'),
+                'difficulty': difficulty,
+                'discrimination': discrimination,
+                'unanswered': entry.get('unanswered', 0),
+                'answer_frequencies': entry.get('answers', {}),
+            })
+        
+        bucket_width = quiz.total_marks / QuizAnalyticsService.HISTOGRAM_BUCKETS if quiz.total_marks else 0
         return {
-            'total_income': float(total_income),
-            'owner_income': float(owner_income),
-            'total_teacher_income': float(teacher_income),
-            'teacher_breakdown': teacher_breakdown
+            'quiz_id': quiz.id,
+            'attempt_count': n,
+            'total_marks': quiz.total_marks,
+            'mean_score': mean,
+            'std_dev': std_dev,
+            'score_distribution': [
+                {'from': i * bucket_width, 'to': (i + 1) * bucket_width, 'count': count}
+                for i, count in enumerate(stats.score_histogram)
+            ],
+            'questions': questions,
+            'updated_at': stats.updated_at,
+        }
+
+
+class QuizProjectionService:
+    @staticmethod
+    def _cache_key(quiz_id, updated_at):
+        return f"quiz-projection:{quiz_id}:{updated_at.timestamp()}"
+    
+    @staticmethod
+    def _build(quiz):
+        from .serializers import StudentQuizSerializer
+        projection = dict(StudentQuizSerializer(quiz).data)
+        projection['_shuffle'] = (quiz.shuffle_questions, quiz.shuffle_options)
+        return projection
+    
+    @staticmethod
+    def _personalize(projection, student):
+        projection = dict(projection)
+        shuffle_questions, shuffle_options = projection.pop('_shuffle')
+        if not (shuffle_questions or shuffle_options):
+            return projection
+        
+        rng = random.Random(f"{projection['id']}:{projection['updated_at']}:{student.id}")
+        questions = [dict(question) for question in projection['questions']]
+        if shuffle_questions:
+            rng.shuffle(questions)
+        if shuffle_options:
+            for question in questions:
+                if isinstance(question.get('options'), list):
+                    question['options'] = rng.sample(question['options'], len(question['options']))
+        projection['questions'] = questions
+        return projection
+    
+    @staticmethod
+    def get_projection(quiz):
+        key = QuizProjectionService._cache_key(quiz.id, quiz.updated_at)
+        projection = cache.get(key)
+        if projection is None:
+            projection = QuizProjectionService._build(quiz)
+            cache.set(key, projection, settings.QUIZ_PROJECTION_CACHE_TIMEOUT)
+        return projection
+    
+    @staticmethod
+    def for_student(quiz, student):
+        return QuizProjectionService._personalize(QuizProjectionService.get_projection(quiz), student)
+    
+    @staticmethod
+    def list_for_student(queryset, student):
+        versions = list(queryset.values_list('id', 'updated_at'))
+        keys = {quiz_id: QuizProjectionService._cache_key(quiz_id, updated_at) for quiz_id, updated_at in versions}
+        cached = cache.get_many(keys.values())
+        projections = {quiz_id: cached[key] for quiz_id, key in keys.items() if key in cached}
+        
+        missing_ids = [quiz_id for quiz_id in keys if quiz_id not in projections]
+        if missing_ids:
+            fresh = {}
+            # A quiz saved since the versions were read is built (and cached) at its newer version
+            for quiz in queryset.filter(id__in=missing_ids):
+                projections[quiz.id] = QuizProjectionService._build(quiz)
+                fresh[QuizProjectionService._cache_key(quiz.id, quiz.updated_at)] = projections[quiz.id]
+            cache.set_many(fresh, settings.QUIZ_PROJECTION_CACHE_TIMEOUT)
+        
+        return [
+            QuizProjectionService._personalize(projections[quiz_id], student)
+            for quiz_id, _ in versions
+            if quiz_id in projections
+        ]
+
+
+class ExamResultService:
+    SHEET_COLUMNS = ('register_number', 'marks_obtained', 'total_marks')
+    
+    @staticmethod
+    def parse_sheet(upload):
+        name = (upload.name or '').lower()
+        if name.endswith('.xlsx'):
+            try:
+                from openpyxl import load_workbook
+            except ImportError:
+                raise ValueError('Excel uploads require openpyxl; upload a CSV file instead')
+            sheet = load_workbook(upload, read_only=True, data_only=True).active
+            rows = sheet.iter_rows(values_only=True)
+            header = [str(cell or '').strip().lower() for cell in next(rows, [])]
+            return [
+                {key: value for key, value in zip(header, row) if key in ExamResultService.SHEET_COLUMNS}
+                for row in rows if any(cell not in (None, '') for cell in row)
+            ]
+        
+        try:
+            reader = csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig'))
+            reader.fieldnames = [field.strip().lower() for field in reader.fieldnames or []]
+            return [
+                {key: value for key, value in row.items() if key in ExamResultService.SHEET_COLUMNS}
+                for row in reader if any((value or '').strip() for value in row.values() if isinstance(value, str))
+            ]
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise ValueError(f'Could not read CSV file: {e}')
+    
+    @staticmethod
+    def _to_decimal(value):
+        try:
+            number = Decimal(str(value).strip())
+        except (InvalidOperation, TypeError):
+            return None
+        return number if number.is_finite() else None
+    
+    @staticmethod
+    def _field_errors(field_name, value):
+        # The column's max_digits/decimal_places, so the database never rejects the batch halfway
+        try:
+            ExamResult._meta.get_field(field_name).run_validators(value)
+        except ValidationError as e:
+            return [f'{field_name}: {message}' for message in e.messages]
+        return []
+    
+    @staticmethod
+    def bulk_upsert(subject, exam_name, exam_date, default_total_marks, rows, teacher, allow_partial=False):
+        errors = []
+        cleaned = {}
+        
+        for index, row in enumerate(rows, start=1):
+            row_errors = []
+            register_number = str(row.get('register_number') or '').strip()
+            marks = ExamResultService._to_decimal(row.get('marks_obtained'))
+            total = default_total_marks
+            if row.get('total_marks') not in (None, ''):
+                total = ExamResultService._to_decimal(row.get('total_marks'))
+            
+            if not register_number:
+                row_errors.append('register_number is required')
+            elif register_number in cleaned:
+                row_errors.append(f'Duplicate register_number (also on row {cleaned[register_number]["row"]})')
+            if total is None or total <= 0:
+                row_errors.append('total_marks must be a positive number')
+            else:
+                row_errors.extend(ExamResultService._field_errors('total_marks', total))
+            if marks is None:
+                row_errors.append('marks_obtained must be a number')
+            elif total is not None and not (0 <= marks <= total):
+                row_errors.append('marks_obtained must be between 0 and total_marks')
+            else:
+                row_errors.extend(ExamResultService._field_errors('marks_obtained', marks))
+            
+            if row_errors:
+                errors.append({'row': index, 'register_number': register_number, 'errors': row_errors})
+            else:
+                cleaned[register_number] = {'row': index, 'marks_obtained': marks, 'total_marks': total}
+        
+        students = dict(
+            Student.objects.filter(register_number__in=cleaned.keys()).values_list('register_number', 'id')
+        )
+        for register_number in [number for number in cleaned if number not in students]:
+            entry = cleaned.pop(register_number)
+            errors.append({'row': entry['row'], 'register_number': register_number, 'errors': ['Student not found']})
+        errors.sort(key=lambda error: error['row'])
+        
+        if errors and not allow_partial:
+            return {'status': 'invalid', 'created': 0, 'updated': 0, 'errors': errors}
+        
+        existing = {
+            result.student_id: result
+            for result in ExamResult.objects.filter(
+                subject=subject,
+                exam_name=exam_name,
+                exam_date=exam_date,
+                student_id__in=students.values()
+            )
         }
+        
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for register_number, entry in cleaned.items():
+            student_id = students[register_number]
+            result = existing.get(student_id)
+            if result is None:
+                to_create.append(ExamResult(
+                    student_id=student_id,
+                    subject=subject,
+                    exam_name=exam_name,
+                    exam_date=exam_date,
+                    marks_obtained=entry['marks_obtained'],
+                    total_marks=entry['total_marks'],
+                    teacher=teacher
+                ))
+            else:
+                result.marks_obtained = entry['marks_obtained']
+                result.total_marks = entry['total_marks']
+                result.teacher = teacher
+                result.updated_at = now
+                to_update.append(result)
+        
+        with transaction.atomic(using=current_database()):
+            ExamResult.objects.bulk_create(to_create, batch_size=500)
+            ExamResult.objects.bulk_update(
+                to_update, ['marks_obtained', 'total_marks', 'teacher', 'updated_at'], batch_size=500
+            )
+            # Bulk writes skip ExamResult.save, so the events are appended here
+            DomainEvent.objects.bulk_create([
+                DomainEvent(kind='exam_result_saved', branch_id=subject.branch_id, payload=result.event_payload())
+                for result in [*to_create, *to_update]
+            ], batch_size=500)
+        ExamRankingService.invalidate(subject.id)
+        
+        return {'status': 'success', 'created': len(to_create), 'updated': len(to_update), 'errors': errors}
+
+
+class ExamRankingService:
+    LEADERBOARD_SIZE = 10
+    
+    @staticmethod
+    def _version_key(subject_id):
+        return f"exam-ranking-version:{subject_id}"
+    
+    @staticmethod
+    def _cache_key(subject_id, exam_name):
+        version = cache.get_or_set(ExamRankingService._version_key(subject_id), 1, None)
+        digest = hashlib.sha1(exam_name.encode()).hexdigest()
+        return f"exam-ranking:{subject_id}:{version}:{digest}"
+    
+    @staticmethod
+    def invalidate(subject_id):
+        key = ExamRankingService._version_key(subject_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, None)
+    
+    @staticmethod
+    def _percentage():
+        return ExpressionWrapper(
+            Cast('marks_obtained', FloatField()) * Value(100.0) / Cast('total_marks', FloatField()),
+            output_field=FloatField()
+        )
+    
+    @staticmethod
+    def compute(subject, exam_name):
+        order = F('percentage').desc()
+        rows = (
+            ExamResult.objects
+            .filter(subject=subject, exam_name=exam_name, total_marks__gt=0)
+            .annotate(percentage=ExamRankingService._percentage())
+            .annotate(
+                rank=Window(expression=Rank(), order_by=order),
+                dense_rank=Window(expression=DenseRank(), order_by=order),
+                percent_rank=Window(expression=PercentRank(), order_by=order),
+            )
+            .order_by('rank', 'student__register_number')
+            .values(
+                'student_id', 'student__register_number', 'student__user__first_name',
+                'student__user__last_name', 'marks_obtained', 'total_marks', 'percentage',
+                'rank', 'dense_rank', 'percent_rank'
+            )
+        )
+        
+        ranking = [{
+            'student_id': row['student_id'],
+            'register_number': row['student__register_number'],
+            'student_name': f"{row['student__user__first_name']} {row['student__user__last_name']}".strip(),
+            'marks_obtained': float(row['marks_obtained']),
+            'total_marks': float(row['total_marks']),
+            'percentage': round(row['percentage'], 2),
+            'rank': row['rank'],
+            'dense_rank': row['dense_rank'],
+            'percentile': round((1 - row['percent_rank']) * 100, 2),
+        } for row in rows]
+        
+        grade_average = ExamResult.objects.filter(
+            subject__grade=subject.grade,
+            exam_name=exam_name,
+            total_marks__gt=0
+        ).aggregate(average=Avg(ExamRankingService._percentage()))['average']
+        
+        count = len(ranking)
+        return {
+            'subject': subject.id,
+            'subject_name': subject.name,
+            'grade': subject.grade,
+            'exam_name': exam_name,
+            'count': count,
+            'average_percentage': round(sum(row['percentage'] for row in ranking) / count, 2) if count else None,
+            'grade_average_percentage': round(grade_average, 2) if grade_average is not None else None,
+            'ranking': ranking,
+        }
+    
+    @staticmethod
+    def get_ranking(subject, exam_name):
+        key = ExamRankingService._cache_key(subject.id, exam_name)
+        ranking = cache.get(key)
+        if ranking is not None:
+            return ranking
+        
+        # Only one worker rebuilds a missing ranking; the rest briefly wait for its result.
+        lock_key = f"{key}:lock"
+        if cache.add(lock_key, 1, settings.EXAM_RANKING_LOCK_TIMEOUT):
+            try:
+                ranking = ExamRankingService.compute(subject, exam_name)
+                cache.set(key, ranking, settings.EXAM_RANKING_CACHE_TIMEOUT)
+            finally:
+                cache.delete(lock_key)
+            return ranking
+        
+        deadline = time.monotonic() + settings.EXAM_RANKING_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            ranking = cache.get(key)
+            if ranking is not None:
+                return ranking
+        return ExamRankingService.compute(subject, exam_name)
+    
+    @staticmethod
+    def for_student(ranking, student_id):
+        visible = ranking['ranking'][:ExamRankingService.LEADERBOARD_SIZE]
+        own = next((row for row in ranking['ranking'] if row['student_id'] == student_id), None)
+        return {**ranking, 'ranking': visible, 'my_result': own}
+
+
+class ReportCardService:
+    BATCH_SIZE = 50
+    
+    @staticmethod
+    def collect(job):
+        branch_filter = {'branch_id': job.branch_id} if job.branch_id else {}
+        students = list(
+            Student.objects.filter(grade=job.grade, **branch_filter)
+            .order_by('register_number')
+            .values('id', 'register_number', 'grade', 'user__first_name', 'user__last_name')
+        )
+        student_ids = [student['id'] for student in students]
+        
+        results = {}
+        for row in (
+            ExamResult.objects
+            .filter(student_id__in=student_ids, exam_date__range=(job.start_date, job.end_date))
+            .order_by('exam_date', 'subject__name')
+            .values('student_id', 'subject__name', 'exam_name', 'exam_date', 'marks_obtained', 'total_marks')
+        ):
+            results.setdefault(row['student_id'], []).append({
+                'subject': row['subject__name'],
+                'exam_name': row['exam_name'],
+                'exam_date': row['exam_date'].isoformat(),
+                'marks_obtained': float(row['marks_obtained']),
+                'total_marks': float(row['total_marks']),
+            })
+        
+        if ArchiveService.may_hold('attendance', job.start_date):
+            rows = ArchiveService.history('attendance', job.start_date, job.end_date, student_id__in=student_ids)
+            days_present = Counter(row['student_id'] for row in rows)
+            class_days = len({row['date'] for row in rows})
+        else:
+            attendance = Attendance.objects.filter(
+                student_id__in=student_ids,
+                date__range=(job.start_date, job.end_date)
+            )
+            days_present = dict(attendance.values('student_id').annotate(days=Count('id')).values_list('student_id', 'days'))
+            class_days = attendance.values('date').distinct().count()
+        
+        paid = set(
+            Payment.objects.filter(student_id__in=student_ids, month=job.month, year=job.year)
+            .values_list('student_id', 'subject_id')
+        )
+        subjects = {}
+        for student_id, subject_id, subject_name in (
+            StudentSubject.objects.filter(student_id__in=student_ids)
+            .order_by('subject__name')
+            .values_list('student_id', 'subject_id', 'subject__name')
+        ):
+            subjects.setdefault(student_id, []).append({
+                'name': subject_name,
+                'paid': (student_id, subject_id) in paid,
+            })
+        
+        payment_period = f"{job.month:02d}/{job.year}"
+        return [{
+            'register_number': student['register_number'],
+            'name': f"{student['user__first_name']} {student['user__last_name']}".strip(),
+            'grade': student['grade'],
+            'start_date': job.start_date.isoformat(),
+            'end_date': job.end_date.isoformat(),
+            'results': results.get(student['id'], []),
+            'days_present': days_present.get(student['id'], 0),
+            'class_days': class_days,
+            'subjects': subjects.get(student['id'], []),
+            'payment_period': payment_period,
+        } for student in students]
+    
+    @staticmethod
+    def _claimable():
+        stale = timezone.now() - timedelta(seconds=settings.REPORT_CARD_STALE_SECONDS)
+        return Q(status='pending') | Q(status='running', heartbeat_at__lt=stale)
+    
+    @staticmethod
+    def _claim(job_id):
+        # A running job whose heartbeat stopped lost its process; it is started over
+        return ReportCardJob.objects.filter(ReportCardService._claimable(), id=job_id).update(
+            status='running', processed=0, error='', heartbeat_at=timezone.now()
+        ) == 1
+    
+    @staticmethod
+    def generate(job):
+        """Render ``job`` if no other process holds it; returns the job, or None when it was not claimed."""
+        from .report_cards import render_batch
+        
+        if not ReportCardService._claim(job.id):
+            return None
+        job.refresh_from_db()
+        try:
+            with read_from_replica():
+                cards = ReportCardService.collect(job)
+            job.total = len(cards)
+            job.save(update_fields=['total'])
+            
+            batches = [
+                cards[i:i + ReportCardService.BATCH_SIZE]
+                for i in range(0, len(cards), ReportCardService.BATCH_SIZE)
+            ]
+            # Spooled through a file on disk so a large grade's archive is never held in memory
+            with tempfile.TemporaryFile() as spool:
+                with zipfile.ZipFile(spool, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    with ProcessPoolExecutor(
+                        max_workers=settings.REPORT_CARD_WORKERS,
+                        mp_context=multiprocessing.get_context('spawn')
+                    ) as pool:
+                        for documents in pool.map(render_batch, batches):
+                            for filename, content in documents:
+                                archive.writestr(filename, content)
+                            job.processed += len(documents)
+                            ReportCardJob.objects.filter(id=job.id).update(processed=job.processed,
+                                                                           heartbeat_at=timezone.now())
+                spool.seek(0)
+                job.archive.save(f'grade-{job.grade}-report-cards-{job.id}.zip', File(spool), save=False)
+            job.status = 'completed'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'archive', 'error', 'completed_at'])
+        return job
+    
+    @staticmethod
+    def run_queue():
+        """Render pending jobs, and running ones whose heartbeat stopped, in every branch database."""
+        processed = []
+        for alias in database_aliases():
+            with use_database(alias):
+                while True:
+                    job = ReportCardJob.objects.filter(ReportCardService._claimable()).order_by('created_at').first()
+                    if job is None:
+                        break
+                    job = ReportCardService.generate(job)
+                    if job is not None:
+                        processed.append((alias, job.id, job.status))
+        return processed
+    
+    @staticmethod
+    def start(job):
+        def run():
+            try:
+                ReportCardService.generate(job)
+            finally:
+                connections.close_all()
+        
+        threading.Thread(target=bind_to_current_branch(run), daemon=True).start()
+
+
+class NoteStorageService:
+    HASH_BLOCK_SIZE = 1024 * 1024
+    
+    @staticmethod
+    def _blob_name(sha256, filename):
+        extension = os.path.splitext(filename)[1].lower()
+        return f"notes/blobs/{sha256[:2]}/{sha256}{extension}"
+    
+    @staticmethod
+    def _hash(file_obj):
+        digest = hashlib.sha256()
+        size = 0
+        for block in iter(lambda: file_obj.read(NoteStorageService.HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+        file_obj.seek(0)
+        return digest.hexdigest(), size
+    
+    @staticmethod
+    def store_file(file_obj, filename, sha256=None, size=None):
+        if sha256 is None:
+            sha256, size = NoteStorageService._hash(file_obj)
+        
+        blob = NoteBlob.objects.filter(sha256=sha256).first()
+        if blob is not None:
+            return blob
+        
+        name = default_storage.save(NoteStorageService._blob_name(sha256, filename), File(file_obj))
+        try:
+            with transaction.atomic(using=current_database()):
+                return NoteBlob.objects.create(sha256=sha256, file=name, size=size)
+        except IntegrityError:
+            default_storage.delete(name)
+            return NoteBlob.objects.get(sha256=sha256)
+    
+    @staticmethod
+    def start_upload(user, filename, total_size, sha256=''):
+        return NoteUpload.objects.create(
+            uploaded_by=user,
+            filename=filename,
+            total_size=total_size,
+            sha256=sha256.lower()
+        )
+    
+    @staticmethod
+    def write_chunk(upload, offset, stream, length):
+        with transaction.atomic(using=current_database()):
+            upload = NoteUpload.objects.select_for_update().get(id=upload.id)
+            if upload.status != 'pending':
+                return {'status': 'completed', 'upload': upload}
+            if offset != upload.received_size:
+                return {'status': 'offset_mismatch', 'upload': upload}
+            if upload.received_size + length > upload.total_size:
+                return {'status': 'too_large', 'upload': upload}
+            
+            path = upload.temp_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            written = 0
+            with open(path, 'r+b' if path.exists() else 'wb') as part:
+                part.seek(offset)
+                while written < length:
+                    block = stream.read(min(NoteStorageService.HASH_BLOCK_SIZE, length - written))
+                    if not block:
+                        break
+                    part.write(block)
+                    written += len(block)
+                part.truncate()
+            
+            upload.received_size += written
+            upload.save(update_fields=['received_size', 'updated_at'])
+            return {'status': 'success' if written == length else 'incomplete', 'upload': upload}
+    
+    @staticmethod
+    def complete_upload(upload):
+        if upload.status == 'completed':
+            return {'status': 'success', 'blob': upload.blob}
+        if upload.received_size != upload.total_size:
+            return {'status': 'incomplete', 'message': f'Received {upload.received_size} of {upload.total_size} bytes'}
+        
+        path = upload.temp_path
+        with open(path, 'rb') as part:
+            sha256, size = NoteStorageService._hash(part)
+            if upload.sha256 and upload.sha256 != sha256:
+                return {'status': 'hash_mismatch', 'message': 'Uploaded content does not match the declared sha256'}
+            blob = NoteStorageService.store_file(part, upload.filename, sha256=sha256, size=size)
+        path.unlink(missing_ok=True)
+        
+        upload.sha256 = sha256
+        upload.blob = blob
+        upload.status = 'completed'
+        upload.save(update_fields=['sha256', 'blob', 'status', 'updated_at'])
+        return {'status': 'success', 'blob': blob}
+    
+    @staticmethod
+    def reclaim(grace_period=timedelta(hours=24)):
+        cutoff = timezone.now() - grace_period
+        
+        stale_uploads = NoteUpload.objects.filter(status='pending', updated_at__lt=cutoff)
+        for upload in stale_uploads:
+            upload.temp_path.unlink(missing_ok=True)
+        deleted_uploads = stale_uploads.delete()[0]
+        
+        # Blobs are only reclaimed after the grace period so a freshly completed upload
+        # has time to be attached to a note; an upload that deduplicated onto an old blob
+        # restarts that period.
+        orphans = (
+            NoteBlob.objects.filter(notes__isnull=True, created_at__lt=cutoff)
+            .exclude(noteupload__updated_at__gte=cutoff)
+        )
+        deleted_blobs = 0
+        reclaimed_bytes = 0
+        for blob in orphans:
+            try:
+                with transaction.atomic(using=current_database()):
+                    deleted = (
+                        NoteBlob.objects.filter(pk=blob.pk, notes__isnull=True)
+                        .exclude(noteupload__updated_at__gte=cutoff).delete()[1].get(NoteBlob._meta.label, 0)
+                    )
+            except ProtectedError:
+                continue
+            if not deleted:
+                continue
+            # The row goes first, so a note can never point at a file that is already gone
+            default_storage.delete(blob.file.name)
+            reclaimed_bytes += blob.size
+            deleted_blobs += 1
+        
+        return {'uploads': deleted_uploads, 'blobs': deleted_blobs, 'bytes': reclaimed_bytes}
+
+
+class NotePreviewService:
+    _executor = None
+    _executor_lock = threading.Lock()
+    
+    @staticmethod
+    def _get_executor():
+        with NotePreviewService._executor_lock:
+            if NotePreviewService._executor is None:
+                NotePreviewService._executor = ThreadPoolExecutor(
+                    max_workers=settings.NOTE_PREVIEW_WORKERS,
+                    thread_name_prefix='note-preview'
+                )
+            return NotePreviewService._executor
+    
+    @staticmethod
+    def enqueue(note_ids):
+        note_ids = list(
+            Note.objects.filter(id__in=list(note_ids)).exclude(file='').exclude(file__isnull=True)
+            .values_list('id', flat=True)
+        )
+        Note.objects.filter(id__in=note_ids).update(preview_status='pending')
+        executor = NotePreviewService._get_executor()
+        run = bind_to_current_branch(NotePreviewService._run)
+        return [executor.submit(run, note_id) for note_id in note_ids]
+    
+    @staticmethod
+    def _run(note_id):
+        try:
+            return NotePreviewService.process(note_id)
+        finally:
+            connections.close_all()
+    
+    @staticmethod
+    @contextmanager
+    def _local_path(field_file):
+        # Resolved before yielding, so a NotImplementedError raised by the caller's body is not swallowed
+        try:
+            path = field_file.path
+        except NotImplementedError:
+            path = None
+        if path is not None:
+            yield path
+            return
+        
+        suffix = os.path.splitext(field_file.name)[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix) as local_copy:
+            with field_file.open('rb') as source:
+                shutil.copyfileobj(source, local_copy)
+            local_copy.flush()
+            yield local_copy.name
+    
+    @staticmethod
+    def process(note_id):
+        from .note_previews import UnsupportedFile, extract
+        
+        if not Note.objects.filter(id=note_id, preview_status='pending').update(preview_status='processing'):
+            return None
+        note = Note.objects.select_related('blob').get(id=note_id)
+        
+        if note.blob_id:
+            source = (
+                Note.objects.filter(blob_id=note.blob_id, preview_status='ready')
+                .exclude(id=note.id)
+                .values('preview', 'page_count', 'extracted_text')
+                .first()
+            )
+            if source is not None:
+                Note.objects.filter(id=note.id).update(preview_status='ready', **source)
+                return 'ready'
+        
+        fields = {'preview_status': 'ready'}
+        try:
+            with NotePreviewService._local_path(note.file) as path:
+                result = extract(path, settings.NOTE_PREVIEW_MAX_TEXT_LENGTH)
+        except UnsupportedFile:
+            fields = {'preview_status': 'unsupported'}
+        except Exception:
+            fields = {'preview_status': 'failed'}
+        else:
+            fields['page_count'] = result['page_count']
+            fields['extracted_text'] = result['text']
+            if result['preview']:
+                if note.preview and not Note.objects.filter(preview=note.preview.name).exclude(id=note.id).exists():
+                    note.preview.delete(save=False)
+                key = note.blob.sha256 if note.blob_id else f'note-{note.id}'
+                note.preview.save(f'{key}.png', ContentFile(result['preview']), save=False)
+                fields['preview'] = note.preview.name
+        
+        # update() keeps updated_at untouched so download ETags stay valid.
+        Note.objects.filter(id=note.id).update(**fields)
+        return fields['preview_status']
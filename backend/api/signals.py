@@ -0,0 +1,95 @@
+from django.db.models.signals import post_init, post_save, post_delete, pre_save
+from django.db import transaction
+from django.dispatch import receiver
+from .authentication import revoke_user_tokens
+from .branches import clear_registry
+from .models import Branch, DomainEvent, ExamResult, Payment, Student, Subject, Teacher, User
+from .services import BillingService, ExamRankingService, ReferenceDataCache
+
+
+@receiver([post_save, post_delete], sender=Branch)
+def reload_branch_registry(sender, **kwargs):
+    # Other processes pick the change up within BRANCH_REGISTRY_TTL
+    clear_registry()
+
+
+@receiver([post_save, post_delete], sender=ExamResult)
+def invalidate_exam_ranking(sender, instance, **kwargs):
+    ExamRankingService.invalidate(instance.subject_id)
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def refresh_paid_flag(sender, instance, **kwargs):
+    BillingService.refresh_enrollment(instance.student_id, instance.subject_id)
+
+
+@receiver([post_save, post_delete], sender=Subject)
+@receiver([post_save, post_delete], sender=Teacher)
+def invalidate_reference_data(sender, using, **kwargs):
+    # After commit, so other processes cannot reload the pre-change rows under the new version
+    transaction.on_commit(ReferenceDataCache.invalidate, using=using)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_teacher_names(sender, instance, using, update_fields=None, **kwargs):
+    if instance.role != 'teacher':
+        return
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    transaction.on_commit(ReferenceDataCache.invalidate, using=using)
+
+
+@receiver(post_save, sender=Student)
+def log_student_saved(sender, instance, using, **kwargs):
+    # Feeds the kiosk roster delta; the roster is read fresh, so the payload only names the student
+    DomainEvent.record('student_saved', instance.branch_id, using=using, student_id=instance.id)
+
+
+@receiver(post_delete, sender=Student)
+def log_student_removed(sender, instance, using, **kwargs):
+    DomainEvent.record('student_removed', instance.branch_id, using=using, student_id=instance.id)
+
+
+@receiver(post_save, sender=User)
+def log_student_renamed(sender, instance, using, created, update_fields=None, **kwargs):
+    if created or instance.role != 'student':
+        return
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    student = Student.objects.using(using).filter(user_id=instance.pk).values_list('id', flat=True).first()
+    if student is not None:
+        DomainEvent.record('student_saved', instance.branch_id, using=using, student_id=student)
+
+
+CREDENTIAL_FIELDS = ('role', 'is_active', 'password')
+
+
+def _credentials(instance):
+    # Read from __dict__ so deferred fields (claims-built users) are not loaded just to be remembered
+    return {field: instance.__dict__[field] for field in CREDENTIAL_FIELDS if field in instance.__dict__}
+
+
+@receiver(post_init, sender=User)
+@receiver(post_save, sender=User)
+def remember_credentials(sender, instance, **kwargs):
+    instance._saved_credentials = _credentials(instance)
+
+
+@receiver(pre_save, sender=User)
+def revoke_tokens_on_credential_change(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(CREDENTIAL_FIELDS) & set(update_fields):
+        return
+    previous = getattr(instance, '_saved_credentials', {})
+    current = _credentials(instance)
+    unknown = [field for field in current if field not in previous]
+    if unknown:
+        previous = {**previous, **(User.objects.filter(pk=instance.pk).values(*unknown).first() or {})}
+    if any(field in previous and previous[field] != value for field, value in current.items()):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
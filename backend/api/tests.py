@@ -1,3 +1,1115 @@
-from django.test import TestCase
+import io
+import os
+import re
+import sqlite3
+import statistics
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, router, transaction
+from django.db.utils import ConnectionHandler
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from education_system.database import database_profile, replica_profile
+from PIL import Image
+from . import preload
+from .archive import ArchiveService
+from .authentication import tokens_for_user
+from .branches import clear_registry
+from .downloads import serve_public_media
+from .metrics import registry as metrics_registry
+from .replica import REPLICA_ALIAS, ReplicaStickinessMiddleware, is_sticky, read_from_replica
+from .events import DailyActivityConsumer, catch_up, lag, process_batch, replay
+from .fee_reminders import FeeReminderService
+from .models import (Branch, User, Student, Teacher, Subject, StudentSubject, Payment, Attendance, Note, Quiz, QuizAttempt,
+                     ExamResult, OTP, DailyActivity, DomainEvent, EventCheckpoint, MonthlySettlement, NoteBlob,
+                     NoteUpload, ReportCardJob)
+from .services import (AttendanceService, BillingService, ExamRankingService, ExamResultService, NotePreviewService,
+                       NoteStorageService, OTPService, PaymentService, QuizAnalyticsService, QuizProjectionService,
+                       ReferenceDataCache, ReportCardService, SettlementService)
+from .serializers import StudentQuizSerializer
 
-# Create your tests here.
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plan assertions use SQLite EXPLAIN QUERY PLAN output')
+class HotQueryPlanTests(TestCase):
+    FULL_SCAN_RE = re.compile(r'\bSCAN (\w+)\b(?! USING (?:COVERING )?INDEX)', re.IGNORECASE)
+    
+    @classmethod
+    def setUpTestData(cls):
+        teacher_user = User.objects.create(username='teacher', role='teacher')
+        cls.teacher = Teacher.objects.create(user=teacher_user)
+        cls.subjects = [
+            Subject.objects.create(name=f'Subject {i}', grade=str(6 + i % 3), teacher=cls.teacher, fee=1000)
+            for i in range(6)
+        ]
+        
+        # Register numbers and barcodes are set directly so seeding skips barcode rendering.
+        students = []
+        for i in range(30):
+            user = User.objects.create(username=f'student{i}', role='student')
+            students.append(Student(user=user, register_number=f'STU{i:06d}', barcode='barcodes/seed.png',
+                                    grade='6', parent_phone=f'0770000{i:03d}'))
+        cls.students = Student.objects.bulk_create(students)
+        cls.student = cls.students[0]
+        
+        today = date.today()
+        StudentSubject.objects.bulk_create([
+            StudentSubject(student=student, subject=subject, is_paid_current_month=i % 3 == 0)
+            for i, student in enumerate(cls.students) for subject in cls.subjects[:3]
+        ])
+        Payment.objects.bulk_create([
+            Payment(student=student, subject=subject, amount=1000, month=month, year=today.year)
+            for student in cls.students for subject in cls.subjects[:3] for month in range(1, 13)
+        ])
+        # Attendance.date is auto_now_add, so each day's batch is inserted for today and then moved back.
+        for days_ago in range(20, -1, -1):
+            Attendance.objects.bulk_create([Attendance(student=student) for student in cls.students])
+            if days_ago:
+                Attendance.objects.filter(date=today).update(date=today - timedelta(days=days_ago))
+        OTP.objects.bulk_create([
+            OTP(phone=student.parent_phone, register_number=student.register_number, otp_code='******')
+            for student in cls.students
+        ])
+        quiz = Quiz.objects.create(subject=cls.subjects[0], teacher=cls.teacher, title='Quiz', questions=[], total_marks=10)
+        QuizAttempt.objects.bulk_create([
+            QuizAttempt(quiz=quiz, student=student, answers={}, score=5) for student in cls.students
+        ])
+        ExamResult.objects.bulk_create([
+            ExamResult(student=student, subject=subject, exam_name='Term 1', marks_obtained=50, total_marks=100,
+                       exam_date=today, teacher=cls.teacher)
+            for student in cls.students for subject in cls.subjects[:3]
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        scans = self.FULL_SCAN_RE.findall(plan)
+        self.assertFalse(scans, f'Full table scan on {", ".join(scans)}:\n{plan}')
+    
+    def test_income_split_by_month(self):
+        today = date.today()
+        self.assertNoFullScan(Payment.objects.filter(month=today.month, year=today.year).values('amount'))
+    
+    def test_income_split_per_teacher(self):
+        today = date.today()
+        self.assertNoFullScan(
+            Payment.objects.filter(subject__teacher=self.teacher, month=today.month, year=today.year).values('amount')
+        )
+    
+    def test_duplicate_payment_check(self):
+        today = date.today()
+        self.assertNoFullScan(Payment.objects.filter(
+            student=self.student, subject=self.subjects[0], month=today.month, year=today.year
+        ))
+    
+    def test_paid_subject_entitlement(self):
+        today = date.today()
+        paid_subject_ids = Payment.objects.filter(
+            student=self.student, month=today.month, year=today.year
+        ).values_list('subject_id', flat=True).distinct()
+        self.assertNoFullScan(paid_subject_ids)
+        self.assertNoFullScan(Note.objects.filter(subject_id__in=paid_subject_ids))
+    
+    def test_paid_flag_entitlement(self):
+        paid_subject_ids = BillingService.paid_subject_ids(self.student)
+        self.assertNoFullScan(StudentSubject.objects.filter(
+            student=self.student, is_paid_current_month=True
+        ).values_list('subject_id', flat=True))
+        self.assertNoFullScan(Note.objects.filter(subject_id__in=paid_subject_ids))
+    
+    def test_paid_students_count(self):
+        paid_students = StudentSubject.objects.filter(is_paid_current_month=True).values('student').distinct()
+        self.assertIn('studentsubject_paid_idx', paid_students.explain())
+    
+    def test_todays_attendance(self):
+        self.assertNoFullScan(Attendance.objects.filter(date=date.today()))
+    
+    def test_latest_otp_for_register_number(self):
+        self.assertNoFullScan(
+            OTP.objects.filter(register_number=self.student.register_number, is_verified=False).order_by('-created_at')
+        )
+    
+    def test_student_exam_results(self):
+        self.assertNoFullScan(ExamResult.objects.filter(student__user=self.student.user))
+    
+    def test_exam_results_for_exam(self):
+        self.assertNoFullScan(ExamResult.objects.filter(subject=self.subjects[0], exam_name='Term 1'))
+    
+    def test_student_quiz_attempts(self):
+        self.assertNoFullScan(QuizAttempt.objects.filter(student=self.student).order_by('-attempted_at'))
+
+
+class BillingRolloverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subjects = [Subject.objects.create(name=f'Subject {i}', grade='6', fee=1000) for i in range(2)]
+        user = User.objects.create(username='student', role='student')
+        self.student = Student.objects.create(user=user, register_number='STU000001', barcode='barcodes/seed.png',
+                                              grade='6', parent_phone='0770000001')
+        self.enrollments = [StudentSubject.objects.create(student=self.student, subject=subject) for subject in self.subjects]
+    
+    def pay(self, subject, day):
+        Payment.objects.create(student=self.student, subject=subject, amount=1000, month=day.month, year=day.year)
+    
+    def flags(self):
+        return [enrollment.is_paid_current_month
+                for enrollment in StudentSubject.objects.filter(student=self.student).order_by('subject_id')]
+    
+    def test_rollover_resets_flags_at_month_boundary(self):
+        january, february = date(2026, 1, 15), date(2026, 2, 1)
+        self.pay(self.subjects[0], january)
+        StudentSubject.objects.filter(subject=self.subjects[0]).update(is_paid_current_month=True)
+        self.pay(self.subjects[1], february)
+        
+        self.assertFalse(BillingService.flags_current(february))
+        result = BillingService.rollover(today=february, batch_size=1)
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual((result['run'].marked_paid, result['run'].marked_unpaid), (1, 1))
+        self.assertEqual(self.flags(), [False, True])
+        self.assertTrue(BillingService.flags_current(february))
+        self.assertEqual(list(BillingService.paid_subject_ids(self.student, february)), [self.subjects[1].id])
+        self.assertEqual(BillingService.rollover(today=february)['status'], 'skipped')
+    
+    def test_consistency_check_finds_mismatches(self):
+        today = date.today()
+        self.pay(self.subjects[0], today)
+        StudentSubject.objects.filter(subject=self.subjects[0]).update(is_paid_current_month=False)
+        StudentSubject.objects.filter(subject=self.subjects[1]).update(is_paid_current_month=True)
+        
+        report = BillingService.check_consistency()
+        self.assertEqual((report['flagged_without_payment'], report['payment_without_flag']), (1, 1))
+        BillingService.rollover(force=True)
+        report = BillingService.check_consistency()
+        self.assertEqual((report['flagged_without_payment'], report['payment_without_flag']), (0, 0))
+    
+    def test_payment_changes_refresh_flag(self):
+        today = date.today()
+        self.pay(self.subjects[0], today)
+        self.assertEqual(self.flags(), [True, False])
+        Payment.objects.get(subject=self.subjects[0]).delete()
+        self.assertEqual(self.flags(), [False, False])
+
+
+class ExamResultTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(ReferenceDataCache.invalidate)
+        self.owner = User.objects.create_user(username='owner', password='x', role='owner')
+        self.teachers = [Teacher.objects.create(user=User.objects.create(username=f'teacher{i}', role='teacher'))
+                         for i in range(2)]
+        self.subject = Subject.objects.create(name='Maths', grade='6', fee=1000, teacher=self.teachers[0])
+        self.students = [
+            Student.objects.create(user=User.objects.create(username=f'student{i}', role='student'),
+                                   register_number=f'STU00000{i}', barcode='barcodes/seed.png', grade='6',
+                                   parent_phone='0770000001')
+            for i in range(3)
+        ]
+        ReferenceDataCache.invalidate()
+    
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(user).access_token}'}
+    
+    def test_single_results_keep_their_rules_and_bulk_marks_are_bounded(self):
+        single = {'student': self.students[0].id, 'subject': self.subject.id, 'exam_name': 'Term 1',
+                  'exam_date': '2026-03-01', 'marks_obtained': '40', 'total_marks': '50', 'teacher': self.teachers[1].id}
+        response = self.client.post('/api/exam-results/', single, content_type='application/json', **self.auth(self.owner))
+        self.assertEqual((response.status_code, response.json()['teacher']), (201, self.teachers[1].id))
+        
+        bulk = {'subject': self.subject.id, 'exam_name': 'Term 1', 'exam_date': '2026-03-01', 'total_marks': '50',
+                'allow_partial': True, 'results': [
+                    {'register_number': 'STU000000', 'marks_obtained': '45'},
+                    {'register_number': 'STU000001', 'marks_obtained': '1000', 'total_marks': '1000'},
+                    {'register_number': 'STU000002', 'marks_obtained': '12.345'},
+                ]}
+        result = self.client.post('/api/exam-results/bulk_upsert/', bulk, content_type='application/json',
+                                  **self.auth(self.teachers[0].user)).json()
+        self.assertEqual((result['status'], result['created'], result['updated']), ('success', 0, 1))
+        self.assertEqual([error['row'] for error in result['errors']], [2, 3])
+        self.assertTrue(all(message.startswith(('total_marks:', 'marks_obtained:'))
+                            for error in result['errors'] for message in error['errors']))
+        
+        rankings = self.client.get('/api/exam-results/rankings/?subject=maths&exam_name=Term+1', **self.auth(self.owner))
+        self.assertEqual(rankings.status_code, 400)
+    
+    def ranked(self):
+        ranking = ExamRankingService.get_ranking(self.subject, 'Term 1')
+        return [(row['register_number'], row['marks_obtained'], row['rank']) for row in ranking['ranking']]
+    
+    def test_rankings_are_invalidated_on_save_and_bulk_upsert(self):
+        result = ExamResult.objects.create(student=self.students[0], subject=self.subject, exam_name='Term 1',
+                                           exam_date=date(2026, 3, 1), marks_obtained=30, total_marks=50)
+        self.assertEqual(self.ranked(), [('STU000000', 30.0, 1)])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ranked(), [('STU000000', 30.0, 1)])
+        
+        result.marks_obtained = 20
+        result.save()
+        self.assertEqual(self.ranked(), [('STU000000', 20.0, 1)])
+        
+        outcome = ExamResultService.bulk_upsert(self.subject, 'Term 1', date(2026, 3, 1), Decimal('50'), [
+            {'register_number': 'STU000000', 'marks_obtained': '10'},
+            {'register_number': 'STU000001', 'marks_obtained': '40'},
+        ], self.teachers[0])
+        self.assertEqual((outcome['created'], outcome['updated']), (1, 1))
+        self.assertEqual(self.ranked(), [('STU000001', 40.0, 1), ('STU000000', 10.0, 2)])
+        
+        ExamResult.objects.get(student=self.students[1]).delete()
+        self.assertEqual(self.ranked(), [('STU000000', 10.0, 1)])
+
+
+@override_settings(REPLICA_STICKY_SECONDS=60)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: settings.DATABASES['default']}))
+        self.user = User.objects.create(username='owner', role='owner')
+    
+    def handle(self, view):
+        request = RequestFactory().get('/api/dashboard/')
+        request.user = self.user
+        return ReplicaStickinessMiddleware(view)(request)
+    
+    def test_reads_use_the_replica_until_the_caller_writes(self):
+        self.assertEqual(router.db_for_read(Student), 'default')
+        with read_from_replica(self.user):
+            self.assertEqual(router.db_for_read(Student), REPLICA_ALIAS)
+            self.assertEqual(router.db_for_write(Student), 'default')
+        self.assertEqual(router.db_for_read(Student), 'default')
+        
+        def read(request):
+            with read_from_replica(request.user):
+                return HttpResponse(router.db_for_read(Student))
+        
+        def write(request):
+            request.user.save(update_fields=['first_name'])
+            return HttpResponse()
+        
+        self.assertEqual(self.handle(read).content, REPLICA_ALIAS.encode())
+        self.assertFalse(is_sticky(self.user))
+        self.handle(write)
+        self.assertTrue(is_sticky(self.user))
+        self.assertEqual(self.handle(read).content, b'default')
+        
+        cache.clear()
+        self.assertEqual(self.handle(read).content, REPLICA_ALIAS.encode())
+        with mock.patch.dict(settings.DATABASES):
+            del settings.DATABASES[REPLICA_ALIAS]
+            self.assertEqual(self.handle(read).content, b'default')
+
+
+class ReferenceDataCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ReferenceDataCache.invalidate()
+        self.addCleanup(ReferenceDataCache.invalidate)
+        self.teacher = Teacher.objects.create(user=User.objects.create(username='teacher', first_name='Old',
+                                                                       role='teacher'))
+        self.subject = Subject.objects.create(name='Maths', grade='6', fee=1000, teacher=self.teacher)
+    
+    def test_changes_invalidate_after_commit(self):
+        self.assertEqual(ReferenceDataCache.subject_info(self.subject.id)['name'], 'Maths')
+        self.assertEqual(ReferenceDataCache.teacher_name(self.teacher.id), 'Old')
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.subject.name = 'Algebra'
+            self.subject.save()
+        # Before commit other readers keep the committed rows
+        self.assertEqual(ReferenceDataCache.subject_info(self.subject.id)['name'], 'Maths')
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(1):
+            self.assertEqual(ReferenceDataCache.subject_info(self.subject.id)['name'], 'Algebra')
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.teacher.user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.teacher.user.first_name = 'Rolled back'
+                self.teacher.user.save()
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(ReferenceDataCache.teacher_name(self.teacher.id), 'Old')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher.user.first_name = 'New'
+            self.teacher.user.save()
+        self.assertEqual(ReferenceDataCache.teacher_name(self.teacher.id), 'New')
+        self.assertEqual(ReferenceDataCache.subject(self.subject.id).teacher_name, 'New')
+
+
+class PreloadTests(TestCase):
+    def test_warm_up_does_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(preload.import_optional_modules(), len(settings.PRELOAD_MODULES))
+            self.assertGreater(preload.warm_url_resolvers(), 50)
+            self.assertGreater(preload.warm_serializers(), 20)
+            preload.warm_api_settings()
+
+class DatabaseProfileTests(SimpleTestCase):
+    def test_sqlite_connections_are_tuned_and_write_transactions_take_the_lock(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        name = os.path.join(directory, 'tuned.sqlite3')
+        with mock.patch.dict(os.environ, {'DB_ENGINE': 'sqlite', 'DB_NAME': name, 'DB_SQLITE_TIMEOUT': '7'}):
+            profile = database_profile(Path(directory))
+        wrapper = ConnectionHandler({'default': profile})['default']
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 7000)
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+        
+        wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        other = sqlite3.connect(name, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.rollback()
+        wrapper.set_autocommit(True)
+    
+    def test_postgresql_profiles_come_from_the_environment(self):
+        with mock.patch.dict(os.environ, {'DB_ENGINE': 'postgresql', 'DB_NAME': 'school', 'DB_HOST': 'primary',
+                                          'DB_POOLER': 'pgbouncer', 'DB_CONN_MAX_AGE': '0',
+                                          'DB_REPLICA_HOST': 'standby'}):
+            primary = database_profile(Path('/srv'))
+            replica = replica_profile(Path('/srv'))
+        self.assertEqual((primary['ENGINE'], primary['NAME'], primary['HOST']),
+                         ('django.db.backends.postgresql', 'school', 'primary'))
+        self.assertEqual((primary['CONN_MAX_AGE'], primary['DISABLE_SERVER_SIDE_CURSORS']), (0, True))
+        self.assertEqual((replica['ENGINE'], replica['HOST'], replica['TEST']),
+                         ('django.db.backends.postgresql', 'standby', {'MIRROR': 'default'}))
+        
+        with mock.patch.dict(os.environ, {'DB_ENGINE': 'sqlite', 'DB_SQLITE_TUNING': 'false'}):
+            self.assertEqual(database_profile(Path('/srv'))['OPTIONS'], {'timeout': 20})
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.addCleanup(metrics_registry.reset)
+    
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_requests_are_timed_and_scraped_with_the_token(self):
+        response = self.client.post('/api/auth/login/', {'username': 'nobody', 'password': 'x'},
+                                    content_type='application/json')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, total;dur=[\d.]+$')
+        
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        scrape = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(scrape.status_code, 200)
+        self.assertIn('http_requests_total{view="login",method="POST",status="401"} 1', scrape.content.decode())
+    
+    def test_disabled_without_a_token_outside_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class OTPTests(TestCase):
+    def setUp(self):
+        cache.clear()
+    
+    def test_wrong_guesses_lock_the_code(self):
+        code = OTPService.issue_otp('STU000001', '0770000001')
+        wrong = f"{(int(code) + 1) % 1000000:06d}"
+        for _ in range(settings.OTP_MAX_ATTEMPTS):
+            self.assertFalse(OTPService.verify_otp('STU000001', wrong))
+        self.assertFalse(OTPService.verify_otp('STU000001', code))
+        
+        code = OTPService.issue_otp('STU000001', '0770000001')
+        self.assertFalse(OTPService.verify_otp('STU000001', wrong))
+        self.assertTrue(OTPService.verify_otp('STU000001', code))
+        self.assertFalse(OTPService.verify_otp('STU000001', code))
+    
+    @override_settings(OTP_RATE_LIMIT_PER_PHONE=1)
+    def test_denied_requests_keep_the_register_quota(self):
+        self.assertIsNotNone(OTPService.issue_otp('STU000001', '0770000001'))
+        for _ in range(3):
+            self.assertIsNone(OTPService.issue_otp('STU000001', '0770000001'))
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            codes = list(pool.map(lambda i: OTPService.issue_otp('STU000001', f'07700001{i:02d}'), range(10)))
+        self.assertEqual(sum(code is not None for code in codes), settings.OTP_RATE_LIMIT_PER_REGISTER - 1)
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            self.owner = User.objects.create_user(username='owner', password='secret', role='owner')
+    
+    def login(self):
+        response = self.client.post('/api/auth/login/', {'username': 'owner', 'password': 'secret'},
+                                    content_type='application/json')
+        return response.json()
+    
+    def status_with(self, access):
+        return self.client.get('/api/fee-reminders/', HTTP_AUTHORIZATION=f'Bearer {access}').status_code
+    
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher',
+                                         'django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_credential_changes_revoke_earlier_tokens_only(self):
+        # Logging in rehashes the MD5 password, a credential save in the same second as the new token
+        tokens = self.login()
+        self.assertTrue(User.objects.get(pk=self.owner.pk).password.startswith('pbkdf2_'))
+        self.assertEqual(self.status_with(tokens['access']), 200)
+        
+        owner = User.objects.get(pk=self.owner.pk)
+        owner.first_name = 'Renamed'
+        with self.assertNumQueries(1):
+            owner.save()
+        self.assertEqual(self.status_with(tokens['access']), 200)
+        
+        owner.set_password('changed')
+        owner.save()
+        self.assertEqual(self.status_with(tokens['access']), 401)
+        refreshed = self.client.post('/api/auth/refresh/', {'refresh': tokens['refresh']}, content_type='application/json')
+        self.assertEqual(refreshed.status_code, 401)
+        self.assertEqual(self.status_with(tokens_for_user(owner).access_token), 200)
+
+
+def png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 20), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class NoteDownloadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.enterContext(override_settings(NOTE_UPLOAD_TEMP_DIR=media.name))
+        teacher = Teacher.objects.create(user=User.objects.create(username='teacher', role='teacher'))
+        subject = Subject.objects.create(name='Maths', grade='6', fee=1000, teacher=teacher)
+        self.students = [
+            Student.objects.create(user=User.objects.create(username=f'student{i}', role='student'),
+                                   register_number=f'STU00000{i}', barcode='barcodes/seed.png', grade='6',
+                                   parent_phone='0770000001')
+            for i in range(2)
+        ]
+        today = date.today()
+        Payment.objects.create(student=self.students[0], subject=subject, amount=1000, month=today.month, year=today.year)
+        self.note = Note.objects.create(subject=subject, teacher=teacher, title='Algebra')
+        self.note.file.save('algebra.txt', ContentFile(b'0123456789'), save=True)
+    
+    def get(self, student, path, **headers):
+        headers['HTTP_AUTHORIZATION'] = f'Bearer {tokens_for_user(student.user).access_token}'
+        return self.client.get(f'/api/notes/{self.note.id}/{path}', **headers)
+    
+    def test_download_is_entitlement_checked_and_conditional(self):
+        self.assertEqual(self.get(self.students[1], 'download/').status_code, 404)
+        response = self.get(self.students[0], 'download/')
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'0123456789'))
+        etag = response['ETag']
+        
+        partial = self.get(self.students[0], 'download/', HTTP_RANGE='bytes=2-4')
+        self.assertEqual((partial.status_code, partial['Content-Range']), (206, 'bytes 2-4/10'))
+        self.assertEqual(b''.join(partial.streaming_content), b'234')
+        self.assertEqual(self.get(self.students[0], 'download/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(self.students[0], 'download/', HTTP_IF_MATCH='"stale"').status_code, 412)
+        unsatisfiable = self.get(self.students[0], 'download/', HTTP_RANGE='bytes=20-')
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable['Content-Range']), (416, 'bytes */10'))
+        
+        detail = self.get(self.students[0], '').json()
+        self.assertNotIn('file', detail)
+        self.assertNotIn('blob', detail)
+        self.assertIsNone(detail['preview'])
+        request = RequestFactory().get('/media/')
+        for path in (self.note.file.name, f'barcodes/../{self.note.file.name}'):
+            with self.assertRaises(Http404):
+                serve_public_media(request, path, document_root=settings.MEDIA_ROOT)
+    
+    def test_notes_attach_only_the_requesters_uploads(self):
+        teachers = [self.note.teacher, Teacher.objects.create(user=User.objects.create(username='other', role='teacher'))]
+        subjects = [self.note.subject, Subject.objects.create(name='Science', grade='6', fee=1000, teacher=teachers[1])]
+        auth = [{'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(teacher.user).access_token}'} for teacher in teachers]
+        upload = self.client.post('/api/note-uploads/', {'filename': 'notes.txt', 'total_size': 5},
+                                  content_type='application/json', **auth[0]).json()
+        self.client.put(f"/api/note-uploads/{upload['id']}/chunk/?offset=0", b'hello',
+                        content_type='application/octet-stream', **auth[0])
+        self.assertEqual(self.client.post(f"/api/note-uploads/{upload['id']}/complete/", **auth[0]).status_code, 200)
+        
+        for index, expected in ((1, 400), (0, 201)):
+            payload = {'subject': subjects[index].id, 'teacher': teachers[index].id, 'title': 'Notes', 'upload': upload['id']}
+            response = self.client.post('/api/notes/', payload, content_type='application/json', **auth[index])
+            self.assertEqual(response.status_code, expected)
+        self.assertEqual(Note.objects.get(id=response.json()['id']).blob.sha256, NoteUpload.objects.get().sha256)
+    
+    def process(self, note):
+        Note.objects.filter(id=note.id).update(preview_status='pending')
+        return NotePreviewService.process(note.id)
+    
+    def note_with(self, filename, body):
+        note = Note.objects.create(subject=self.note.subject, teacher=self.note.teacher, title=filename)
+        note.file.save(filename, ContentFile(body), save=True)
+        return note
+    
+    def test_previews_are_processed_and_revalidated_by_content(self):
+        self.assertEqual(self.process(self.note), 'ready')
+        self.note.refresh_from_db()
+        self.assertEqual((self.note.extracted_text, self.note.preview.name), ('0123456789', ''))
+        self.assertEqual(self.process(self.note_with('data.xyz', b'?')), 'unsupported')
+        self.assertEqual(self.process(self.note_with('broken.png', b'not a png')), 'failed')
+        
+        self.note = self.note_with('diagram.png', png_bytes('red'))
+        self.assertEqual(self.process(self.note), 'ready')
+        first = self.get(self.students[0], 'preview/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.get(self.students[1], 'preview/').status_code, 404)
+        self.assertEqual(self.get(self.students[0], 'preview/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        
+        updated_at = Note.objects.get(id=self.note.id).updated_at
+        with self.note.file.open('wb') as diagram:
+            diagram.write(png_bytes('blue'))
+        self.assertEqual(self.process(self.note), 'ready')
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.updated_at, updated_at)
+        second = self.get(self.students[0], 'preview/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        
+        blob = NoteStorageService.store_file(ContentFile(png_bytes('green')), 'shared.png')
+        shared = [Note.objects.create(subject=self.note.subject, teacher=self.note.teacher, title='Shared', blob=blob,
+                                      file=blob.file.name) for _ in range(2)]
+        self.assertEqual(self.process(shared[0]), 'ready')
+        with mock.patch('api.note_previews.extract') as extract:
+            self.assertEqual(self.process(shared[1]), 'ready')
+        extract.assert_not_called()
+        previews = list(Note.objects.filter(blob=blob).values_list('preview', flat=True).distinct())
+        self.assertEqual(previews, [f'notes/previews/{blob.sha256}.png'])
+    
+    def test_reclaim_keeps_old_blobs_a_fresh_upload_deduplicated_onto(self):
+        blobs = [NoteStorageService.store_file(ContentFile(body), 'old.txt') for body in (b'hello', b'unused')]
+        NoteBlob.objects.update(created_at=timezone.now() - timedelta(days=2))
+        upload = NoteStorageService.start_upload(self.note.teacher.user, 'notes.txt', 5)
+        NoteStorageService.write_chunk(upload, 0, io.BytesIO(b'hello'), 5)
+        upload.refresh_from_db()
+        self.assertEqual(NoteStorageService.complete_upload(upload)['blob'], blobs[0])
+        
+        self.assertEqual(NoteStorageService.reclaim(), {'uploads': 0, 'blobs': 1, 'bytes': 6})
+        self.assertEqual(list(NoteBlob.objects.all()), [blobs[0]])
+        self.assertEqual(NoteUpload.objects.get().blob, blobs[0])
+        self.assertTrue(default_storage.exists(blobs[0].file.name))
+        self.assertFalse(default_storage.exists(blobs[1].file.name))
+
+
+@override_settings(TWILIO_ACCOUNT_SID='', FEE_REMINDER_RATE_PER_SECOND=1000, FEE_REMINDER_WORKERS=2)
+class FeeReminderCampaignTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subjects = [Subject.objects.create(name=f'Subject {i}', grade='6', fee=1000) for i in range(2)]
+        self.students = []
+        for i, phone in enumerate(['0770000001', '0770000001', '0770000002']):
+            user = User.objects.create(username=f'student{i}', first_name=f'Child{i}', role='student')
+            student = Student.objects.create(user=user, register_number=f'STU00000{i}', barcode='barcodes/seed.png',
+                                             grade='6', parent_phone=phone)
+            for subject in self.subjects:
+                StudentSubject.objects.create(student=student, subject=subject)
+            self.students.append(student)
+        today = date.today()
+        for subject in self.subjects:
+            Payment.objects.create(student=self.students[2], subject=subject, amount=1000, month=today.month, year=today.year)
+        Payment.objects.create(student=self.students[0], subject=self.subjects[0], amount=1000,
+                               month=today.month, year=today.year)
+    
+    def dispatch(self, campaign):
+        with redirect_stdout(io.StringIO()):
+            return FeeReminderService.dispatch(campaign.id)
+    
+    def test_recipients_grouped_per_parent_phone(self):
+        today = date.today()
+        campaign = FeeReminderService.create_campaign(today.month, today.year)
+        recipients = list(campaign.recipients.all())
+        self.assertEqual(campaign.total, 1)
+        self.assertEqual(recipients[0].parent_phone, '0770000001')
+        self.assertEqual(recipients[0].amount_due, 3000)
+        self.assertEqual(len(recipients[0].items), 3)
+        
+        self.assertEqual(self.dispatch(campaign), 'completed')
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent, campaign.failed), ('completed', 1, 0))
+        self.assertEqual(campaign.recipients.get().status, 'simulated')
+    
+    def test_interrupted_send_is_not_repeated_until_retried(self):
+        previous = date.today().replace(day=1) - timedelta(days=1)
+        campaign = FeeReminderService.create_campaign(previous.month, previous.year)
+        self.assertEqual(campaign.total, 2)
+        campaign.recipients.filter(parent_phone='0770000001').update(status='sending')
+        
+        self.assertEqual(self.dispatch(campaign), 'completed')
+        statuses = dict(campaign.recipients.values_list('parent_phone', 'status'))
+        self.assertEqual(statuses, {'0770000001': 'failed', '0770000002': 'simulated'})
+        self.assertFalse(FeeReminderService.pause(campaign))
+        
+        self.assertTrue(FeeReminderService.resume(campaign, retry_failed=True))
+        self.assertEqual(self.dispatch(campaign), 'completed')
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.sent, campaign.failed), (2, 0))
+        self.assertEqual(campaign.recipients.filter(status='simulated').count(), 2)
+
+
+@override_settings(TWILIO_ACCOUNT_SID='')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(ReferenceDataCache.invalidate)
+        self.enterContext(redirect_stdout(io.StringIO()))
+        owner = User.objects.create(username='owner', role='owner')
+        teacher = Teacher.objects.create(user=User.objects.create(username='teacher', role='teacher'))
+        self.subject = Subject.objects.create(name='Maths', grade='6', fee=1000, teacher=teacher)
+        self.student = Student.objects.create(user=User.objects.create(username='student', role='student'),
+                                              register_number='STU000001', barcode='barcodes/seed.png', grade='6',
+                                              parent_phone='0770000001')
+        StudentSubject.objects.create(student=self.student, subject=self.subject)
+        ReferenceDataCache.invalidate()
+        self.auth = {user.role: {'headers': {'Authorization': f'Bearer {tokens_for_user(user).access_token}'}}
+                     for user in (owner, teacher.user, self.student.user)}
+    
+    async def test_auth_role_and_method_are_checked(self):
+        path = f'/api/async/students/{self.student.id}/mark_attendance/'
+        self.assertEqual((await self.async_client.post(path)).status_code, 401)
+        self.assertEqual((await self.async_client.post(path, headers={'Authorization': 'Bearer junk'})).status_code, 401)
+        self.assertEqual((await self.async_client.post(path, **self.auth['student'])).status_code, 403)
+        self.assertEqual((await self.async_client.get(path, **self.auth['owner'])).status_code, 405)
+        self.assertFalse(await Attendance.objects.aexists())
+    
+    async def test_owner_marks_attendance_and_payment(self):
+        base = f'/api/async/students/{self.student.id}'
+        first = await self.async_client.post(f'{base}/mark_attendance/', **self.auth['owner'])
+        again = await self.async_client.post(f'{base}/mark_attendance/', **self.auth['owner'])
+        self.assertEqual(first.json()['message'], 'Attendance marked successfully and SMS sent')
+        self.assertEqual(again.json()['message'], 'Attendance already marked for today')
+        missing = await self.async_client.post('/api/async/students/0/mark_attendance/', **self.auth['owner'])
+        self.assertEqual(missing.status_code, 404)
+        
+        body = {'subject_id': self.subject.id}
+        paid = await self.async_client.post(f'{base}/mark_payment/', body, content_type='application/json',
+                                            **self.auth['owner'])
+        self.assertEqual((paid.status_code, paid.json()['payment']['amount']), (200, '1000.00'))
+        duplicate = await self.async_client.post(f'{base}/mark_payment/', body, content_type='application/json',
+                                                 **self.auth['owner'])
+        self.assertEqual(duplicate.status_code, 400)
+        unknown = await self.async_client.post(f'{base}/mark_payment/', {'subject_id': 0},
+                                               content_type='application/json', **self.auth['owner'])
+        self.assertEqual(unknown.status_code, 404)
+        
+        owner = await self.async_client.get('/api/async/dashboard/owner/', **self.auth['owner'])
+        self.assertEqual(owner.status_code, 200)
+        teacher = (await self.async_client.get('/api/async/dashboard/teacher/', **self.auth['teacher'])).json()
+        self.assertEqual((teacher['subjects_teaching'], teacher['enrolled_students']), (1, 1))
+        student = (await self.async_client.get('/api/async/dashboard/student/', **self.auth['student'])).json()
+        self.assertEqual((student['total_subjects'], student['paid_subjects']), (1, 1))
+
+class BranchScopingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        cache.clear()
+        clear_registry()
+        self.addCleanup(clear_registry)
+        self.addCleanup(ReferenceDataCache.invalidate)
+        self.north = Branch.objects.create(code='NTH', name='North')
+        self.south = Branch.objects.create(code='STH', name='South')
+        self.owner = User.objects.create_user(username='owner', password='x', role='owner')
+        self.manager = User.objects.create_user(username='manager', password='x', role='owner', branch=self.south)
+    
+    def auth(self, user, branch=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(user).access_token}'}
+        if branch:
+            headers['HTTP_X_BRANCH'] = branch
+        return headers
+    
+    def create_student(self, user, branch=None):
+        email = f'student{Student.objects.count()}@example.com'
+        payload = {'first_name': 'A', 'last_name': 'B', 'email': email, 'grade': '6', 'parent_phone': '0770000001'}
+        return self.client.post('/api/students/', payload, content_type='application/json', **self.auth(user, branch))
+    
+    def test_students_created_and_listed_per_branch(self):
+        self.assertEqual(self.create_student(self.owner).status_code, 400)
+        north = self.create_student(self.owner, 'nth').json()
+        south = self.create_student(self.manager).json()
+        self.assertTrue(Student.objects.get(id=north['id']).register_number.startswith('NTH-STU'))
+        self.assertEqual((north['branch'], south['branch']), (self.north.id, self.south.id))
+        
+        self.assertEqual(len(self.client.get('/api/students/', **self.auth(self.owner)).json()), 2)
+        listed = self.client.get('/api/students/', **self.auth(self.manager, 'NTH')).json()
+        self.assertEqual([student['id'] for student in listed], [south['id']])
+        
+        for user, branch in ((self.owner, None), (self.owner, 'NTH'), (self.manager, None)):
+            dashboard = self.client.get('/api/dashboard/owner/', **self.auth(user, branch)).json()
+            self.assertEqual(dashboard['total_students'], 1 if branch or user.branch_id else 2)
+        self.assertEqual(self.client.get('/api/branches/', **self.auth(self.manager)).status_code, 403)
+    
+    def test_subjects_without_branch_stay_unique(self):
+        Subject.objects.create(name='Maths', grade='6', fee=1000)
+        Subject.objects.create(name='Maths', grade='6', fee=1000, branch=self.north)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Subject.objects.create(name='Maths', grade='6', fee=1000)
+
+
+class EventLogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(name='Maths', grade='6', fee=1000)
+        self.owner = User.objects.create(username='owner', role='owner')
+        user = User.objects.create(username='student', role='student')
+        self.student = Student.objects.create(user=user, register_number='STU000001', barcode='barcodes/seed.png',
+                                              grade='6', parent_phone='0770000001')
+    
+    def test_changes_are_logged_and_consumed_incrementally(self):
+        consumer = DailyActivityConsumer()
+        consumer.batch_size = 2
+        today = date.today()
+        PaymentService.record_payment(self.student, self.subject, today.month, today.year)
+        PaymentService.record_payment(self.student, self.subject, today.month, today.year)
+        AttendanceService.mark(self.student, self.owner)
+        AttendanceService.mark(self.student, self.owner)
+        result = ExamResult.objects.create(student=self.student, subject=self.subject, exam_name='Term 1',
+                                           marks_obtained=50, total_marks=100, exam_date=today)
+        result.delete()
+        
+        self.assertEqual(list(DomainEvent.objects.order_by('id').values_list('kind', flat=True)),
+                         ['student_saved', 'payment_recorded', 'attendance_marked', 'exam_result_saved', 'exam_result_deleted'])
+        self.assertEqual(process_batch(consumer), 2)
+        self.assertEqual(lag(consumer), 3)
+        self.assertEqual(catch_up(consumer), 3)
+        
+        expected = {'payments': 1, 'income': 1000, 'attendance': 1, 'exam_results': 1}
+        self.assertEqual(DailyActivity.objects.values(*expected).get(), expected)
+        self.assertEqual(replay(consumer), 5)
+        self.assertEqual(DailyActivity.objects.values(*expected).get(), expected)
+        self.assertEqual(EventCheckpoint.objects.get(consumer='daily_activity').position, DomainEvent.objects.latest('id').id)
+
+
+class KioskSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='owner', role='owner')
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(self.owner).access_token}'}
+        self.students = []
+        for i in range(3):
+            user = User.objects.create(username=f'student{i}', first_name=f'Child{i}', role='student')
+            self.students.append(Student.objects.create(user=user, register_number=f'STU00000{i}',
+                                                        barcode='barcodes/seed.png', grade='6', parent_phone='0770000001'))
+    
+    def roster(self, since=None):
+        return self.client.get('/api/kiosk/roster/', {'since': since} if since else {}, **self.headers).json()
+    
+    def upload(self, scans):
+        return self.client.post('/api/kiosk/scans/', {'scans': scans}, content_type='application/json', **self.headers).json()
+    
+    def test_roster_delta_follows_student_changes(self):
+        full = self.roster()
+        self.assertTrue(full['full'])
+        self.assertEqual([row[1] for row in full['students']], ['STU000000', 'STU000001', 'STU000002'])
+        
+        caught_up = self.roster(full['token'])
+        self.students[0].user.last_name = 'Renamed'
+        self.students[0].user.save()
+        removed_id = self.students[1].id
+        self.students[1].delete()
+        delta = self.roster(caught_up['token'])
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['students'], [[self.students[0].id, 'STU000000', 'Child0 Renamed']])
+        self.assertEqual(delta['removed'], [removed_id])
+        self.assertEqual(self.roster(delta['token'])['students'], [])
+        self.assertTrue(self.roster('replica:1')['full'])
+    
+    def test_scans_are_applied_idempotently_at_scan_time(self):
+        yesterday = timezone.localtime() - timedelta(days=1)
+        first, second = yesterday.replace(hour=7, minute=50), yesterday.replace(hour=8, minute=5)
+        scans = [
+            {'scan_id': 'a', 'student_id': self.students[0].id, 'scanned_at': second.isoformat()},
+            {'scan_id': 'b', 'register_number': 'STU000000', 'scanned_at': first.isoformat()},
+            {'scan_id': 'c', 'student_id': self.students[1].id, 'scanned_at': first.isoformat()},
+            {'scan_id': 'd', 'register_number': 'STU999999', 'scanned_at': first.isoformat()},
+            {'scan_id': 'e', 'student_id': self.students[2].id, 'scanned_at': 'not a time'},
+        ]
+        result = self.upload(scans)
+        self.assertEqual([row['status'] for row in result['results']],
+                         ['already_marked', 'marked', 'marked', 'unknown_student', 'invalid'])
+        attendance = Attendance.objects.get(student=self.students[0])
+        self.assertEqual((attendance.date, attendance.time), (first.date(), first.time()))
+        
+        again = self.upload(scans)
+        self.assertEqual((again['marked'], again['already_marked']), (0, 3))
+        self.assertEqual(Attendance.objects.count(), 2)
+        self.assertEqual(DomainEvent.objects.filter(kind='attendance_marked').count(), 2)
+
+
+class QuizAnalyticsTests(TestCase):
+    ANSWERS = [
+        ({'1': 'a', '2': 'b', '3': ['x', 'y']}, 10),
+        ({'1': 'a', '2': 'c'}, 7),
+        ({'1': 'b', '2': 'b', '3': ['y', 'x']}, 5),
+        ({'2': 'b', '3': ['x', 'y']}, 6),
+        ({'1': 'c', '2': 'a', '3': 'x'}, 1),
+        ({'1': 'a', '2': 'b', '3': ['x', 'y']}, 9.5),
+    ]
+    
+    def setUp(self):
+        cache.clear()
+        subject = Subject.objects.create(name='Maths', grade='6', fee=1000)
+        teacher = Teacher.objects.create(user=User.objects.create(username='teacher', role='teacher'))
+        self.quiz = Quiz.objects.create(subject=subject, teacher=teacher, title='Quiz', total_marks=10, questions=[
+            {'id': 1, 'correct_answer': 'a'}, {'id': 2, 'correct_answer': 'b'}, {'id': 3, 'correct_answer': ['x', 'y']},
+        ])
+        self.students = [
+            Student.objects.create(user=User.objects.create(username=f'student{i}', role='student'),
+                                   register_number=f'STU00000{i}', barcode='barcodes/seed.png', grade='6',
+                                   parent_phone='0770000001')
+            for i in range(len(self.ANSWERS))
+        ]
+    
+    def test_incremental_updates_match_a_recompute(self):
+        with mock.patch.object(QuizAnalyticsService, 'recompute', wraps=QuizAnalyticsService.recompute) as recompute:
+            for student, (answers, score) in zip(self.students, self.ANSWERS):
+                attempt = QuizAttempt.objects.create(quiz=self.quiz, student=student, answers=answers, score=score)
+                QuizAnalyticsService.record_attempt(attempt)
+            incremental = QuizAnalyticsService.get_report(self.quiz)
+        # Only the first attempt, which creates the statistics row, goes through a recompute
+        self.assertEqual(recompute.call_count, 1)
+        recomputed = QuizAnalyticsService.get_report(self.quiz, recompute=True)
+        
+        scores = [float(score) for _, score in self.ANSWERS]
+        self.assertEqual(incremental['attempt_count'], len(scores))
+        self.assertAlmostEqual(incremental['mean_score'], statistics.fmean(scores))
+        self.assertAlmostEqual(incremental['std_dev'], statistics.pstdev(scores))
+        for moment in ('attempt_count', 'mean_score', 'std_dev'):
+            self.assertAlmostEqual(incremental[moment], recomputed[moment], msg=moment)
+        self.assertEqual(incremental['score_distribution'], recomputed['score_distribution'])
+        
+        for question, expected in zip(incremental['questions'], recomputed['questions']):
+            self.assertEqual(question['difficulty'], expected['difficulty'])
+            self.assertEqual(question['unanswered'], expected['unanswered'])
+            self.assertEqual(question['answer_frequencies'], expected['answer_frequencies'])
+            self.assertIsNotNone(question['discrimination'])
+            self.assertAlmostEqual(question['discrimination'], expected['discrimination'])
+        self.assertEqual(incremental['questions'][0]['difficulty'], 0.5)
+        self.assertEqual(incremental['questions'][2]['answer_frequencies'], {'["x", "y"]': 3, '["y", "x"]': 1, 'x': 1})
+
+
+class QuizProjectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        subject = Subject.objects.create(name='Maths', grade='6', fee=1000)
+        teacher = Teacher.objects.create(user=User.objects.create(username='teacher', role='teacher'))
+        questions = [
+            {'id': i, 'text': f'Question {i}', 'options': ['a', 'b', 'c'], 'correct_answer': 'a', 'answer': 'a',
+             'explanation': 'Because'}
+            for i in range(1, 6)
+        ]
+        self.quiz = Quiz.objects.create(subject=subject, teacher=teacher, title='Quiz', total_marks=5,
+                                        questions=questions, shuffle_questions=True, shuffle_options=True)
+        user = User.objects.create(username='student', role='student')
+        self.student = Student.objects.create(user=user, register_number='STU000001', barcode='barcodes/seed.png',
+                                              grade='6', parent_phone='0770000001')
+    
+    def assertNoAnswerKey(self, questions):
+        self.assertEqual(sorted(question['id'] for question in questions), [1, 2, 3, 4, 5])
+        for question in questions:
+            self.assertFalse(set(StudentQuizSerializer.ANSWER_KEY_FIELDS) & set(question))
+            self.assertEqual(sorted(question['options']), ['a', 'b', 'c'])
+    
+    def test_answer_key_is_stripped_from_cached_projections(self):
+        self.assertNoAnswerKey(StudentQuizSerializer(self.quiz).data['questions'])
+        self.assertIn('correct_answer', Quiz.objects.get(pk=self.quiz.pk).questions[0])
+        
+        first = QuizProjectionService.for_student(self.quiz, self.student)
+        with self.assertNumQueries(0):
+            second = QuizProjectionService.for_student(self.quiz, self.student)
+        self.assertEqual(first, second)
+        self.assertNoAnswerKey(second['questions'])
+        self.assertNotIn('_shuffle', second)
+        
+        cached = QuizProjectionService.get_projection(self.quiz)
+        self.assertNoAnswerKey(cached['questions'])
+        self.assertEqual(cached['_shuffle'], (True, True))
+        
+        self.quiz.questions[0]['text'] = 'Edited'
+        self.quiz.save()
+        listed = QuizProjectionService.list_for_student(Quiz.objects.all(), self.student)
+        self.assertEqual(len(listed), 1)
+        self.assertNoAnswerKey(listed[0]['questions'])
+        self.assertIn('Edited', [question['text'] for question in listed[0]['questions']])
+    
+    def test_quiz_saved_while_listing_is_not_dropped(self):
+        get_many = cache.get_many
+        
+        def save_then_read(keys):
+            Quiz.objects.filter(pk=self.quiz.pk).update(title='Renamed', updated_at=timezone.now() + timedelta(seconds=1))
+            return get_many(keys)
+        
+        with mock.patch.object(cache, 'get_many', side_effect=save_then_read):
+            listed = QuizProjectionService.list_for_student(Quiz.objects.all(), self.student)
+        self.assertEqual([quiz['title'] for quiz in listed], ['Renamed'])
+        self.assertEqual(QuizProjectionService.get_projection(Quiz.objects.get())['title'], 'Renamed')
+
+
+@override_settings(ARCHIVE_RETENTION_DAYS={'attendance': 365, 'otp': 90, 'quizattempt': 365})
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        user = User.objects.create(username='student', role='student')
+        self.student = Student.objects.create(user=user, register_number='STU000001', barcode='barcodes/seed.png',
+                                              grade='6', parent_phone='0770000001')
+        today = date.today()
+        self.days = [today - timedelta(days=offset) for offset in (800, 400, 370, 10)]
+        for day in self.days:
+            Attendance.objects.create(student=self.student, date=day)
+        
+        subject = Subject.objects.create(name='Maths', grade='6', fee=1000)
+        teacher = Teacher.objects.create(user=User.objects.create(username='teacher', role='teacher'))
+        self.quiz = Quiz.objects.create(subject=subject, teacher=teacher, title='Quiz', total_marks=10,
+                                        questions=[{'id': 1, 'correct_answer': 'a'}])
+        for score, age in ((10, 500), (0, 1)):
+            attempt = QuizAttempt.objects.create(quiz=self.quiz, student=self.student,
+                                                 answers={'1': 'a' if score else 'b'}, score=score)
+            QuizAttempt.objects.filter(pk=attempt.pk).update(
+                attempted_at=timezone.now().replace(microsecond=123456) - timedelta(days=age)
+            )
+        Quiz.objects.filter(pk=self.quiz.pk).update(created_at=timezone.now() - timedelta(days=600))
+        self.quiz.refresh_from_db()
+    
+    def test_archived_rows_are_still_answered(self):
+        result = ArchiveService.archive('attendance', batch_size=2)
+        self.assertEqual((result['rows'], result['segments']), (3, 3))
+        self.assertEqual(list(Attendance.objects.values_list('date', flat=True)), [self.days[-1]])
+        self.assertEqual(ArchiveService.archive('attendance')['rows'], 0)
+        
+        history = ArchiveService.history('attendance', self.days[1], date.today(), student_id__in=[self.student.id])
+        self.assertEqual(sorted(row['date'] for row in history), sorted(self.days[1:]))
+        job = ReportCardJob(grade='6', start_date=self.days[0], end_date=date.today(), month=1, year=2020)
+        self.assertEqual(ReportCardService.collect(job)[0]['days_present'], 4)
+        
+        attempted_at = QuizAttempt.objects.order_by('attempted_at').values_list('attempted_at', flat=True).first()
+        self.assertEqual(ArchiveService.archive('quizattempt')['rows'], 1)
+        stats = QuizAnalyticsService.recompute(self.quiz)
+        self.assertEqual((stats.attempt_count, stats.score_sum), (2, 10.0))
+        archived = next(ArchiveService.archived('quizattempt', quiz_id=self.quiz.id))
+        self.assertEqual(archived['attempted_at'], attempted_at)
+        self.assertEqual(attempted_at.microsecond, 123456)
+    
+    def test_recompute_skips_archives_older_than_the_quiz(self):
+        ArchiveService.archive('quizattempt')
+        Quiz.objects.filter(pk=self.quiz.pk).update(created_at=timezone.now() - timedelta(days=30))
+        self.quiz.refresh_from_db()
+        with mock.patch.object(ArchiveService, 'archived', wraps=ArchiveService.archived) as archived:
+            stats = QuizAnalyticsService.recompute(self.quiz)
+        archived.assert_not_called()
+        self.assertEqual(stats.attempt_count, 1)
+
+
+@override_settings(REPORT_CARD_WORKERS=1)
+class ReportCardJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        for i in range(3):
+            user = User.objects.create(username=f'student{i}', role='student')
+            Student.objects.create(user=user, register_number=f'STU00000{i}', barcode='barcodes/seed.png',
+                                   grade='6', parent_phone='0770000001')
+        self.job = ReportCardJob.objects.create(grade='6', start_date=date.today() - timedelta(days=30),
+                                                end_date=date.today(), month=date.today().month, year=date.today().year)
+    
+    def test_stale_running_job_is_restarted(self):
+        ReportCardJob.objects.filter(id=self.job.id).update(status='running', processed=2, heartbeat_at=timezone.now())
+        self.assertIsNone(ReportCardService.generate(self.job))
+        self.assertEqual(ReportCardService.run_queue(), [])
+        
+        stale = timezone.now() - timedelta(seconds=settings.REPORT_CARD_STALE_SECONDS + 1)
+        ReportCardJob.objects.filter(id=self.job.id).update(heartbeat_at=stale)
+        self.assertEqual(ReportCardService.run_queue(), [('default', self.job.id, 'completed')])
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.total, self.job.processed), (3, 3))
+        with self.job.archive.open('rb') as archive, zipfile.ZipFile(archive) as bundle:
+            self.assertEqual(len(bundle.namelist()), 3)
+
+
+@override_settings(TEACHER_INCOME_SHARE=Decimal('0.75'))
+class SettlementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(ReferenceDataCache.invalidate)
+        self.owner = User.objects.create_user(username='owner', password='x', role='owner')
+        user = User.objects.create_user(username='teacher', password='x', role='teacher', first_name='T')
+        self.teacher = Teacher.objects.create(user=user)
+        self.subjects = [Subject.objects.create(name=f'Subject {i}', grade='6', fee=1000, teacher=self.teacher)
+                         for i in range(2)]
+        self.previous = date.today().replace(day=1) - timedelta(days=1)
+        for i, amount in enumerate(['333.33', '0.50']):
+            user = User.objects.create(username=f'student{i}', role='student')
+            student = Student.objects.create(user=user, register_number=f'STU00000{i}', barcode='barcodes/seed.png',
+                                             grade='6', parent_phone='0770000001')
+            Payment.objects.create(student=student, subject=self.subjects[i], amount=Decimal(amount),
+                                   month=self.previous.month, year=self.previous.year)
+        ReferenceDataCache.invalidate()
+    
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(user).access_token}'}
+    
+    def test_closed_month_is_read_back_and_reconciled(self):
+        today = date.today()
+        with self.assertRaises(ValueError):
+            SettlementService.close_month(today.month, today.year)
+        
+        response = self.client.post('/api/settlements/close/', **self.auth(self.owner))
+        self.assertEqual(response.status_code, 201)
+        settlement = MonthlySettlement.objects.get()
+        self.assertEqual((settlement.total_collected, settlement.teacher_total, settlement.owner_total),
+                         (Decimal('333.83'), Decimal('250.38'), Decimal('83.45')))
+        self.assertEqual([line['teacher_share'] for line in settlement.subjects], ['250.00', '0.38'])
+        self.assertEqual(self.client.post('/api/settlements/close/', **self.auth(self.owner)).status_code, 200)
+        with self.assertRaises(ValueError):
+            settlement.save()
+        
+        with override_settings(TEACHER_INCOME_SHARE=Decimal('0.50')):
+            split = PaymentService.calculate_income_split(self.previous.month, self.previous.year)
+            income = self.client.get(f'/api/dashboard/teacher/income/?month={self.previous.month}&year={self.previous.year}',
+                                     **self.auth(self.teacher.user)).json()
+        self.assertTrue(split['settled'])
+        self.assertEqual(split['teacher_breakdown'][self.teacher.id]['teacher_share'], 250.38)
+        self.assertEqual((income['settled'], income['teacher_share'], len(income['subjects'])), (True, '250.38', 2))
+        
+        self.assertTrue(self.client.get(f'/api/settlements/{settlement.id}/reconcile/', **self.auth(self.owner)).json()['consistent'])
+        Payment.objects.filter(subject=self.subjects[1]).update(amount=Decimal('5.00'))
+        report = SettlementService.reconcile(settlement)
+        self.assertFalse(report['consistent'])
+        self.assertEqual(report['subjects'], [{
+            'subject_id': self.subjects[1].id, 'subject_name': 'Subject 1',
+            'closed': {'payments': 1, 'collected': '0.50'}, 'current': {'payments': 1, 'collected': '5.00'},
+        }])
+    
+    def test_teacher_reads_their_branch_statement_after_later_edits(self):
+        clear_registry()
+        self.addCleanup(clear_registry)
+        branch = Branch.objects.create(code='NTH', name='North')
+        User.objects.filter(pk=self.teacher.user_id).update(branch=branch)
+        Teacher.objects.filter(pk=self.teacher.pk).update(branch=branch)
+        Subject.objects.filter(teacher=self.teacher).update(branch=branch)
+        ReferenceDataCache.invalidate()
+        SettlementService.close_month(self.previous.month, self.previous.year, branch.id)
+        Payment.objects.filter(subject=self.subjects[0]).update(amount=Decimal('1000.00'))
+        
+        teacher = User.objects.get(pk=self.teacher.user_id)
+        income = self.client.get(f'/api/dashboard/teacher/income/?month={self.previous.month}&year={self.previous.year}',
+                                 **self.auth(teacher)).json()
+        self.assertEqual((income['settled'], income['total_collected'], income['teacher_share']),
+                         (True, '333.83', '250.38'))
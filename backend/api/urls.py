@@ -1,16 +1,21 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'students', views.StudentViewSet)
 router.register(r'teachers', views.TeacherViewSet)
 router.register(r'subjects', views.SubjectViewSet)
 router.register(r'notes', views.NoteViewSet)
+router.register(r'note-uploads', views.NoteUploadViewSet)
 router.register(r'videos', views.VideoViewSet)
 router.register(r'quizzes', views.QuizViewSet)
 router.register(r'exam-results', views.ExamResultViewSet)
+router.register(r'report-cards', views.ReportCardJobViewSet)
+router.register(r'fee-reminders', views.FeeReminderCampaignViewSet)
+router.register(r'branches', views.BranchViewSet)
+router.register(r'settlements', views.MonthlySettlementViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -19,6 +24,16 @@ urlpatterns = [
     path('auth/student/request-otp/', views.student_request_otp, name='student-request-otp'),
     path('auth/student/verify-otp/', views.student_verify_otp, name='student-verify-otp'),
     path('dashboard/owner/', views.owner_dashboard_stats, name='owner-dashboard'),
+    path('dashboard/owner/branches/', views.owner_branch_dashboard, name='owner-branch-dashboard'),
+    path('kiosk/roster/', views.kiosk_roster, name='kiosk-roster'),
+    path('kiosk/scans/', views.kiosk_scans, name='kiosk-scans'),
     path('dashboard/teacher/', views.teacher_dashboard_stats, name='teacher-dashboard'),
+    path('dashboard/teacher/income/', views.teacher_income, name='teacher-income'),
     path('dashboard/student/', views.student_dashboard_stats, name='student-dashboard'),
+    path('async/auth/student/request-otp/', async_views.student_request_otp, name='async-student-request-otp'),
+    path('async/students/<int:pk>/mark_attendance/', async_views.mark_attendance, name='async-student-mark-attendance'),
+    path('async/students/<int:pk>/mark_payment/', async_views.mark_payment, name='async-student-mark-payment'),
+    path('async/dashboard/owner/', async_views.owner_dashboard_stats, name='async-owner-dashboard'),
+    path('async/dashboard/teacher/', async_views.teacher_dashboard_stats, name='async-teacher-dashboard'),
+    path('async/dashboard/student/', async_views.student_dashboard_stats, name='async-student-dashboard'),
 ]
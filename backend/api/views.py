@@ -1,45 +1,67 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db import models
-from .models import User, Student, Teacher, Subject, StudentSubject, Payment, Attendance, Note, Video, Quiz, QuizAttempt, ExamResult
+from django.db import models, transaction
+from django.http import FileResponse, Http404
+from django.utils.text import slugify
+from .models import Branch, User, Student, Teacher, Subject, StudentSubject, Note, Video, Quiz, QuizAttempt, ExamResult, ReportCardJob, NoteUpload, FeeReminderCampaign, MonthlySettlement
 from .serializers import (UserSerializer, StudentSerializer, StudentCreateSerializer, 
                          TeacherSerializer, TeacherCreateSerializer, SubjectSerializer,
                          StudentSubjectSerializer, PaymentSerializer, AttendanceSerializer,
                          NoteSerializer, VideoSerializer, QuizSerializer, QuizAttemptSerializer,
-                         ExamResultSerializer)
-from .permissions import IsOwner, IsTeacher, IsStudent, IsOwnerOrTeacher
-from .services import SMSService, OTPService, PaymentService
-from datetime import date
+                         ExamResultSerializer, ExamResultBulkSerializer, ReportCardJobSerializer,
+                         NoteUploadSerializer, NoteListSerializer, FeeReminderCampaignSerializer,
+                         FeeReminderRecipientSerializer, BranchSerializer, MonthlySettlementSerializer,
+                         SettlementPeriodSerializer)
+from .permissions import IsOwner, IsTeacher, IsStudent, IsOwnerOrTeacher, IsOrganizationOwner
+from .authentication import tokens_for_user
+from .branches import (activate, branch_for_register_number, current_branch, current_database, get_branch,
+                       new_row_branch_id, registry)
+from .downloads import serve_protected_file
+from .fee_reminders import FeeReminderService
+from .kiosk import KioskService
+from .replica import replica_reads
+from .services import (SMSService, OTPService, PaymentService, QuizAnalyticsService, QuizProjectionService,
+                       ExamResultService, ExamRankingService, ReportCardService, NoteStorageService,
+                       NotePreviewService, ReferenceDataCache, BillingService, BranchService,
+                       AttendanceService, SettlementService)
+from datetime import date, timedelta
+import hashlib
+import os
 from decimal import Decimal
 
-class SubjectOwnershipMixin:
-    def validate_subject_ownership(self, subject_id):
-        if not subject_id:
-            raise ValidationError({'subject': 'Subject is required'})
-        
+def validate_subject_ownership(user, subject_id):
+    if not subject_id:
+        raise ValidationError({'subject': 'Subject is required'})
+    
+    subject = ReferenceDataCache.subject(subject_id)
+    branch = current_branch()
+    if subject is None or (branch is not None and subject.branch_id != branch['id']):
+        raise ValidationError({'subject': 'Subject not found'})
+    
+    if user.role == 'owner':
+        return subject
+    
+    if user.role == 'teacher':
         try:
-            subject = Subject.objects.get(id=subject_id)
-        except Subject.DoesNotExist:
-            raise ValidationError({'subject': 'Subject not found'})
-        
-        if self.request.user.role == 'owner':
+            teacher = user.teacher_profile
+            if subject.teacher_id != teacher.id:
+                raise PermissionDenied('You can only create content for your own subjects')
             return subject
-        
-        if self.request.user.role == 'teacher':
-            try:
-                teacher = self.request.user.teacher_profile
-                if subject.teacher != teacher:
-                    raise PermissionDenied('You can only create content for your own subjects')
-                return subject
-            except Teacher.DoesNotExist:
-                raise PermissionDenied('Teacher profile not found')
-        
-        raise PermissionDenied('Insufficient permissions')
+        except Teacher.DoesNotExist:
+            raise PermissionDenied('Teacher profile not found')
+    
+    raise PermissionDenied('Insufficient permissions')
+
+
+class SubjectOwnershipMixin:
+    def validate_subject_ownership(self, subject_id):
+        return validate_subject_ownership(self.request.user, subject_id)
     
     def perform_create(self, serializer):
         subject_id = self.request.data.get('subject')
@@ -65,10 +87,20 @@ def login_view(request):
     username = request.data.get('username')
     password = request.data.get('password')
     
+    # Staff of a branch on its own database name the branch; organisation owners sign in without one
+    branch = None
+    if request.data.get('branch'):
+        branch = get_branch(request.data['branch'])
+        if branch is None:
+            return Response({'error': 'Unknown branch'}, status=status.HTTP_400_BAD_REQUEST)
+        activate(branch)
+    
     user = authenticate(username=username, password=password)
+    if user is not None and branch is not None and user.branch_id != branch['id']:
+        user = None
     
     if user is not None:
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -82,6 +114,7 @@ def login_view(request):
 def student_request_otp(request):
     register_number = request.data.get('register_number')
     phone = request.data.get('phone')
+    activate(branch_for_register_number(register_number) or get_branch(request.data.get('branch')))
     
     try:
         student = Student.objects.get(register_number=register_number, parent_phone=phone)
@@ -99,11 +132,12 @@ def student_request_otp(request):
 def student_verify_otp(request):
     register_number = request.data.get('register_number')
     otp_code = request.data.get('otp_code')
+    activate(branch_for_register_number(register_number) or get_branch(request.data.get('branch')))
     
     if OTPService.verify_otp(register_number, otp_code):
         try:
             student = Student.objects.get(register_number=register_number)
-            refresh = RefreshToken.for_user(student.user)
+            refresh = tokens_for_user(student.user)
             
             return Response({
                 'refresh': str(refresh),
@@ -117,45 +151,52 @@ def student_verify_otp(request):
 
 @api_view(['GET'])
 @permission_classes([IsOwner])
+@replica_reads
 def owner_dashboard_stats(request):
-    total_students = Student.objects.count()
-    total_teachers = Teacher.objects.count()
-    
-    today = date.today()
-    todays_attendance = Attendance.objects.filter(date=today).count()
-    
-    current_month = today.month
-    students_paid_this_month = Payment.objects.filter(
-        month=current_month,
-        year=today.year
-    ).values('student').distinct().count()
-    
-    income_split = PaymentService.calculate_income_split(current_month, today.year)
-    
-    return Response({
-        'total_students': total_students,
-        'total_teachers': total_teachers,
-        'todays_attendance': todays_attendance,
-        'students_paid_this_month': students_paid_this_month,
-        **income_split
-    })
+    return Response(BranchService.dashboard_stats(current_branch()))
+
+@api_view(['GET'])
+@permission_classes([IsOwner])
+@replica_reads
+def owner_branch_dashboard(request):
+    branch = current_branch()
+    branches = [branch] if branch is not None else registry().values()
+    return Response(BranchService.aggregate_dashboard(branches))
+
+@api_view(['GET'])
+@permission_classes([IsOwner])
+def kiosk_roster(request):
+    return Response(KioskService.roster(request.query_params.get('since')))
+
+@api_view(['POST'])
+@permission_classes([IsOwner])
+def kiosk_scans(request):
+    scans = request.data.get('scans')
+    if not isinstance(scans, list) or not scans:
+        return Response({'error': 'scans must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(scans) > settings.KIOSK_SCAN_BATCH_LIMIT:
+        return Response({'error': f'At most {settings.KIOSK_SCAN_BATCH_LIMIT} scans per upload'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response(KioskService.apply_scans(scans, request.user))
 
 @api_view(['GET'])
 @permission_classes([IsTeacher])
+@replica_reads
 def teacher_dashboard_stats(request):
     try:
         teacher = request.user.teacher_profile
         today = date.today()
         current_month = today.month
         
-        my_subjects = Subject.objects.filter(teacher=teacher)
-        enrolled_students = StudentSubject.objects.filter(subject__in=my_subjects).count()
+        my_subjects = ReferenceDataCache.subjects_for_teacher(teacher.id)
+        enrolled_students = StudentSubject.objects.filter(subject_id__in=[subject.id for subject in my_subjects]).count()
         
-        my_income_data = PaymentService.calculate_income_split(current_month, today.year)
+        my_income_data = PaymentService.calculate_income_split(current_month, today.year,
+                                                              ReferenceDataCache.teacher_branch_id(teacher.id))
         teacher_breakdown = my_income_data.get('teacher_breakdown', {}).get(teacher.id, {})
         
         return Response({
-            'subjects_teaching': my_subjects.count(),
+            'subjects_teaching': len(my_subjects),
             'enrolled_students': enrolled_students,
             'monthly_income': teacher_breakdown.get('teacher_share', 0),
             'subjects': SubjectSerializer(my_subjects, many=True).data
@@ -163,23 +204,36 @@ def teacher_dashboard_stats(request):
     except Teacher.DoesNotExist:
         return Response({'error': 'Teacher profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['GET'])
+@permission_classes([IsTeacher])
+@replica_reads
+def teacher_income(request):
+    try:
+        teacher = request.user.teacher_profile
+    except Teacher.DoesNotExist:
+        return Response({'error': 'Teacher profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    period = SettlementPeriodSerializer(data=request.query_params)
+    period.is_valid(raise_exception=True)
+    today = date.today()
+    month = period.validated_data.get('month', today.month)
+    year = period.validated_data.get('year', today.year)
+    return Response(SettlementService.teacher_statement(teacher.id, month, year,
+                                                        ReferenceDataCache.teacher_branch_id(teacher.id)))
+
 @api_view(['GET'])
 @permission_classes([IsStudent])
 def student_dashboard_stats(request):
     try:
         student = request.user.student_profile
-        enrolled_subjects = StudentSubject.objects.filter(student=student)
-        
-        today = date.today()
-        current_month = today.month
-        current_year = today.year
-        
-        paid_subjects_count = sum(1 for es in enrolled_subjects if es.is_paid_for_month(current_month, current_year))
+        enrolled_subjects = list(StudentSubject.objects.filter(student=student))
+        paid_subject_ids = set(BillingService.paid_subject_ids(student))
+        paid_subjects_count = sum(1 for es in enrolled_subjects if es.subject_id in paid_subject_ids)
         
         return Response({
-            'total_subjects': enrolled_subjects.count(),
+            'total_subjects': len(enrolled_subjects),
             'paid_subjects': paid_subjects_count,
-            'unpaid_subjects': enrolled_subjects.count() - paid_subjects_count,
+            'unpaid_subjects': len(enrolled_subjects) - paid_subjects_count,
             'subjects': StudentSubjectSerializer(enrolled_subjects, many=True).data
         })
     except Student.DoesNotExist:
@@ -189,6 +243,7 @@ class StudentViewSet(viewsets.ModelViewSet):
     queryset = Student.objects.all()
     serializer_class = StudentSerializer
     permission_classes = [IsOwner]
+    branch_field = 'branch'
     
     def get_queryset(self):
         return Student.objects.all()
@@ -201,6 +256,7 @@ class StudentViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = StudentCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        branch_id = new_row_branch_id()
         
         user = User.objects.create_user(
             username=serializer.validated_data.get('username', serializer.validated_data['email']),
@@ -209,11 +265,13 @@ class StudentViewSet(viewsets.ModelViewSet):
             last_name=serializer.validated_data['last_name'],
             phone=serializer.validated_data.get('phone', ''),
             password=serializer.validated_data.get('password', 'student123'),
-            role='student'
+            role='student',
+            branch_id=branch_id
         )
         
         student = Student.objects.create(
             user=user,
+            branch_id=branch_id,
             grade=serializer.validated_data['grade'],
             parent_phone=serializer.validated_data['parent_phone'],
             address=serializer.validated_data.get('address', ''),
@@ -225,13 +283,7 @@ class StudentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def mark_attendance(self, request, pk=None):
         student = self.get_object()
-        today = date.today()
-        
-        attendance, created = Attendance.objects.get_or_create(
-            student=student,
-            date=today,
-            defaults={'marked_by': request.user}
-        )
+        attendance, created = AttendanceService.mark(student, request.user)
         
         if created:
             SMSService.send_attendance_sms(student)
@@ -243,31 +295,31 @@ class StudentViewSet(viewsets.ModelViewSet):
         student = self.get_object()
         subject_id = request.data.get('subject_id')
         
-        try:
-            subject = Subject.objects.get(id=subject_id)
-            today = date.today()
-            
-            result = PaymentService.mark_payment(
-                student, 
-                subject, 
-                today.month, 
-                today.year
-            )
-            
-            if result['status'] == 'duplicate':
-                return Response({'message': result['message']}, status=status.HTTP_400_BAD_REQUEST)
-            
-            return Response({
-                'message': 'Payment marked successfully and SMS sent',
-                'payment': PaymentSerializer(result['payment']).data
-            })
-        except Subject.DoesNotExist:
+        subject = ReferenceDataCache.subject(subject_id)
+        if subject is None or subject.branch_id != student.branch_id:
             return Response({'error': 'Subject not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        today = date.today()
+        result = PaymentService.mark_payment(
+            student, 
+            subject, 
+            today.month, 
+            today.year
+        )
+        
+        if result['status'] == 'duplicate':
+            return Response({'message': result['message']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'message': 'Payment marked successfully and SMS sent',
+            'payment': PaymentSerializer(result['payment']).data
+        })
 
 class TeacherViewSet(viewsets.ModelViewSet):
     queryset = Teacher.objects.all()
     serializer_class = TeacherSerializer
     permission_classes = [IsOwner]
+    branch_field = 'branch'
     
     def get_queryset(self):
         return Teacher.objects.all()
@@ -280,6 +332,7 @@ class TeacherViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = TeacherCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        branch_id = new_row_branch_id()
         
         user = User.objects.create_user(
             username=serializer.validated_data['username'],
@@ -288,11 +341,13 @@ class TeacherViewSet(viewsets.ModelViewSet):
             last_name=serializer.validated_data['last_name'],
             phone=serializer.validated_data.get('phone', ''),
             password=serializer.validated_data['password'],
-            role='teacher'
+            role='teacher',
+            branch_id=branch_id
         )
         
         teacher = Teacher.objects.create(
             user=user,
+            branch_id=branch_id,
             specialization=serializer.validated_data.get('specialization', '')
         )
         
@@ -302,6 +357,7 @@ class SubjectViewSet(viewsets.ModelViewSet):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
     permission_classes = [IsOwnerOrTeacher]
+    branch_field = 'branch'
     
     def get_queryset(self):
         if self.request.user.role == 'owner':
@@ -309,16 +365,39 @@ class SubjectViewSet(viewsets.ModelViewSet):
         elif self.request.user.role == 'teacher':
             return Subject.objects.filter(teacher__user=self.request.user)
         return Subject.objects.none()
+    
+    def perform_create(self, serializer):
+        serializer.save(branch_id=new_row_branch_id())
 
 class NoteViewSet(SubjectOwnershipMixin, viewsets.ModelViewSet):
     queryset = Note.objects.all()
     serializer_class = NoteSerializer
+    branch_field = 'subject__branch'
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'download', 'preview']:
             return [IsAuthenticated()]
         return [IsOwnerOrTeacher()]
     
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return NoteListSerializer
+        return NoteSerializer
+    
+    def _queue_preview(self, note):
+        transaction.on_commit(lambda: NotePreviewService.enqueue([note.id]), using=current_database())
+    
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        if serializer.instance.file:
+            self._queue_preview(serializer.instance)
+    
+    def perform_update(self, serializer):
+        file_changed = 'file' in serializer.validated_data or 'upload' in serializer.validated_data
+        super().perform_update(serializer)
+        if file_changed and serializer.instance.file:
+            self._queue_preview(serializer.instance)
+    
     def get_queryset(self):
         user = self.request.user
         if user.role == 'owner':
@@ -326,23 +405,91 @@ class NoteViewSet(SubjectOwnershipMixin, viewsets.ModelViewSet):
         elif user.role == 'teacher':
             return Note.objects.filter(teacher__user=user)
         elif user.role == 'student':
-            student = user.student_profile
-            today = date.today()
-            current_month = today.month
-            current_year = today.year
-            
-            paid_subject_ids = Payment.objects.filter(
-                student=student,
-                month=current_month,
-                year=current_year
-            ).values_list('subject_id', flat=True).distinct()
-            
+            paid_subject_ids = BillingService.paid_subject_ids(user.student_profile)
             return Note.objects.filter(subject_id__in=paid_subject_ids)
         return Note.objects.none()
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        note = self.get_object()
+        if not note.file:
+            raise Http404('This note has no file')
+        
+        extension = os.path.splitext(note.file.name)[1]
+        filename = f"{slugify(note.title) or 'note'}{extension}"
+        if note.blob_id:
+            etag = f'"{note.blob.sha256}"'
+        else:
+            etag = f'"{note.id}-{int(note.updated_at.timestamp())}"'
+        return serve_protected_file(request, note.file, filename, etag, note.updated_at)
+    
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        note = self.get_object()
+        if not note.preview:
+            raise Http404('This note has no preview')
+        
+        extension = os.path.splitext(note.preview.name)[1]
+        filename = f"{slugify(note.title) or 'note'}-preview{extension}"
+        # Previews are written with update(), so updated_at does not move when one is replaced
+        modified = note.preview.storage.get_modified_time(note.preview.name)
+        version = hashlib.sha256(f"{note.preview.name}:{modified.timestamp()}".encode()).hexdigest()[:16]
+        return serve_protected_file(request, note.preview, filename, f'"{note.id}-preview-{version}"', modified)
+
+class NoteUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    queryset = NoteUpload.objects.all()
+    serializer_class = NoteUploadSerializer
+    permission_classes = [IsOwnerOrTeacher]
+    
+    def get_queryset(self):
+        return NoteUpload.objects.filter(uploaded_by=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.instance = NoteStorageService.start_upload(
+            self.request.user,
+            serializer.validated_data['filename'],
+            serializer.validated_data['total_size'],
+            serializer.validated_data.get('sha256', '')
+        )
+    
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset', upload.received_size))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise ValidationError({'offset': 'offset and Content-Length must be integers'})
+        if length <= 0 or length > settings.NOTE_UPLOAD_MAX_CHUNK_SIZE:
+            raise ValidationError({'chunk': f'Chunk size must be between 1 and {settings.NOTE_UPLOAD_MAX_CHUNK_SIZE} bytes'})
+        
+        result = NoteStorageService.write_chunk(upload, offset, request.stream, length)
+        data = NoteUploadSerializer(result['upload']).data
+        if result['status'] == 'offset_mismatch':
+            return Response({'error': 'Offset does not match received size', **data}, status=status.HTTP_409_CONFLICT)
+        if result['status'] == 'too_large':
+            return Response({'error': 'Chunk exceeds declared file size', **data}, status=status.HTTP_400_BAD_REQUEST)
+        if result['status'] == 'incomplete':
+            return Response({'error': 'Chunk body was shorter than Content-Length', **data}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        upload = self.get_object()
+        result = NoteStorageService.complete_upload(upload)
+        if result['status'] != 'success':
+            return Response({'error': result['message']}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'upload': upload.id,
+            'blob': result['blob'].id,
+            'sha256': result['blob'].sha256,
+            'size': result['blob'].size,
+        })
 
 class VideoViewSet(SubjectOwnershipMixin, viewsets.ModelViewSet):
     queryset = Video.objects.all()
     serializer_class = VideoSerializer
+    branch_field = 'subject__branch'
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -356,27 +503,20 @@ class VideoViewSet(SubjectOwnershipMixin, viewsets.ModelViewSet):
         elif user.role == 'teacher':
             return Video.objects.filter(teacher__user=user)
         elif user.role == 'student':
-            student = user.student_profile
-            today = date.today()
-            current_month = today.month
-            current_year = today.year
-            
-            paid_subject_ids = Payment.objects.filter(
-                student=student,
-                month=current_month,
-                year=current_year
-            ).values_list('subject_id', flat=True).distinct()
-            
+            paid_subject_ids = BillingService.paid_subject_ids(user.student_profile)
             return Video.objects.filter(subject_id__in=paid_subject_ids)
         return Video.objects.none()
 
 class QuizViewSet(SubjectOwnershipMixin, viewsets.ModelViewSet):
     queryset = Quiz.objects.all()
     serializer_class = QuizSerializer
+    branch_field = 'subject__branch'
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [IsAuthenticated()]
+        if self.action == 'submit_attempt':
+            return [IsStudent()]
         return [IsOwnerOrTeacher()]
     
     def get_queryset(self):
@@ -386,20 +526,22 @@ class QuizViewSet(SubjectOwnershipMixin, viewsets.ModelViewSet):
         elif user.role == 'teacher':
             return Quiz.objects.filter(teacher__user=user)
         elif user.role == 'student':
-            student = user.student_profile
-            today = date.today()
-            current_month = today.month
-            current_year = today.year
-            
-            paid_subject_ids = Payment.objects.filter(
-                student=student,
-                month=current_month,
-                year=current_year
-            ).values_list('subject_id', flat=True).distinct()
-            
+            paid_subject_ids = BillingService.paid_subject_ids(user.student_profile)
             return Quiz.objects.filter(subject_id__in=paid_subject_ids)
         return Quiz.objects.none()
     
+    def list(self, request, *args, **kwargs):
+        if request.user.role == 'student':
+            queryset = self.filter_queryset(self.get_queryset())
+            return Response(QuizProjectionService.list_for_student(queryset, request.user.student_profile))
+        return super().list(request, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.role == 'student':
+            quiz = self.get_object()
+            return Response(QuizProjectionService.for_student(quiz, request.user.student_profile))
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=True, methods=['post'], permission_classes=[IsStudent])
     def submit_attempt(self, request, pk=None):
         quiz = self.get_object()
@@ -421,6 +563,7 @@ class QuizViewSet(SubjectOwnershipMixin, viewsets.ModelViewSet):
             answers=answers,
             score=Decimal(str(score))
         )
+        QuizAnalyticsService.record_attempt(attempt)
         
         return Response({
             'message': 'Quiz submitted successfully',
@@ -429,13 +572,20 @@ class QuizViewSet(SubjectOwnershipMixin, viewsets.ModelViewSet):
             'correct_answers': correct_count,
             'total_questions': total_questions
         })
+    
+    @action(detail=True, methods=['get'], permission_classes=[IsOwnerOrTeacher])
+    def analytics(self, request, pk=None):
+        quiz = self.get_object()
+        recompute = request.query_params.get('recompute', '').lower() in ('1', 'true')
+        return Response(QuizAnalyticsService.get_report(quiz, recompute=recompute))
 
 class ExamResultViewSet(viewsets.ModelViewSet):
     queryset = ExamResult.objects.all()
     serializer_class = ExamResultSerializer
+    branch_field = 'subject__branch'
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'rankings']:
             return [IsAuthenticated()]
         return [IsOwnerOrTeacher()]
     
@@ -448,3 +598,173 @@ class ExamResultViewSet(viewsets.ModelViewSet):
         elif user.role == 'student':
             return ExamResult.objects.filter(student__user=user)
         return ExamResult.objects.none()
+    
+    @action(detail=False, methods=['post'])
+    def bulk_upsert(self, request):
+        serializer = ExamResultBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        subject = validate_subject_ownership(request.user, data['subject'])
+        teacher = request.user.teacher_profile if request.user.role == 'teacher' else subject.teacher
+        
+        rows = data.get('results') or []
+        if data.get('file'):
+            try:
+                rows = ExamResultService.parse_sheet(data['file'])
+            except ValueError as e:
+                raise ValidationError({'file': str(e)})
+        
+        result = ExamResultService.bulk_upsert(
+            subject,
+            data['exam_name'],
+            data['exam_date'],
+            data['total_marks'],
+            rows,
+            teacher,
+            allow_partial=data['allow_partial']
+        )
+        
+        response_status = status.HTTP_400_BAD_REQUEST if result['status'] == 'invalid' else status.HTTP_200_OK
+        return Response(result, status=response_status)
+    
+    @action(detail=False, methods=['get'])
+    def rankings(self, request):
+        subject_id = request.query_params.get('subject')
+        exam_name = request.query_params.get('exam_name')
+        if not subject_id or not exam_name:
+            raise ValidationError({'detail': 'subject and exam_name are required'})
+        try:
+            subject_id = int(subject_id)
+        except ValueError:
+            raise ValidationError({'subject': 'subject must be an integer id'})
+        
+        user = request.user
+        if user.role == 'student':
+            student = user.student_profile
+            if not ExamResult.objects.filter(student=student, subject_id=subject_id, exam_name=exam_name).exists():
+                raise PermissionDenied('No result found for this exam')
+            subject = ReferenceDataCache.subject(subject_id)
+            return Response(ExamRankingService.for_student(ExamRankingService.get_ranking(subject, exam_name), student.id))
+        
+        subject = validate_subject_ownership(user, subject_id)
+        return Response(ExamRankingService.get_ranking(subject, exam_name))
+
+class ReportCardJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+                           viewsets.GenericViewSet):
+    queryset = ReportCardJob.objects.all().order_by('-created_at')
+    serializer_class = ReportCardJobSerializer
+    permission_classes = [IsOwner]
+    branch_field = 'branch'
+    
+    def perform_create(self, serializer):
+        branch = current_branch()
+        job = serializer.save(created_by=self.request.user, branch_id=branch['id'] if branch else None)
+        transaction.on_commit(lambda: ReportCardService.start(job), using=current_database())
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'completed' or not job.archive:
+            return Response({'error': 'Report cards are not ready yet'}, status=status.HTTP_409_CONFLICT)
+        return FileResponse(job.archive.open('rb'), as_attachment=True, filename=job.archive.name.split('/')[-1])
+
+
+class FeeReminderCampaignViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+                                 viewsets.GenericViewSet):
+    queryset = FeeReminderCampaign.objects.all().order_by('-created_at')
+    serializer_class = FeeReminderCampaignSerializer
+    permission_classes = [IsOwner]
+    branch_field = 'branch'
+    
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        branch = current_branch()
+        serializer.instance = FeeReminderService.create_campaign(data['month'], data['year'], self.request.user,
+                                                                 branch['id'] if branch else None)
+        transaction.on_commit(FeeReminderService.start, using=current_database())
+    
+    @action(detail=True, methods=['get'])
+    def recipients(self, request, pk=None):
+        recipients = self.get_object().recipients.order_by('id')
+        if request.query_params.get('status'):
+            recipients = recipients.filter(status=request.query_params['status'])
+        paginator = LimitOffsetPagination()
+        page = paginator.paginate_queryset(recipients, request, view=self)
+        return paginator.get_paginated_response(FeeReminderRecipientSerializer(page, many=True).data)
+    
+    def _transition(self, changed, message):
+        campaign = self.get_object()
+        if not changed(campaign):
+            return Response({'error': message}, status=status.HTTP_409_CONFLICT)
+        campaign.refresh_from_db()
+        return Response(self.get_serializer(campaign).data)
+    
+    @action(detail=True, methods=['post'])
+    def pause(self, request, pk=None):
+        return self._transition(FeeReminderService.pause, 'Only pending or running campaigns can be paused')
+    
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        return self._transition(FeeReminderService.cancel, 'Campaign is no longer active')
+    
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        retry_failed = str(request.data.get('retry_failed', '')).lower() in ('1', 'true')
+        return self._transition(lambda campaign: FeeReminderService.resume(campaign, retry_failed=retry_failed),
+                                'Only paused, completed or failed campaigns can be resumed')
+
+
+class MonthlySettlementViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    queryset = MonthlySettlement.objects.all().order_by('-year', '-month', 'branch_id')
+    serializer_class = MonthlySettlementSerializer
+    permission_classes = [IsOwner]
+    branch_field = 'branch'
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            period = SettlementPeriodSerializer(data=self.request.query_params)
+            period.is_valid(raise_exception=True)
+            queryset = queryset.filter(**period.validated_data)
+        return queryset
+    
+    @action(detail=False, methods=['post'])
+    def close(self, request):
+        period = SettlementPeriodSerializer(data=request.data)
+        period.is_valid(raise_exception=True)
+        month, year = period.validated_data.get('month'), period.validated_data.get('year')
+        if month is None:
+            first_of_month = date.today().replace(day=1)
+            previous = first_of_month - timedelta(days=1)
+            month, year = previous.month, previous.year
+        
+        branch = current_branch()
+        try:
+            settlement, created = SettlementService.close_month(month, year, branch['id'] if branch else None,
+                                                                closed_by=request.user)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(settlement).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    
+    @action(detail=True, methods=['get'])
+    def reconcile(self, request, pk=None):
+        return Response(SettlementService.reconcile(self.get_object()))
+
+
+class BranchViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin,
+                    mixins.ListModelMixin, viewsets.GenericViewSet):
+    queryset = Branch.objects.all().order_by('code')
+    serializer_class = BranchSerializer
+    permission_classes = [IsOrganizationOwner]
+    
+    def _sync(self, branch):
+        if branch.database:
+            BranchService.sync_database(branch.database)
+    
+    def perform_create(self, serializer):
+        self._sync(serializer.save())
+    
+    def perform_update(self, serializer):
+        self._sync(serializer.save())
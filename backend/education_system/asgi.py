@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'education_system.settings')
 
 application = get_asgi_application()
+
+if settings.PRELOAD_APP:
+    from api.preload import preload
+    preload()
@@ -0,0 +1,82 @@
+import os
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 134217728,
+}
+
+
+def _env(prefix, name, default=None):
+    # Replica settings fall back to the primary's DB_* values (user, password, tuning...).
+    return os.environ.get(f'{prefix}{name}', os.environ.get(f'DB_{name}', default))
+
+
+def _env_bool(prefix, name, default):
+    return str(_env(prefix, name, default)).lower() in ('1', 'true', 'yes')
+
+
+def database_profile(base_dir, prefix='DB_'):
+    """Build a DATABASES entry from environment variables starting with ``prefix``."""
+    engine = _env(prefix, 'ENGINE', 'sqlite').lower()
+    conn_max_age = int(_env(prefix, 'CONN_MAX_AGE', 60))
+    
+    if engine in ('postgres', 'postgresql'):
+        # Persistent connections are kept per worker; with DB_POOLER=pgbouncer the workers
+        # connect through PgBouncer in transaction mode, which cannot use server-side cursors.
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': _env(prefix, 'NAME', 'education_system'),
+            'USER': _env(prefix, 'USER', ''),
+            'PASSWORD': _env(prefix, 'PASSWORD', ''),
+            'HOST': _env(prefix, 'HOST', 'localhost'),
+            'PORT': _env(prefix, 'PORT', '5432'),
+            'CONN_MAX_AGE': conn_max_age,
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': _env(prefix, 'POOLER', '').lower() == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': int(_env(prefix, 'CONNECT_TIMEOUT', 5)),
+            },
+        }
+    
+    timeout = int(_env(prefix, 'SQLITE_TIMEOUT', 20))
+    options = {'timeout': timeout}
+    if _env_bool(prefix, 'SQLITE_TUNING', True):
+        options['pragmas'] = {**SQLITE_PRAGMAS, 'busy_timeout': timeout * 1000}
+        options['transaction_mode'] = 'IMMEDIATE'
+    
+    return {
+        'ENGINE': 'education_system.sqlite_backend',
+        'NAME': _env(prefix, 'NAME', str(base_dir / 'db.sqlite3')),
+        'CONN_MAX_AGE': conn_max_age,
+        'OPTIONS': options,
+    }
+
+
+def replica_profile(base_dir):
+    """Read replica entry configured by DB_REPLICA_* variables, or None when there is no replica."""
+    if not (os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST')):
+        return None
+    profile = database_profile(base_dir, prefix='DB_REPLICA_')
+    profile['TEST'] = {'MIRROR': 'default'}
+    return profile
+
+
+def branch_profiles(base_dir):
+    """DATABASES entries for branches placed on their own database.
+    
+    DB_BRANCHES=north,south adds aliases ``north`` and ``south`` configured by DB_BRANCH_NORTH_*
+    (falling back to DB_*). NAME never falls back, so a branch cannot share the primary's file.
+    """
+    profiles = {}
+    for alias in filter(None, (name.strip().lower() for name in os.environ.get('DB_BRANCHES', '').split(','))):
+        prefix = f'DB_BRANCH_{alias.upper()}_'
+        profile = database_profile(base_dir, prefix=prefix)
+        if profile['ENGINE'].endswith('sqlite_backend'):
+            profile['NAME'] = os.environ.get(f'{prefix}NAME', str(base_dir / f'db_{alias}.sqlite3'))
+        else:
+            profile['NAME'] = os.environ.get(f'{prefix}NAME', f'education_system_{alias}')
+        profiles[alias] = profile
+    return profiles
@@ -10,7 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
+from decimal import Decimal
 from pathlib import Path
+from .database import branch_profiles, database_profile, replica_profile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,12 +47,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
+    'api.branches.BranchMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.replica.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,13 +84,45 @@ WSGI_APPLICATION = 'education_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Configured from DB_* environment variables, see education_system/database.py
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_profile(BASE_DIR),
 }
 
+# Optional read replica for dashboards and reports, see api/replica.py
+if replica_profile(BASE_DIR):
+    DATABASES['replica'] = replica_profile(BASE_DIR)
+
+# Branches with their own database, see api/branches.py
+BRANCH_DATABASES = list(branch_profiles(BASE_DIR))
+DATABASES.update(branch_profiles(BASE_DIR))
+
+DATABASE_ROUTERS = ['api.branches.BranchRouter', 'api.replica.ReplicaRouter']
+
+# After a user writes, their reads stay on the primary for this many seconds
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+
+# Cache
+# A shared cache is required when running more than one worker process (OTPs, rate limits, rankings)
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_FUNCTION': 'api.branches.make_cache_key',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'KEY_FUNCTION': 'api.branches.make_cache_key',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -133,11 +171,14 @@ AUTH_USER_MODEL = 'api.User'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_FILTER_BACKENDS': (
+        'api.branches.BranchFilterBackend',
+    ),
 }
 
 # JWT Configuration
@@ -145,8 +186,12 @@ from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.ClaimsTokenRefreshSerializer',
 }
 
+# Build request.user from the role/profile claims in the access token instead of loading it
+JWT_CLAIMS_AUTH = os.environ.get('JWT_CLAIMS_AUTH', 'true').lower() == 'true'
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -156,7 +201,108 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 # Twilio Configuration (will be set via environment variables)
-import os
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', '')
 TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER', '')
+TWILIO_API_BASE_URL = os.environ.get('TWILIO_API_BASE_URL', 'https://api.twilio.com')
+SMS_TIMEOUT = float(os.environ.get('SMS_TIMEOUT', 10))
+
+# Student-facing quiz projections are keyed by Quiz.updated_at, so this only bounds memory use
+QUIZ_PROJECTION_CACHE_TIMEOUT = int(os.environ.get('QUIZ_PROJECTION_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# Exam rankings are invalidated whenever results change; the timeout is only a safety net
+EXAM_RANKING_CACHE_TIMEOUT = int(os.environ.get('EXAM_RANKING_CACHE_TIMEOUT', 60 * 60))
+EXAM_RANKING_LOCK_TIMEOUT = 10
+
+# Subject catalog / teacher directory: versioned entries in the shared cache plus a per-process LRU.
+# Processes re-check the version at most this often, so cross-process staleness is bounded by it.
+REFERENCE_CACHE_TIMEOUT = int(os.environ.get('REFERENCE_CACHE_TIMEOUT', 60 * 60 * 24))
+REFERENCE_CACHE_MAX_ENTRIES = int(os.environ.get('REFERENCE_CACHE_MAX_ENTRIES', 2048))
+REFERENCE_CACHE_VERSION_TTL = float(os.environ.get('REFERENCE_CACHE_VERSION_TTL', 1))
+
+# Once a month's billing rollover has completed this is remembered for the timeout; until then
+# "paid this month" reads fall back to Payment rows and re-check every minute.
+BILLING_ROLLOVER_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Worker processes used to render report cards
+REPORT_CARD_WORKERS = int(os.environ.get('REPORT_CARD_WORKERS', os.cpu_count() or 1))
+# A running job without progress for this long is picked up again by `manage.py generate_report_cards`
+REPORT_CARD_STALE_SECONDS = int(os.environ.get('REPORT_CARD_STALE_SECONDS', 10 * 60))
+
+# Chunked note uploads are assembled here before moving into content-addressed storage
+NOTE_UPLOAD_TEMP_DIR = os.environ.get('NOTE_UPLOAD_TEMP_DIR', str(BASE_DIR / 'upload_tmp'))
+NOTE_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+NOTE_UPLOAD_MAX_SIZE = int(os.environ.get('NOTE_UPLOAD_MAX_SIZE', 500 * 1024 * 1024))
+
+# Protected note downloads: set to 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (Apache) to let the
+# front server stream files from an internal location mapped to MEDIA_ROOT at the prefix below
+PROTECTED_MEDIA_ACCEL_HEADER = os.environ.get('PROTECTED_MEDIA_ACCEL_HEADER', '')
+PROTECTED_MEDIA_ACCEL_PREFIX = os.environ.get('PROTECTED_MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Never served by the DEBUG /media/ route (nor should a front server expose them publicly)
+PROTECTED_MEDIA_PREFIXES = ('notes/', 'report_cards/')
+
+# Background note preview pipeline
+NOTE_PREVIEW_WORKERS = int(os.environ.get('NOTE_PREVIEW_WORKERS', 2))
+NOTE_PREVIEW_MAX_TEXT_LENGTH = 100000
+
+# Student OTP login: codes live in the cache; the OTP table is only an optional audit log
+OTP_TTL = 10 * 60
+OTP_MAX_ATTEMPTS = 5
+OTP_RATE_LIMIT_WINDOW = 10 * 60
+OTP_RATE_LIMIT_PER_REGISTER = 3
+OTP_RATE_LIMIT_PER_PHONE = 5
+OTP_AUDIT_LOG = os.environ.get('OTP_AUDIT_LOG', 'false').lower() == 'true'
+
+# Request instrumentation: Server-Timing headers and Prometheus text at /metrics (per process).
+# Scrapers send METRICS_TOKEN as a bearer token; without one /metrics is only served with DEBUG on.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', 'true').lower() == 'true'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Queries at or above this duration are logged to the 'api.slow_queries' logger with their view
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+
+# Warm URL resolvers, serializer fields, DRF/JWT settings and the heavy optional imports when the
+# WSGI/ASGI module loads. Pair with `gunicorn --preload` so forked workers inherit the warm state.
+PRELOAD_APP = os.environ.get('PRELOAD_APP', 'false').lower() == 'true'
+PRELOAD_MODULES = ('twilio.rest', 'aiohttp', 'barcode.writer')
+
+# Fee reminder campaigns send through SMSService.send_sms at this many messages per second
+# (Twilio's default for a single long code is 1/s). Only one campaign sends at a time per
+# deployment; a campaign whose heartbeat is older than FEE_REMINDER_STALE_SECONDS is resumed
+# by the next `dispatch_fee_reminders` run.
+FEE_REMINDER_RATE_PER_SECOND = float(os.environ.get('FEE_REMINDER_RATE_PER_SECOND', 1))
+FEE_REMINDER_WORKERS = int(os.environ.get('FEE_REMINDER_WORKERS', 4))
+FEE_REMINDER_STALE_SECONDS = int(os.environ.get('FEE_REMINDER_STALE_SECONDS', 300))
+
+# Branch registry is read from the default database at most this often per process
+BRANCH_REGISTRY_TTL = int(os.environ.get('BRANCH_REGISTRY_TTL', 60))
+# Threads fanning the cross-branch owner dashboard out over branches
+BRANCH_DASHBOARD_WORKERS = int(os.environ.get('BRANCH_DASHBOARD_WORKERS', 4))
+
+# Consumers of the domain event log, run by `manage.py consume_events`
+EVENT_CONSUMERS = ['api.events.DailyActivityConsumer']
+EVENT_BATCH_SIZE = int(os.environ.get('EVENT_BATCH_SIZE', 500))
+# How long a consumer waits on a missing offset before treating it as rolled back
+EVENT_LOG_GAP_GRACE_SECONDS = int(os.environ.get('EVENT_LOG_GAP_GRACE_SECONDS', 10))
+
+# Offline attendance kiosk sync
+KIOSK_ROSTER_DELTA_LIMIT = int(os.environ.get('KIOSK_ROSTER_DELTA_LIMIT', 5000))
+KIOSK_SCAN_BATCH_LIMIT = int(os.environ.get('KIOSK_SCAN_BATCH_LIMIT', 1000))
+# Scans stamped further than this in the future are rejected as a bad kiosk clock
+KIOSK_CLOCK_SKEW_SECONDS = int(os.environ.get('KIOSK_CLOCK_SKEW_SECONDS', 300))
+
+# Cold-data archival (`manage.py archive_cold_data`): rows older than these many days move from
+# the hot tables to gzipped JSON Lines files under ARCHIVE_ROOT in default storage
+ARCHIVE_RETENTION_DAYS = {
+    'attendance': int(os.environ.get('ARCHIVE_ATTENDANCE_DAYS', 730)),
+    'otp': int(os.environ.get('ARCHIVE_OTP_DAYS', 90)),
+    'quizattempt': int(os.environ.get('ARCHIVE_QUIZ_ATTEMPT_DAYS', 730)),
+}
+ARCHIVE_ROOT = os.environ.get('ARCHIVE_ROOT', 'archives')
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 5000))
+ARCHIVE_LOCK_TIMEOUT = int(os.environ.get('ARCHIVE_LOCK_TIMEOUT', 60 * 60))
+
+# Teachers' share of the fees collected for their subjects; the rest is the owner's. Closed
+# months keep the ratio they were settled with (`manage.py close_month`)
+TEACHER_INCOME_SHARE = Decimal(os.environ.get('TEACHER_INCOME_SHARE', '0.80'))